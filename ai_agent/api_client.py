@@ -1,23 +1,97 @@
 """
-api_client.py  (v2 — AI Controller Edition)
-============================================
-HTTP client that talks exclusively to /api/ai/* on your .NET backend.
+api_client.py  (v4 — Pooled Transport Edition)
+==============================================
+Async HTTP client that talks exclusively to /api/ai/* on your .NET backend.
 All cart, order, address, and product calls go through the new AIChatController,
 which returns a consistent { success, message, data } wrapper.
+Every method is a coroutine (httpx.AsyncClient) so a slow Render response
+never blocks the uvicorn event loop.
+
+Transport:
+  - ONE process-wide httpx.AsyncClient with keep-alive pooling is shared by
+    every APIClient, so multi-tool turns reuse warm TCP/TLS connections.
+  - HTTP/2 is negotiated when the optional `h2` package is installed.
+  - A per-host semaphore caps concurrent requests to any single backend.
+  - APIClient itself is a thin per-user view that only carries the JWT header.
 To plug in a real base URL, set API_BASE_URL in your .env file.
 """
 
+import os
+import asyncio
 import logging
-import requests
+import httpx
 from typing import List, Dict, Any, Optional
+from urllib.parse import urlsplit
+
+from tracing import span, SPAN_KIND_CLIENT
 
 logger = logging.getLogger(__name__)
 
+# Pool configuration
+POOL_MAX_CONNECTIONS   = int(os.getenv("API_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE     = int(os.getenv("API_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY  = float(os.getenv("API_POOL_KEEPALIVE_EXPIRY", "60"))
+POOL_PER_HOST_LIMIT    = int(os.getenv("API_POOL_PER_HOST", "50"))
+HTTP2_ENABLED          = os.getenv("API_HTTP2", "true").lower() in ("1", "true", "yes")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Shared transport — created lazily on the running event loop
+# ─────────────────────────────────────────────────────────────────────────────
+_http_client: Optional[httpx.AsyncClient] = None
+_host_slots:  Dict[str, asyncio.Semaphore] = {}
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401  (optional dependency)
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled AsyncClient, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        http2 = _http2_available()
+        _http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+            ),
+        )
+        logger.info("HTTP pool ready: max=%d keepalive=%d per_host=%d http2=%s",
+                    POOL_MAX_CONNECTIONS, POOL_MAX_KEEPALIVE, POOL_PER_HOST_LIMIT, http2)
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared pool. Called from the FastAPI shutdown hook."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _host_slots.clear()
+
+
+def _host_slot(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = asyncio.Semaphore(POOL_PER_HOST_LIMIT)
+    return slot
+
 
 class APIClient:
     """
     Communicates with the .NET AIChatController on behalf of the agent.
-    Instantiated per-request with the user's JWT token.
+    Instantiated per-request with the user's JWT token — cheap, because the
+    connections themselves live in the shared pool (get_http_client()).
     All methods return:
         { 'success': bool, 'message': str, 'data': <payload> }
     """
@@ -32,12 +106,28 @@ class APIClient:
 
     # ── Internal HTTP Helpers ─────────────────────────────────────────────────
 
-    def _get(self, path: str, params: dict = None) -> Dict[str, Any]:
+    async def _request(self, method: str, url: str, timeout: float = None, **kwargs) -> httpx.Response:
+        """Send one request through the shared pool, respecting the per-host limit."""
+        parts = urlsplit(url)
+        with span(f"http {method}", kind=SPAN_KIND_CLIENT,
+                  **{"http.method": method, "url.path": parts.path,
+                     "server.address": parts.netloc}) as s:
+            async with _host_slot(url):
+                resp = await get_http_client().request(
+                    method, url,
+                    headers=self.headers,
+                    timeout=timeout or self.timeout,
+                    **kwargs
+                )
+            s.set(**{"http.status_code": resp.status_code})
+            return resp
+
+    async def _get(self, path: str, params: dict = None) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
         try:
-            resp = requests.get(url, params=params, headers=self.headers, timeout=self.timeout)
+            resp = await self._request("GET", url, params=params)
             logger.info(f"GET {path} → {resp.status_code}")
-            if not resp.ok:
+            if not resp.is_success:
                 logger.error(f"GET {path} FAILED {resp.status_code}: {resp.text[:500]}")
                 try:
                     err_body = resp.json()
@@ -47,24 +137,22 @@ class APIClient:
                     msg = resp.text[:300]
                 return {'success': False, 'message': f"[{resp.status_code}] {msg}", 'data': None}
             return resp.json()
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error(f"GET {path} TIMEOUT after {self.timeout}s")
             return {'success': False, 'message': f'Request timed out. Please try again.', 'data': None}
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"GET {path} ERROR: {e}")
             return {'success': False, 'message': str(e), 'data': None}
+        except ValueError as e:     # 2xx with a body that isn't JSON (proxy / HTML error page)
+            logger.error(f"GET {path} INVALID JSON: {e}")
+            return {'success': False, 'message': f'Invalid response from server: {e}', 'data': None}
 
-    def _post(self, path: str, payload: dict = None) -> Dict[str, Any]:
+    async def _post(self, path: str, payload: dict = None) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
         try:
-            resp = requests.post(
-                url,
-                json=payload or {},
-                headers=self.headers,
-                timeout=self.timeout
-            )
+            resp = await self._request("POST", url, json=payload or {})
             logger.info(f"POST {path} → {resp.status_code}")
-            if not resp.ok:
+            if not resp.is_success:
                 # Log full response body so we can see the .NET error message
                 logger.error(f"POST {path} FAILED {resp.status_code}: {resp.text[:500]}")
                 try:
@@ -77,24 +165,22 @@ class APIClient:
                     msg = resp.text[:300]
                 return {'success': False, 'message': f"[{resp.status_code}] {msg}", 'data': None}
             return resp.json()
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error(f"POST {path} TIMEOUT after {self.timeout}s")
             return {'success': False, 'message': f'Request timed out ({self.timeout}s). Please try again.', 'data': None}
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"POST {path} ERROR: {e}")
             return {'success': False, 'message': str(e), 'data': None}
+        except ValueError as e:     # 2xx with a body that isn't JSON (proxy / HTML error page)
+            logger.error(f"POST {path} INVALID JSON: {e}")
+            return {'success': False, 'message': f'Invalid response from server: {e}', 'data': None}
 
-    def _put(self, path: str, params: dict = None) -> Dict[str, Any]:
+    async def _put(self, path: str, params: dict = None) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
         try:
-            resp = requests.put(
-                url,
-                params=params,
-                headers=self.headers,
-                timeout=self.timeout
-            )
+            resp = await self._request("PUT", url, params=params)
             logger.info(f"PUT {path} → {resp.status_code}")
-            if not resp.ok:
+            if not resp.is_success:
                 logger.error(f"PUT {path} FAILED {resp.status_code}: {resp.text[:500]}")
                 try:
                     err_body = resp.json()
@@ -104,23 +190,22 @@ class APIClient:
                     msg = resp.text[:300]
                 return {'success': False, 'message': f"[{resp.status_code}] {msg}", 'data': None}
             return resp.json()
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error(f"PUT {path} TIMEOUT after {self.timeout}s")
             return {'success': False, 'message': f'Request timed out. Please try again.', 'data': None}
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"PUT {path} ERROR: {e}")
             return {'success': False, 'message': str(e), 'data': None}
+        except ValueError as e:     # 2xx with a body that isn't JSON (proxy / HTML error page)
+            logger.error(f"PUT {path} INVALID JSON: {e}")
+            return {'success': False, 'message': f'Invalid response from server: {e}', 'data': None}
 
-    def _delete(self, path: str) -> Dict[str, Any]:
+    async def _delete(self, path: str) -> Dict[str, Any]:
         url = f"{self.base_url}{path}"
         try:
-            resp = requests.delete(
-                url,
-                headers=self.headers,
-                timeout=self.timeout
-            )
+            resp = await self._request("DELETE", url)
             logger.info(f"DELETE {path} → {resp.status_code}")
-            if not resp.ok:
+            if not resp.is_success:
                 logger.error(f"DELETE {path} FAILED {resp.status_code}: {resp.text[:500]}")
                 try:
                     err_body = resp.json()
@@ -134,34 +219,31 @@ class APIClient:
             except:
                 # Some delete endpoints return no body, just status
                 return {'success': True, 'message': 'Deleted successfully', 'data': None}
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error(f"DELETE {path} TIMEOUT after {self.timeout}s")
             return {'success': False, 'message': f'Request timed out. Please try again.', 'data': None}
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"DELETE {path} ERROR: {e}")
             return {'success': False, 'message': str(e), 'data': None}
 
     # ── Context (session bootstrap) ───────────────────────────────────────────
 
-    def warmup(self) -> bool:
+    async def warmup(self) -> bool:
         """
         GET /ai/cart — lightweight ping to wake up Render.com free tier.
         Called once at agent startup so the first real user request is fast.
         Returns True if the server responded.
         """
         try:
-            resp = requests.get(
-                f"{self.base_url}/ai/cart",
-                headers=self.headers,
-                timeout=90   # allow full cold-start time
-            )
+            # allow full cold-start time; also opens the first pooled connection
+            resp = await self._request("GET", f"{self.base_url}/ai/cart", timeout=90)
             logger.info(f"🔥 Warmup ping → {resp.status_code}")
-            return resp.ok
+            return resp.is_success
         except Exception as e:
             logger.warning(f"🔥 Warmup ping failed (server may be starting): {e}")
             return False
 
-    def get_context(self) -> Dict[str, Any]:
+    async def get_context(self) -> Dict[str, Any]:
         """
         GET /ai/context
         Returns cart + addresses + recent orders + user info in one call.
@@ -174,11 +256,11 @@ class APIClient:
           recentOrders: [...]
         }
         """
-        return self._get('/ai/context')
+        return await self._get('/ai/context')
 
     # ── Products ──────────────────────────────────────────────────────────────
 
-    def search_products(
+    async def search_products(
         self,
         query: str,
         top_k: int = 5
@@ -190,16 +272,16 @@ class APIClient:
                                       description, imageUrl, stockQuantity,
                                       isAvailable, rating, reviewCount }
         """
-        return self._get('/ai/products/search', {'q': query, 'topK': top_k})
+        return await self._get('/ai/products/search', {'q': query, 'topK': top_k})
 
-    def get_product(self, product_id: str) -> Dict[str, Any]:
+    async def get_product(self, product_id: str) -> Dict[str, Any]:
         """
         GET /ai/products/{id}
         Full detail for a single product.
         """
-        return self._get(f'/ai/products/{product_id}')
+        return await self._get(f'/ai/products/{product_id}')
 
-    def compare_products(self, product_ids: List[str]) -> Dict[str, Any]:
+    async def compare_products(self, product_ids: List[str]) -> Dict[str, Any]:
         """
         POST /ai/products/compare
         Body: { productIds: ['id1', 'id2', ...] }
@@ -209,57 +291,57 @@ class APIClient:
         }
         The highlights list is ready to paste into the chat response verbatim.
         """
-        return self._post('/ai/products/compare', {'productIds': product_ids})
+        return await self._post('/ai/products/compare', {'productIds': product_ids})
 
     # ── Cart ──────────────────────────────────────────────────────────────────
 
-    def get_cart(self) -> Dict[str, Any]:
+    async def get_cart(self) -> Dict[str, Any]:
         """
         GET /ai/cart
         data: { cartId, items, total, totalItems, isEmpty }
         """
-        return self._get('/ai/cart')
+        return await self._get('/ai/cart')
 
-    def add_to_cart(self, product_id: str, quantity: int = 1) -> Dict[str, Any]:
+    async def add_to_cart(self, product_id: str, quantity: int = 1) -> Dict[str, Any]:
         """
         POST /ai/cart/add
         Body: { productId, quantity }
         data: updated cart
         """
-        return self._post('/ai/cart/add', {'productId': product_id, 'quantity': quantity})
+        return await self._post('/ai/cart/add', {'productId': product_id, 'quantity': quantity})
 
-    def update_cart_item(self, product_id: str, quantity: int) -> Dict[str, Any]:
+    async def update_cart_item(self, product_id: str, quantity: int) -> Dict[str, Any]:
         """
         PUT /ai/cart/update/{productId}?qty={quantity}
         data: updated cart
         """
-        return self._put(f'/ai/cart/update/{product_id}', params={'qty': quantity})
+        return await self._put(f'/ai/cart/update/{product_id}', params={'qty': quantity})
 
-    def remove_from_cart(self, product_id: str) -> Dict[str, Any]:
+    async def remove_from_cart(self, product_id: str) -> Dict[str, Any]:
         """
         DELETE /ai/cart/remove/{productId}
         data: updated cart
         """
-        return self._delete(f'/ai/cart/remove/{product_id}')
+        return await self._delete(f'/ai/cart/remove/{product_id}')
 
-    def clear_cart(self) -> Dict[str, Any]:
+    async def clear_cart(self) -> Dict[str, Any]:
         """DELETE /ai/cart/clear"""
-        return self._delete('/ai/cart/clear')
+        return await self._delete('/ai/cart/clear')
 
     # ── Orders ────────────────────────────────────────────────────────────────
 
-    def get_orders(self) -> Dict[str, Any]:
+    async def get_orders(self) -> Dict[str, Any]:
         """
         GET /ai/orders
         data: list of orders with items, newest first
         """
-        return self._get('/ai/orders')
+        return await self._get('/ai/orders')
 
-    def get_order(self, order_id: str) -> Dict[str, Any]:
+    async def get_order(self, order_id: str) -> Dict[str, Any]:
         """GET /ai/orders/{orderId}"""
-        return self._get(f'/ai/orders/{order_id}')
+        return await self._get(f'/ai/orders/{order_id}')
 
-    def place_order(self, shipping_address_id: Optional[str] = None) -> Dict[str, Any]:
+    async def place_order(self, shipping_address_id: Optional[str] = None) -> Dict[str, Any]:
         """
         POST /ai/orders/place
         IMPORTANT: Do NOT retry this call — CreateOrderAsync is not idempotent.
@@ -272,10 +354,10 @@ class APIClient:
         url = f"{self.base_url}/ai/orders/place"
         logger.info(f"place_order → {url} | address={shipping_address_id}")
         try:
-            resp = requests.post(url, json=payload, headers=self.headers, timeout=90)
+            resp = await self._request("POST", url, timeout=90, json=payload)
             logger.info(f"POST /ai/orders/place → {resp.status_code}")
 
-            if not resp.ok:
+            if not resp.is_success:
                 logger.error(f"POST /ai/orders/place FAILED {resp.status_code}: {resp.text[:300]}")
 
                 # 5xx / 520 — Render crashed or restarted.
@@ -305,7 +387,7 @@ class APIClient:
 
             return resp.json()
 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             logger.error("place_order TIMED OUT after 90s — order may have been placed on server")
             # Do NOT retry — the order may have been created even though we timed out.
             # Tell user to check their Orders page.
@@ -318,27 +400,36 @@ class APIClient:
                 'data': {'orderNumber': 'Check Orders page', 'status': 'Processing'}
             }
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"place_order ERROR: {e}")
             return {'success': False, 'message': str(e), 'data': None}
 
+        except ValueError as e:
+            # 2xx without a JSON body: the order was most likely created — never invite a retry
+            logger.error(f"place_order INVALID JSON on success status: {e}")
+            return {
+                'success': True,
+                'message': 'Order submitted but server response was unclear. Check Orders page.',
+                'data': {'orderNumber': 'Check Orders page', 'status': 'Processing'}
+            }
+
 
-    def cancel_order(self, order_id: str) -> Dict[str, Any]:
+    async def cancel_order(self, order_id: str) -> Dict[str, Any]:
         """POST /ai/orders/{orderId}/cancel"""
-        return self._post(f'/ai/orders/{order_id}/cancel')
+        return await self._post(f'/ai/orders/{order_id}/cancel')
 
     # ── Addresses ─────────────────────────────────────────────────────────────
 
-    def get_addresses(self) -> Dict[str, Any]:
+    async def get_addresses(self) -> Dict[str, Any]:
         """
         GET /ai/addresses
         data: list of addresses with { id, label, fullAddress, city, isDefault }
         """
-        return self._get('/ai/addresses')
+        return await self._get('/ai/addresses')
 
-    def get_default_address(self) -> Dict[str, Any]:
+    async def get_default_address(self) -> Dict[str, Any]:
         """
         GET /ai/addresses/default
         data: single address object or null
         """
-        return self._get('/ai/addresses/default')
\ No newline at end of file
+        return await self._get('/ai/addresses/default')
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+bench_encoders.py
+Parity and speed of the embedding backends in encoders.py.
+
+For each backend: load time, single-query latency (p50 / p95), batch
+throughput, and cosine similarity of its vectors against the torch
+reference on the same texts. A backend passes parity when the minimum
+cosine is >= --min-cosine (default 0.99); the script exits non-zero if any
+backend fails, so it can gate a backend switch in CI. The same parity bar
+on a fixed sentence set runs as a unit test: tests/test_encoder_parity.py.
+
+Texts are real catalog embedding texts when MONGO_URI is set (the same
+get_text_to_embed() strings the pipeline indexes), plus short shopper
+queries.
+
+Usage (from ai_agent/):
+    python benchmarks/bench_encoders.py --backends onnx onnx-int8 --sample 500
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from encoders import BACKENDS, get_encoder            # noqa: E402
+from embedding_pipeline import get_text_to_embed      # noqa: E402
+
+QUERIES = [
+    "iphone 15 pro 256gb", "cheap laptop under 40000", "wireless earbuds with anc",
+    "samsung 55 inch 4k tv", "running shoes for men", "gaming mouse rgb",
+    "mixer grinder 750w", "kids school bag", "noise cancelling headphones sony",
+    "phone with best camera under 20000", "bluetooth speaker waterproof", "smart watch for women",
+]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _catalog_texts(sample: int) -> list:
+    if not os.getenv("MONGO_URI"):
+        return []
+    from pymongo import MongoClient
+    client = MongoClient(os.getenv("MONGO_URI"), serverSelectionTimeoutMS=5000)
+    try:
+        coll = client[os.getenv("DB_NAME", "ECommerceDB")]["products"]
+        return [get_text_to_embed(p) for p in coll.aggregate([{"$sample": {"size": sample}}])]
+    finally:
+        client.close()
+
+
+def _measure(backend: str, texts: list, batch_size: int, reference=None) -> tuple:
+    t0 = time.perf_counter()
+    encoder = get_encoder(backend)
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    encoder.encode(QUERIES[:2], batch_size=2)   # warm-up (graph init, allocator)
+    latencies = []
+    for q in QUERIES * 5:
+        t0 = time.perf_counter()
+        encoder.encode(q)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    vectors = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+    elapsed = time.perf_counter() - t0
+
+    report = {
+        "load_ms":        round(load_ms, 1),
+        "query_p50_ms":   round(_percentile(latencies, 50), 3),
+        "query_p95_ms":   round(_percentile(latencies, 95), 3),
+        "query_mean_ms":  round(statistics.fmean(latencies), 3),
+        "batch_docs_per_s": round(len(texts) / max(elapsed, 1e-9), 1),
+    }
+    if reference is not None:
+        a = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        b = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+        cos = (a * b).sum(axis=1)
+        report.update({"cosine_min": round(float(cos.min()), 5),
+                       "cosine_mean": round(float(cos.mean()), 5)})
+    return report, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend parity / latency benchmark")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"],
+                        choices=[b for b in BACKENDS if b != "torch"])
+    parser.add_argument("--sample", type=int, default=500, help="catalog products to embed")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    texts = _catalog_texts(args.sample) + QUERIES
+
+    results = {"texts": len(texts), "batch_size": args.batch_size}
+    results["torch"], reference = _measure("torch", texts, args.batch_size)
+    failed = []
+    for backend in args.backends:
+        results[backend], _ = _measure(backend, texts, args.batch_size, reference)
+        results[backend]["parity"] = results[backend]["cosine_min"] >= args.min_cosine
+        if not results[backend]["parity"]:
+            failed.append(backend)
+
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        sys.exit(f"Parity below {args.min_cosine}: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+bench_hybrid.py
+Recall@k and latency of pure vector search vs hybrid (BM25 + vector, RRF).
+
+Queries are generated from real catalog entries the way shoppers type exact
+product lookups — "<name>", "<brand> <name>", "<name> <first spec value>" —
+so every query has one known-correct product. recall@k is the share of
+queries whose product shows up in the top k.
+
+Usage (from ai_agent/):
+    python benchmarks/bench_hybrid.py --sample 200 --top-k 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ["SEARCH_MODE"] = "hybrid"            # build the BM25 index at init
+os.environ["SEARCH_CACHE_ENABLED"] = "false"    # measure real work, not cache hits
+
+from models import SearchRequest                     # noqa: E402
+from semantic_search import SemanticSearchService    # noqa: E402
+
+
+def _queries_for(product: dict) -> list:
+    name  = (product.get("name") or "").strip()
+    brand = (product.get("brand") or "").strip()
+    specs = product.get("specifications") or {}
+    out = [name]
+    if brand and brand.lower() not in name.lower():
+        out.append(f"{brand} {name}")
+    first_spec = next((str(v) for v in specs.values() if v), None) if isinstance(specs, dict) else None
+    if first_spec:
+        out.append(f"{name} {first_spec}")
+    return [q for q in out if q]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def _run(svc, mode, cases, top_k):
+    svc.search_mode = mode
+    hits, latencies = 0, []
+    for query, expected_id in cases:
+        t0 = time.perf_counter()
+        resp = svc._search_uncached(SearchRequest(query=query, top_k=top_k))
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if any(r.id == expected_id for r in resp.results):
+            hits += 1
+    return {
+        f"recall_at_{top_k}": round(hits / max(1, len(cases)), 4),
+        "p50_ms":  round(_percentile(latencies, 50), 3),
+        "p95_ms":  round(_percentile(latencies, 95), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector vs hybrid recall/latency benchmark")
+    parser.add_argument("--sample", type=int, default=200, help="products to turn into queries")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    svc = SemanticSearchService()
+    if svc.lexical_index is None:
+        sys.exit("Lexical index failed to build — check MONGO_URI")
+
+    products = list(svc.collection.aggregate([
+        {"$match": {"embedding": {"$exists": True}}},
+        {"$sample": {"size": args.sample}},
+        {"$project": {"_id": 1, "name": 1, "brand": 1, "specifications": 1}},
+    ]))
+    cases = [(q, str(p["_id"])) for p in products for q in _queries_for(p)]
+
+    # Warm the embedding cache so both modes pay the same (zero) encode cost
+    for query, _ in cases:
+        svc._encode_query(query)
+
+    report = {
+        "products": len(svc.lexical_index),
+        "queries":  len(cases),
+        "top_k":    args.top_k,
+        "vector":   _run(svc, "vector", cases, args.top_k),
+        "hybrid":   _run(svc, "hybrid", cases, args.top_k),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
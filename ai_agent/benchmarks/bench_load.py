@@ -0,0 +1,519 @@
+"""
+bench_load.py
+End-to-end load test of the agent: main:app is started against local fakes
+(benchmarks/fakes.py) and driven with a realistic traffic mix at increasing
+concurrency.
+
+    fake Groq  ←─ GROQ_BASE_URL ─┐
+                                 main:app  ←── N virtual users (closed loop)
+    fake /ai/* ←─ API_BASE_URL ──┘   │
+                                     └── mongomock + local index snapshot
+                                         (in-memory stand-in for Atlas)
+
+Each virtual user has its own JWT (so per-user rate limits and carts behave
+like production) and picks an endpoint by --mix; /chat and /chat/stream
+turns pick a scripted conversation from fakes.SCENARIOS by weight
+(chat_stream_first_event is the time to the first token / tool event). For every concurrency
+level the report has, per endpoint and per chat scenario: requests, errors,
+requests/sec and p50 / p95 / p99 / mean / max latency, plus Groq calls,
+estimated prompt tokens, tool schemas per Groq call, backend calls and
+task success (the scripted conversation was completed) per chat turn.
+
+Results are written as JSON; pass --baseline with an earlier result to print
+p95 / rps deltas and exit non-zero when p95 regresses by more than
+--max-regression percent.
+
+Usage (from ai_agent/):
+    python benchmarks/bench_load.py --concurrency 1 4 16 32 --duration 20 --out load.json
+    python benchmarks/bench_load.py --groq-latency-ms 800 --mix chat=1 --baseline load.json
+    python benchmarks/bench_load.py --encoder model     # real MiniLM instead of hashing
+    python benchmarks/bench_load.py --agents 2 --rate-limit-backend redis --agent-rpm 5 --mix chat=1
+    python benchmarks/bench_load.py --local-llm-latency-ms 300 --groq-slow-rate 0.1 --groq-slow-ms 4000
+
+--local-llm-latency-ms adds a second fake as an `ollama` provider
+(LLM_PROVIDERS), to exercise llm_router.py's routing, failover and hedging.
+
+The fakes and the agent run as subprocesses, so the load generator doesn't
+share a GIL with the server it measures.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import SCENARIOS   # noqa: E402
+
+SEARCH_QUERIES = [
+    "wireless earbuds", "samsung 5g phone", "gaming laptop under 80000", "running shoes",
+    "4k smart tv", "bluetooth speaker", "air fryer", "mechanical keyboard", "sony headphones",
+    "apple ultrabook", "mixer grinder under 5000", "gaming mouse",
+]
+CHAT_ERROR_ACTIONS = {"groq_error", "rate_limited", "rate_limited_groq", "max_iterations", "unavailable"}
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _summary(samples_ms, errors: int, elapsed: float) -> dict:
+    if not samples_ms:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(samples_ms),
+        "errors":   errors,
+        "rps":      round(len(samples_ms) / elapsed, 2),
+        "p50_ms":   round(_percentile(samples_ms, 50), 2),
+        "p95_ms":   round(_percentile(samples_ms, 95), 2),
+        "p99_ms":   round(_percentile(samples_ms, 99), 2),
+        "mean_ms":  round(statistics.fmean(samples_ms), 2),
+        "max_ms":   round(max(samples_ms), 2),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _jwt(user: str) -> str:
+    """Unsigned JWT — the agent only reads `sub` to key rate limits; the fakes key carts on it."""
+    enc = lambda obj: base64.urlsafe_b64encode(json.dumps(obj).encode()).rstrip(b"=").decode()
+    return f"{enc({'alg': 'none', 'typ': 'JWT'})}.{enc({'sub': user})}.load"
+
+
+def _parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("chat", "chat_stream", "search", "search_batch"):
+            raise argparse.ArgumentTypeError(f"unknown endpoint in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Server processes
+# ─────────────────────────────────────────────────────────────────────────────
+
+async def _serve_fakes(args) -> None:
+    import uvicorn
+    from fakes import FakeBackend, FakeGroq, FakeRedis, synthetic_catalog
+
+    groq = FakeGroq(args.groq_latency_ms, args.groq_jitter_ms, args.groq_rpm, args.groq_tpm,
+                    args.groq_error_rate, args.groq_token_ms, args.groq_slow_rate, args.groq_slow_ms)
+    backend = FakeBackend(synthetic_catalog(args.products, args.seed),
+                          args.backend_latency_ms, args.backend_jitter_ms)
+    servers = [
+        uvicorn.Server(uvicorn.Config(groq.app(), host="127.0.0.1", port=args.groq_port, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(backend.app(), host="127.0.0.1", port=args.backend_port, log_level="warning")),
+    ]
+    if args.local_llm_latency_ms:
+        local = FakeGroq(args.local_llm_latency_ms, args.local_llm_jitter_ms, token_ms=args.groq_token_ms)
+        servers.append(uvicorn.Server(uvicorn.Config(local.app(), host="127.0.0.1", port=args.local_llm_port,
+                                                     log_level="warning")))
+    serving = [s.serve() for s in servers]
+    if args.rate_limit_backend == "redis":
+        serving.append(FakeRedis().serve(port=args.redis_port))
+    await asyncio.gather(*serving)
+
+
+def _serve_agent(args) -> None:
+    """Build the in-memory catalog, point main.py's loaders at it, serve main:app."""
+    import logging
+    import uvicorn
+    import mongomock
+    from bson import ObjectId
+    from fakes import HashingEncoder, synthetic_catalog
+
+    os.environ["LOCAL_INDEX_PATH"] = os.path.join(args.workdir, f"index_snapshot_{args.agent_port}")
+    from local_index import LocalVectorIndex
+    from embedding_pipeline import filter_fields, get_text_to_embed
+    from semantic_search import COLLECTION_NAME, DB_NAME
+
+    if args.encoder == "hash":
+        encoder = HashingEncoder()
+    else:
+        from encoders import get_encoder
+        encoder = get_encoder()
+
+    catalog = synthetic_catalog(args.products, args.seed)
+    vectors = encoder.encode([get_text_to_embed(p) for p in catalog], batch_size=64)
+    client  = mongomock.MongoClient()
+    coll    = client[DB_NAME][COLLECTION_NAME]
+    coll.insert_many([{**p, **filter_fields(p), "_id": ObjectId(p["_id"]), "embedding": [float(x) for x in v]}
+                      for p, v in zip(catalog, vectors)])
+    LocalVectorIndex.build_snapshot(coll, os.environ["LOCAL_INDEX_PATH"])
+
+    import main
+    main._load_encoder  = lambda: encoder
+    main._connect_mongo = lambda: client
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.agent_port, log_level="warning")
+
+
+def _spawn(args, role: str, env: dict, log, agent_port: int = 0) -> subprocess.Popen:
+    forwarded = [
+        "--products", str(args.products), "--seed", str(args.seed),
+        "--groq-port", str(args.groq_port), "--backend-port", str(args.backend_port),
+        "--agent-port", str(agent_port or args.agent_port), "--redis-port", str(args.redis_port),
+        "--rate-limit-backend", args.rate_limit_backend, "--workdir", args.workdir, "--encoder", args.encoder,
+        "--groq-latency-ms", str(args.groq_latency_ms), "--groq-jitter-ms", str(args.groq_jitter_ms),
+        "--groq-token-ms", str(args.groq_token_ms),
+        "--groq-rpm", str(args.groq_rpm), "--groq-tpm", str(args.groq_tpm),
+        "--groq-error-rate", str(args.groq_error_rate),
+        "--groq-slow-rate", str(args.groq_slow_rate), "--groq-slow-ms", str(args.groq_slow_ms),
+        "--local-llm-port", str(args.local_llm_port), "--local-llm-latency-ms", str(args.local_llm_latency_ms),
+        "--local-llm-jitter-ms", str(args.local_llm_jitter_ms),
+        "--backend-latency-ms", str(args.backend_latency_ms), "--backend-jitter-ms", str(args.backend_jitter_ms),
+    ] + (["--verbose"] if args.verbose else [])
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), role, *forwarded],
+                            env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Load driver
+# ─────────────────────────────────────────────────────────────────────────────
+
+async def _wait_ready(http, url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await http.get(url, timeout=2)).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def _chat_body(scenario, user: str) -> dict:
+    return {"message": scenario.message, "history": scenario.history, "jwt_token": _jwt(user)}
+
+
+def _search_body(rng: random.Random) -> dict:
+    body = {"query": rng.choice(SEARCH_QUERIES), "top_k": 5}
+    if rng.random() < 0.3:
+        body["max_price"] = rng.choice([3000, 20000, 80000])
+    return body
+
+
+async def _virtual_user(i: int, http, agents: list, mix: dict, stop_at: float, samples: dict) -> None:
+    rng       = random.Random(i)
+    user      = f"loadtest-{i}"
+    endpoints = list(mix)
+    scenarios = list(SCENARIOS)
+    weights   = [SCENARIOS[s].weight for s in scenarios]
+    sent = 0
+    while time.monotonic() < stop_at:
+        agent = agents[(i + sent) % len(agents)]      # round-robin, like a non-sticky load balancer
+        sent += 1
+        endpoint = rng.choices(endpoints, [mix[e] for e in endpoints])[0]
+        label = endpoint
+        if endpoint in ("chat", "chat_stream"):
+            scenario = rng.choices(scenarios, weights)[0]
+            label = f"{endpoint}:{scenario}"
+            path, body = ("/chat" if endpoint == "chat" else "/chat/stream"), _chat_body(SCENARIOS[scenario], user)
+        elif endpoint == "search":
+            path, body = "/search", _search_body(rng)
+        else:
+            path, body = "/search/batch", {"searches": [_search_body(rng) for _ in range(4)]}
+
+        t0 = time.perf_counter()
+        ok, first_ms, reply = False, None, None
+        try:
+            if endpoint == "chat_stream":
+                reply, first_ms = await _post_stream(http, agent + path, body, t0)
+                ok = reply is not None
+            else:
+                resp = await http.post(agent + path, json=body)
+                ok = resp.status_code == 200
+                if ok and endpoint == "chat":
+                    reply = resp.json()
+            if reply is not None:
+                ok = reply.get("action") not in CHAT_ERROR_ACTIONS
+        except Exception:
+            pass
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        timings = {endpoint: elapsed_ms, label: elapsed_ms}
+        if first_ms is not None:
+            timings["chat_stream_first_event"] = first_ms
+        for key, ms in timings.items():
+            bucket = samples.setdefault(key, {"ms": [], "errors": 0, "tasks_failed": 0})
+            bucket["ms"].append(ms)
+            bucket["errors"] += 0 if ok else 1
+        if endpoint in ("chat", "chat_stream") and not (reply and SCENARIOS[scenario].completed(reply)):
+            samples[endpoint]["tasks_failed"] += 1
+
+
+async def _post_stream(http, url: str, body: dict, t0: float):
+    """POST /chat/stream; (the done event's response or None, ms until the first token or tool event)."""
+    first_ms, reply, event = None, None, None
+    async with http.stream("POST", url, json=body) as resp:
+        if resp.status_code != 200:
+            return None, None
+        async for line in resp.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                if first_ms is None and event in ("token", "tool_start", "done"):
+                    first_ms = (time.perf_counter() - t0) * 1000
+            elif line.startswith("data: ") and event == "done":
+                reply = json.loads(line[6:])
+    return reply, first_ms
+
+
+async def _run_level(http, urls: dict, concurrency: int, duration: float, mix: dict) -> dict:
+    llms = [u for u in (urls["groq"], urls.get("local_llm")) if u]
+    await asyncio.gather(*(http.post(u + "/stats/reset") for u in llms + [urls["backend"]]))
+    samples: dict = {}
+    t0 = time.perf_counter()
+    stop_at = time.monotonic() + duration
+    await asyncio.gather(*(_virtual_user(i, http, urls["agents"], mix, stop_at, samples)
+                           for i in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    *llm_stats, backend = [r.json() for r in await asyncio.gather(*(http.get(u + "/stats")
+                                                                    for u in llms + [urls["backend"]]))]
+    groq = llm_stats[0]
+    llm = {k: sum(s.get(k, 0) for s in llm_stats) for k in groq}     # every fake LLM provider
+    level = {
+        "concurrency": concurrency,
+        "elapsed_s":   round(elapsed, 2),
+        "endpoints":   {k: _summary(v["ms"], v["errors"], elapsed) for k, v in sorted(samples.items())
+                        if ":" not in k},
+        "scenarios":   {k: _summary(v["ms"], v["errors"], elapsed) for k, v in sorted(samples.items())
+                        if ":" in k},
+        "groq":        groq,
+        "backend":     backend,
+    }
+    if len(llm_stats) > 1:
+        level["local_llm"] = llm_stats[1]
+    chat  = [samples[e] for e in ("chat", "chat_stream") if e in samples]
+    turns = sum(len(b["ms"]) for b in chat)
+    if turns:
+        level["per_chat_turn"] = {
+            "groq_calls":     round(llm["calls"] / turns, 3),
+            "prompt_tokens":  round(llm["prompt_tokens"] / turns, 1),
+            "tools_per_call": round(llm["tools_sent"] / llm["calls"], 2) if llm["calls"] else 0.0,
+            "missing_tool":   round(llm["missing_tool"] / turns, 3),
+            "backend_calls":  round(sum(backend.values()) / turns, 3),
+            "task_success":   round(1 - sum(b["tasks_failed"] for b in chat) / turns, 4),
+        }
+    return level
+
+
+def _print_level(level: dict) -> None:
+    print(f"\n── concurrency {level['concurrency']} ({level['elapsed_s']}s)")
+    print(f"  {'endpoint':<32}{'req':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    rows = list(level["endpoints"].items()) + [(f"  {k}", v) for k, v in level["scenarios"].items()]
+    for name, s in rows:
+        if s.get("requests"):
+            print(f"  {name:<32}{s['requests']:>7}{s['errors']:>6}{s['rps']:>9}"
+                  f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}")
+    if "per_chat_turn" in level:
+        print(f"  per chat turn: {level['per_chat_turn']}")
+
+
+def _compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Print p95 / rps deltas vs a previous run; return the regressions over the threshold."""
+    regressions = []
+    base_levels = {lvl["concurrency"]: lvl for lvl in baseline.get("levels", [])}
+    print("\n── vs baseline")
+    for lvl in results["levels"]:
+        base = base_levels.get(lvl["concurrency"])
+        if not base:
+            continue
+        for name, s in lvl["endpoints"].items():
+            b = base["endpoints"].get(name)
+            if not (b and b.get("p95_ms") and s.get("p95_ms")):
+                continue
+            p95_delta = (s["p95_ms"] - b["p95_ms"]) / b["p95_ms"] * 100
+            rps_delta = (s["rps"] - b["rps"]) / b["rps"] * 100
+            flag = "  ← regression" if p95_delta > max_regression else ""
+            print(f"  c={lvl['concurrency']:<4}{name:<14} p95 {b['p95_ms']:>9} → {s['p95_ms']:>9} "
+                  f"({p95_delta:+.1f}%)  rps {rps_delta:+.1f}%{flag}")
+            if flag:
+                regressions.append(f"c={lvl['concurrency']} {name} p95 {p95_delta:+.1f}%")
+    return regressions
+
+
+async def _benchmark(args, urls: dict) -> dict:
+    import httpx
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 10,
+                          max_keepalive_connections=max(args.concurrency) + 10)
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as http:
+        await _wait_ready(http, urls["groq"] + "/stats", 30)
+        if urls.get("local_llm"):
+            await _wait_ready(http, urls["local_llm"] + "/stats", 30)
+        await _wait_ready(http, urls["backend"] + "/stats", 30)
+        for agent in urls["agents"]:
+            await _wait_ready(http, agent + "/ready", args.startup_timeout)
+
+        if args.warmup:
+            await _run_level(http, urls, min(4, max(args.concurrency)), args.warmup, args.mix)
+        levels = []
+        for concurrency in args.concurrency:
+            level = await _run_level(http, urls, concurrency, args.duration, args.mix)
+            _print_level(level)
+            levels.append(level)
+        agent_metrics = (await http.get(urls["agents"][0] + "/metrics")).text
+        health = [(await http.get(agent + "/health")).json() for agent in urls["agents"]]
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {
+            "duration_s": args.duration, "mix": args.mix, "products": args.products,
+            "encoder": args.encoder, "groq_latency_ms": args.groq_latency_ms,
+            "groq_jitter_ms": args.groq_jitter_ms, "groq_token_ms": args.groq_token_ms, "groq_rpm": args.groq_rpm, "groq_tpm": args.groq_tpm,
+            "groq_error_rate": args.groq_error_rate, "groq_slow_rate": args.groq_slow_rate,
+            "groq_slow_ms": args.groq_slow_ms, "local_llm_latency_ms": args.local_llm_latency_ms,
+            "backend_latency_ms": args.backend_latency_ms,
+            "backend_jitter_ms": args.backend_jitter_ms, "agents": args.agents,
+            "rate_limit_backend": args.rate_limit_backend, "agent_rpm": args.agent_rpm,
+            "agent_groq_tpm": args.agent_groq_tpm,
+            "scenarios": {k: s.weight for k, s in SCENARIOS.items()},
+        },
+        "levels": levels,
+        "metrics_lines": len(agent_metrics.splitlines()),
+        "rate_limit":    [h.get("rate_limit") for h in health],
+        "llm_router":    [h.get("llm_router") for h in health],
+    }
+
+
+def _unlink_shm(name: str) -> None:
+    from multiprocessing import shared_memory
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def run(args) -> None:
+    args.groq_port    = args.groq_port or _free_port()
+    args.backend_port = args.backend_port or _free_port()
+    args.redis_port   = args.redis_port or _free_port()
+    args.local_llm_port = args.local_llm_port or _free_port()
+    args.workdir      = args.workdir or tempfile.mkdtemp(prefix="shopai-load-")
+    agent_ports = [_free_port() for _ in range(args.agents)]
+    urls = {"groq":    f"http://127.0.0.1:{args.groq_port}",
+            "backend": f"http://127.0.0.1:{args.backend_port}",
+            "agents":  [f"http://127.0.0.1:{port}" for port in agent_ports]}
+    if args.local_llm_latency_ms:
+        urls["local_llm"] = f"http://127.0.0.1:{args.local_llm_port}"
+    shm_name = f"shopai_rl_{os.getpid()}"
+    agent_env = {
+        "GROQ_API_KEY":       "fake-key",
+        "GROQ_BASE_URL":      urls["groq"],
+        "API_BASE_URL":       urls["backend"] + "/api",
+        "SEARCH_BACKEND":     "local",
+        "LLM_RATE_LIMIT_RPM": str(args.agent_rpm),
+        "GROQ_TPM_LIMIT":     str(args.agent_groq_tpm),
+        "RATE_LIMIT_BACKEND":   args.rate_limit_backend,
+        "RATE_LIMIT_SHM_NAME":  shm_name,
+        "RATE_LIMIT_REDIS_URL": f"redis://127.0.0.1:{args.redis_port}/0",
+        "EMBED_WATCHER_ENABLED": "false",
+        "PROMPT_TOKENIZER":   os.getenv("PROMPT_TOKENIZER", ""),   # offline: chars estimate
+        "TRACING_EXPORTER":   "none",
+    }
+    if args.local_llm_latency_ms:
+        agent_env["LLM_PROVIDERS"] = f"groq:llama-3.1-8b-instant,ollama:fake-local@{urls['local_llm']}/v1"
+    log_path = os.path.join(args.workdir, "servers.log")
+    with open(log_path, "ab") as log:
+        procs = [_spawn(args, "fakes", {}, log)] + [_spawn(args, "agent", agent_env, log, port)
+                                                    for port in agent_ports]
+        try:
+            results = asyncio.run(_benchmark(args, urls))
+        except RuntimeError as e:
+            sys.exit(f"{e} — see {log_path}")
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                try:
+                    p.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+            if args.rate_limit_backend == "shm":
+                _unlink_shm(shm_name)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults → {args.out}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = _compare(results, json.load(f), args.max_regression)
+        if regressions:
+            sys.exit("p95 regressions: " + "; ".join(regressions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test main:app against local fakes")
+    parser.add_argument("role", nargs="?", default="run", choices=["run", "fakes", "agent"],
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of untimed warm-up traffic")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("chat=0.7,search=0.25,search_batch=0.05"),
+                        help="endpoint weights, e.g. chat=0.7,search=0.25,search_batch=0.05")
+    parser.add_argument("--products", type=int, default=2000, help="synthetic catalog size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--encoder", choices=["hash", "model"], default="hash",
+                        help="hash = dependency-free stand-in; model = the configured EMBED_BACKEND")
+    parser.add_argument("--groq-latency-ms", type=float, default=400)
+    parser.add_argument("--groq-jitter-ms", type=float, default=100)
+    parser.add_argument("--groq-token-ms", type=float, default=10, help="fake Groq delay per reply word")
+    parser.add_argument("--groq-rpm", type=int, default=0, help="fake Groq request quota (0 = unlimited)")
+    parser.add_argument("--groq-tpm", type=int, default=0, help="fake Groq token quota (0 = unlimited)")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0, help="share of 503s from fake Groq")
+    parser.add_argument("--groq-slow-rate", type=float, default=0.0, help="share of fake Groq calls that are slow")
+    parser.add_argument("--groq-slow-ms", type=float, default=3000, help="extra latency of a slow call")
+    parser.add_argument("--local-llm-latency-ms", type=float, default=0,
+                        help="add a second fake as an ollama provider with this latency (0 = Groq only)")
+    parser.add_argument("--local-llm-jitter-ms", type=float, default=50)
+    parser.add_argument("--backend-latency-ms", type=float, default=80)
+    parser.add_argument("--backend-jitter-ms", type=float, default=30)
+    parser.add_argument("--agent-rpm", type=int, default=100000, help="LLM_RATE_LIMIT_RPM for the agent")
+    parser.add_argument("--agent-groq-tpm", type=int, default=0, help="GROQ_TPM_LIMIT for the agent (0 = off)")
+    parser.add_argument("--agents", type=int, default=1, help="agent replicas; virtual users spread across them")
+    parser.add_argument("--rate-limit-backend", choices=["memory", "shm", "redis"], default="memory",
+                        help="RATE_LIMIT_BACKEND for the agents (redis = fakes.FakeRedis)")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--out", help="write JSON results here")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=15.0, help="allowed p95 increase, percent")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's INFO logs")
+    # internal: ports / workdir handed to the server subprocesses
+    for flag in ("--groq-port", "--backend-port", "--agent-port", "--redis-port", "--local-llm-port"):
+        parser.add_argument(flag, type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == "fakes":
+        asyncio.run(_serve_fakes(args))
+    elif args.role == "agent":
+        _serve_agent(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
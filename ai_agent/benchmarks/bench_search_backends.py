@@ -0,0 +1,111 @@
+"""
+bench_search_backends.py
+Compare Atlas $vectorSearch against the local in-memory index.
+
+Both backends get the SAME query vectors (encoded once up front), so the
+numbers isolate retrieval cost: network + aggregation vs. a NumPy dot product.
+Also reports overlap@k so you can see whether the local index returns the
+same products Atlas does.
+
+Usage (from ai_agent/):
+    python local_index.py build                       # snapshot first
+    python benchmarks/bench_search_backends.py --runs 50 --top-k 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+os.environ.setdefault("SEARCH_BACKEND", "auto")   # load Atlas AND the snapshot
+
+from semantic_search import SemanticSearchService  # noqa: E402
+
+DEFAULT_QUERIES = [
+    "wireless earphones",
+    "iphone 15 pro 256gb",
+    "gaming laptop under 80000",
+    "running shoes for men",
+    "4k smart tv",
+    "bluetooth speaker waterproof",
+    "samsung galaxy phone",
+    "office chair with lumbar support",
+]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _summary(samples_ms):
+    return {
+        "p50_ms":  round(_percentile(samples_ms, 50), 3),
+        "p95_ms":  round(_percentile(samples_ms, 95), 3),
+        "p99_ms":  round(_percentile(samples_ms, 99), 3),
+        "mean_ms": round(statistics.fmean(samples_ms), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atlas vs local index benchmark")
+    parser.add_argument("--runs", type=int, default=30, help="repetitions per query")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-price", type=float, default=None)
+    parser.add_argument("--queries", help="file with one query per line")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    svc = SemanticSearchService()
+    if svc.local_index is None:
+        sys.exit("Local index not loaded — run `python local_index.py build` first")
+
+    vectors = {q: svc._encode_query(q) for q in queries}
+    atlas_ms, local_ms, overlaps = [], [], []
+
+    for q in queries:
+        vec = vectors[q]
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            atlas_docs = svc._atlas_search(vec, args.top_k, None, args.max_price)
+            atlas_ms.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            local_docs = svc.local_index.search(vec, args.top_k, None, args.max_price)
+            local_ms.append((time.perf_counter() - t0) * 1000)
+
+        atlas_ids = {str(d["_id"]) for d in atlas_docs}
+        local_ids = {str(d["_id"]) for d in local_docs}
+        overlaps.append(len(atlas_ids & local_ids) / max(1, len(atlas_ids)))
+
+    report = {
+        "products":      len(svc.local_index),
+        "queries":       len(queries),
+        "runs":          args.runs,
+        "top_k":         args.top_k,
+        "max_price":     args.max_price,
+        "atlas":         _summary(atlas_ms),
+        "local":         _summary(local_ms),
+        "overlap_at_k":  round(statistics.fmean(overlaps), 4),
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,624 @@
+"""
+fakes.py
+Local stand-ins for everything the agent talks to, so it can be load-tested
+offline and reproducibly (used by bench_load.py):
+
+  - FakeGroq     OpenAI-compatible /chat/completions that replays scripted
+                 tool-call sequences (SCENARIOS), with configurable latency
+                 (time to first token + per-token, plus an optional slow
+                 tail), streaming (stream=true), optional RPM / TPM quota (429 + retry-after, x-ratelimit-*
+                 headers like Groq), Groq's 400 tool_use_failed when the
+                 script calls a tool the request didn't send, and a /stats
+                 endpoint. On /v1 it also stands in for an Ollama / OpenAI
+                 provider (LLM_PROVIDERS)
+  - FakeBackend  the .NET /api/ai/* surface APIClient uses (cart, orders,
+                 addresses, context, products) with per-JWT in-memory state
+  - FakeRedis    a RESP server with the few commands the redis rate-limit
+                 backend uses, shared by several agent replicas
+  - synthetic_catalog() + HashingEncoder
+                 a deterministic product catalog and a dependency-free 384-d
+                 encoder, to seed the in-memory vector store (mongomock + the
+                 local index snapshot) that stands in for Atlas
+
+Scripted tool arguments may use placeholders that are resolved from the
+tool results already in the conversation: "$product" (first search hit),
+"$address" (default address id) and "$order" (most recent order id).
+When the agent sends a session context message (session_cache.py), steps
+made only of reads that context answers are skipped, as a model would.
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from session_cache import READ_TOOLS, SESSION_CONTEXT_HEADER
+
+EMBED_DIM = 384
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Synthetic catalog + encoder
+# ─────────────────────────────────────────────────────────────────────────────
+
+_CATALOG_SPEC = {
+    # category: (brands, product nouns, (min_price, max_price))
+    "Mobiles":     (["Samsung", "Apple", "OnePlus", "Xiaomi", "Realme"], ["smartphone", "5G phone", "phone"], (8000, 140000)),
+    "Laptops":     (["Dell", "HP", "Lenovo", "ASUS", "Apple"], ["laptop", "gaming laptop", "ultrabook"], (30000, 200000)),
+    "Audio":       (["boAt", "Sony", "JBL", "Noise", "OnePlus"], ["wireless earbuds", "headphones", "bluetooth speaker"], (999, 30000)),
+    "Televisions": (["Samsung", "LG", "Sony", "Mi", "TCL"], ["4K smart TV", "LED TV", "OLED TV"], (12000, 250000)),
+    "Footwear":    (["Nike", "Adidas", "Puma", "Campus", "Bata"], ["running shoes", "sneakers", "sports shoes"], (799, 12000)),
+    "Appliances":  (["Philips", "Prestige", "Bajaj", "Havells", "Preethi"], ["mixer grinder", "air fryer", "induction cooktop"], (1500, 15000)),
+    "Accessories": (["Logitech", "HP", "Zebronics", "Portronics", "Redgear"], ["wireless mouse", "mechanical keyboard", "gaming mouse"], (399, 9000)),
+}
+_ADJECTIVES = ["Pro", "Lite", "Max", "Neo", "Plus", "Air", "Prime", "Ultra"]
+
+
+def product_id(seed: int, i: int) -> str:
+    """Deterministic 24-hex id, so every process derives the same catalog."""
+    return hashlib.sha1(f"{seed}:{i}".encode("utf-8")).hexdigest()[:24]
+
+
+def synthetic_catalog(n: int = 2000, seed: int = 7) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    categories = list(_CATALOG_SPEC)
+    products = []
+    for i in range(n):
+        category = categories[i % len(categories)]
+        brands, nouns, (lo, hi) = _CATALOG_SPEC[category]
+        brand, noun = rng.choice(brands), rng.choice(nouns)
+        name = f"{brand} {noun} {rng.choice(_ADJECTIVES)} {rng.randint(2, 99)}"
+        products.append({
+            "_id":           product_id(seed, i),
+            "name":          name,
+            "brand":         brand,
+            "category":      category,
+            "price":         float(round(rng.uniform(lo, hi), -1)),
+            "rating":        round(rng.uniform(3.0, 5.0), 1),
+            "reviewCount":   rng.randint(0, 5000),
+            "stockQuantity": rng.choice([0, 3, 10, 25, 100]),
+            "description":   f"{name} — {noun} by {brand} in {category.lower()}.",
+            "imageUrl":      f"https://img.example/{i}.jpg",
+        })
+    return products
+
+
+class HashingEncoder:
+    """
+    Feature-hashed bag of words (+ bigrams), L2-normalised. Same .encode()
+    contract as encoders.get_encoder(), no model download; similar texts
+    still score higher, which is all a load test needs.
+    """
+
+    def __init__(self, dim: int = EMBED_DIM):
+        self.dim = dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        tokens = re.findall(r"[a-z0-9]+", (text or "").lower())
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **_):
+        if isinstance(sentences, str):
+            return self._vector(sentences)
+        return np.vstack([self._vector(s) for s in sentences]) if sentences else np.zeros((0, self.dim), np.float32)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Conversation scripts
+# ─────────────────────────────────────────────────────────────────────────────
+
+Step = List[Tuple[str, Dict[str, Any]]]     # tool calls issued in one LLM iteration
+
+
+@dataclass
+class Scenario:
+    message: str
+    steps:   List[Step]
+    reply:   str
+    weight:  float = 1.0
+    history: List[Dict[str, str]] = field(default_factory=list)
+
+    @property
+    def action(self) -> str:
+        """The `action` a completed /chat turn reports: its last tool."""
+        return self.steps[-1][-1][0] if self.steps else "other"
+
+    def completed(self, response: Dict[str, Any]) -> bool:
+        """Did the agent finish the script (or answer it from session context)?"""
+        return response.get("action") == self.action or response.get("response") == self.reply
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "smalltalk": Scenario("hi there", [], "Hi! What are you shopping for today?", weight=1),
+    "browse": Scenario(
+        "show me wireless earbuds under 3000",
+        [[("search_products", {"query": "wireless earbuds", "max_price": 3000})]],
+        "Here are some wireless earbuds under ₹3000.", weight=4),
+    "compare_browse": Scenario(
+        "gaming laptop or ultrabook from dell",
+        [[("search_products", {"query": "dell gaming laptop"}),
+          ("search_products", {"query": "dell ultrabook"})]],
+        "Here are Dell gaming laptops and ultrabooks side by side.", weight=1),
+    "view_cart": Scenario(
+        "what's in my cart", [[("get_cart", {})]], "Here's your cart.", weight=2),
+    "add_to_cart": Scenario(
+        "add boat earbuds to my cart",
+        [[("search_products", {"query": "boat wireless earbuds"})],
+         [("add_to_cart", {"product_id": "$product", "quantity": 1})]],
+        "Added to your cart!", weight=2,
+        history=[{"role": "user", "content": "show me boat earbuds"},
+                 {"role": "assistant", "content": "Here are some boAt earbuds."}]),
+    "checkout": Scenario(
+        "place my order",
+        [[("get_cart", {}), ("get_default_address", {})],
+         [("place_order", {"shipping_address_id": "$address"})]],
+        "Your order has been placed successfully!", weight=1),
+    "orders": Scenario(
+        "show my orders", [[("get_orders", {})]], "Here are your recent orders.", weight=1),
+    "cancel": Scenario(
+        "cancel my last order",
+        [[("get_orders", {})], [("cancel_order", {"order_id": "$order"})]],
+        "Your order has been cancelled.", weight=0.5),
+}
+
+_BY_MESSAGE = {s.message.strip().lower(): s for s in SCENARIOS.values()}
+_FALLBACK_ID = "0" * 24
+
+
+def _tool_results(messages: List[dict]) -> List[Any]:
+    out = []
+    for m in messages:
+        if m.get("role") == "tool":
+            try:
+                out.append(json.loads(m.get("content") or "{}").get("data"))
+            except (ValueError, AttributeError):
+                continue
+    return out
+
+
+def _resolve(value: Any, results: List[Any]) -> Any:
+    if not isinstance(value, str) or not value.startswith("$"):
+        return value
+    for data in reversed(results):
+        if value == "$product" and isinstance(data, list) and data and data[0].get("id"):
+            return data[0]["id"]
+        if value == "$order" and isinstance(data, list) and data and data[0].get("orderId"):
+            return data[0]["orderId"]
+        if value == "$address" and isinstance(data, dict) and data.get("id"):
+            return data["id"]
+    return _FALLBACK_ID
+
+
+def _session_context(messages: List[dict]) -> Dict[str, Any]:
+    for m in messages:
+        content = m.get("content") or ""
+        if m.get("role") == "system" and content.startswith(SESSION_CONTEXT_HEADER):
+            try:
+                return json.loads(content[len(SESSION_CONTEXT_HEADER):])
+            except ValueError:
+                return {}
+    return {}
+
+
+def next_turn(messages: List[dict]) -> Tuple[Optional[Step], str]:
+    """(tool calls to emit, or None) and the final reply, for this conversation state."""
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    text = str(messages[last_user].get("content") or "") if last_user >= 0 else ""
+    scenario = _BY_MESSAGE.get(text.strip().lower())
+    if scenario is None:
+        return None, "Sure — anything else I can help with?"
+    context = _session_context(messages)
+    steps = [step for step in scenario.steps
+             if not all(READ_TOOLS.get(name) in context for name, _ in step)]
+    turn = messages[last_user + 1:]
+    done = sum(1 for m in turn if m.get("role") == "assistant" and m.get("tool_calls"))
+    if done >= len(steps):
+        return None, scenario.reply
+    results = [context.get(section) for section in READ_TOOLS.values()] + _tool_results(turn)
+    return [(name, {k: _resolve(v, results) for k, v in args.items()})
+            for name, args in steps[done]], scenario.reply
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Fake Groq (OpenAI-compatible chat completions)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _words(body: dict) -> List[str]:
+    return re.findall(r"\S+\s*", body["choices"][0]["message"].get("content") or "")
+
+
+async def _sleep_ms(latency_ms: float, jitter_ms: float) -> None:
+    delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000.0
+    if delay:
+        await asyncio.sleep(delay)
+
+
+class FakeGroq:
+    def __init__(self, latency_ms: float = 400, jitter_ms: float = 100,
+                 rpm: int = 0, tpm: int = 0, error_rate: float = 0.0, token_ms: float = 10,
+                 slow_rate: float = 0.0, slow_ms: float = 0.0):
+        self.latency_ms = latency_ms        # time to first token
+        self.jitter_ms  = jitter_ms
+        self.slow_rate  = slow_rate         # share of calls with slow_ms extra (tail latency)
+        self.slow_ms    = slow_ms
+        self.token_ms   = token_ms          # per generated word of reply text
+        self.rpm        = rpm
+        self.tpm        = tpm
+        self.error_rate = error_rate
+        self._window: deque = deque()           # (t, tokens) over the last 60s
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.stats = {"calls": 0, "tool_call_responses": 0, "final_responses": 0,
+                      "rate_limited": 0, "errors": 0, "prompt_tokens": 0,
+                      "completion_tokens": 0, "tools_sent": 0, "missing_tool": 0, "slow": 0}
+
+    @staticmethod
+    def _estimate_tokens(payload: dict) -> int:
+        """~4 chars per token over messages + tool schemas (what Groq bills as input)."""
+        size = len(json.dumps(payload.get("messages", []), ensure_ascii=False))
+        size += len(json.dumps(payload.get("tools", []) or [], ensure_ascii=False))
+        return max(1, size // 4)
+
+    def _quota(self, tokens: int) -> Tuple[bool, Dict[str, str]]:
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+            used_req = len(self._window)
+            used_tok = sum(t for _, t in self._window)
+            over = ((self.rpm and used_req >= self.rpm) or
+                    (self.tpm and used_tok + tokens > self.tpm))
+            if not over:
+                self._window.append((now, tokens))
+                used_req, used_tok = used_req + 1, used_tok + tokens
+            reset_s = 60 - (now - self._window[0][0]) if self._window else 0
+        headers = {"x-ratelimit-reset-requests": f"{reset_s:.2f}s",
+                   "x-ratelimit-reset-tokens":   f"{reset_s:.2f}s"}
+        if self.rpm:
+            headers.update({"x-ratelimit-limit-requests": str(self.rpm),
+                            "x-ratelimit-remaining-requests": str(max(0, self.rpm - used_req))})
+        if self.tpm:
+            headers.update({"x-ratelimit-limit-tokens": str(self.tpm),
+                            "x-ratelimit-remaining-tokens": str(max(0, self.tpm - used_tok))})
+        if over:
+            headers["retry-after"] = f"{max(1, int(reset_s) + 1)}"
+        return not over, headers
+
+    async def complete(self, payload: dict) -> Tuple[int, dict, Dict[str, str]]:
+        prompt_tokens = self._estimate_tokens(payload)
+        allowed, headers = self._quota(prompt_tokens)
+        self.stats["calls"] += 1
+        if not allowed:
+            self.stats["rate_limited"] += 1
+            return 429, {"error": {"message": "Rate limit reached (fake)", "type": "tokens",
+                                   "code": "rate_limit_exceeded"}}, headers
+        await _sleep_ms(self.latency_ms, self.jitter_ms)
+        if self.slow_rate and random.random() < self.slow_rate:
+            self.stats["slow"] += 1
+            await _sleep_ms(self.slow_ms, 0)
+        if self.error_rate and random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return 503, {"error": {"message": "Service unavailable (fake)"}}, headers
+
+        calls, reply = next_turn(payload.get("messages", []))
+        sent = {t["function"]["name"] for t in payload.get("tools") or []}
+        missing = [name for name, _ in calls or [] if sent and name not in sent]
+        if missing:
+            # What Groq answers when the model calls a tool the request didn't define
+            self.stats["missing_tool"] += 1
+            return 400, {"error": {
+                "message": f"tool call validation failed: attempted to call tool '{missing[0]}' "
+                           "which was not in request.tools",
+                "type": "invalid_request_error", "code": "tool_use_failed"}}, headers
+        if calls and payload.get("tools"):
+            message = {"role": "assistant", "content": None, "tool_calls": [
+                {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                 "function": {"name": name, "arguments": json.dumps(args)}}
+                for name, args in calls]}
+            finish, completion_tokens = "tool_calls", 20 * len(calls)
+            self.stats["tool_call_responses"] += 1
+        else:
+            message = {"role": "assistant", "content": reply}
+            finish, completion_tokens = "stop", max(1, len(reply) // 4)
+            self.stats["final_responses"] += 1
+        self.stats["prompt_tokens"]     += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        self.stats["tools_sent"]        += len(payload.get("tools") or [])
+        return 200, {
+            "id":      f"chatcmpl-{uuid.uuid4().hex[:16]}",
+            "object":  "chat.completion",
+            "created": int(time.time()),
+            "model":   payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+            "usage":   {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens},
+        }, headers
+
+    async def _stream(self, body: dict):
+        """The completion as chat.completion.chunk SSE, usage in x_groq on the last chunk."""
+        base = {"id": body["id"], "object": "chat.completion.chunk",
+                "created": body["created"], "model": body["model"]}
+        choice = body["choices"][0]
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            data = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+            return f"data: {json.dumps(data)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        if choice["message"].get("tool_calls"):
+            yield chunk({"tool_calls": [{"index": i, **tc} for i, tc in enumerate(choice["message"]["tool_calls"])]})
+        for word in _words(body):
+            await asyncio.sleep(self.token_ms / 1000.0)
+            yield chunk({"content": word})
+        yield chunk({}, choice["finish_reason"], x_groq={"usage": body["usage"]})
+        yield "data: [DONE]\n\n"
+
+    def app(self) -> FastAPI:
+        app = FastAPI(title="Fake Groq")
+
+        async def chat_completions(request: Request):
+            payload = await request.json()
+            status, body, headers = await self.complete(payload)
+            if status == 200 and payload.get("stream"):
+                return StreamingResponse(self._stream(body), media_type="text/event-stream", headers=headers)
+            if status == 200:
+                await asyncio.sleep(self.token_ms / 1000.0 * len(_words(body)))
+            return JSONResponse(body, status_code=status, headers=headers)
+
+        # Groq SDK path, plus the plain OpenAI / Ollama-compatible one
+        app.add_api_route("/openai/v1/chat/completions", chat_completions, methods=["POST"])
+        app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+        app.add_api_route("/stats", lambda: self.stats, methods=["GET"])
+        app.add_api_route("/stats/reset", lambda: self.reset() or {"ok": True}, methods=["POST"])
+        return app
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Fake .NET backend (/api/ai/*)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _ok(data: Any, message: str = "") -> dict:
+    return {"success": True, "message": message, "data": data}
+
+
+def _fail(status: int, message: str) -> JSONResponse:
+    return JSONResponse({"success": False, "message": message, "data": None}, status_code=status)
+
+
+class FakeBackend:
+    def __init__(self, catalog: Sequence[Dict[str, Any]], latency_ms: float = 80,
+                 jitter_ms: float = 30, slow_ms: float = 300):
+        self.products   = {p["_id"]: p for p in catalog}
+        self.latency_ms = latency_ms
+        self.jitter_ms  = jitter_ms
+        self.slow_ms    = slow_ms       # extra for place_order (transaction + stock update)
+        self.carts:  Dict[str, Dict[str, int]] = {}
+        self.orders: Dict[str, List[dict]] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        self.stats: Dict[str, int] = {}
+
+    def _user(self, request: Request) -> str:
+        return request.headers.get("authorization", "anon")
+
+    def _cart(self, user: str) -> dict:
+        items = []
+        for pid, qty in self.carts.get(user, {}).items():
+            p = self.products.get(pid, {})
+            price = float(p.get("price", 0))
+            items.append({"productId": pid, "productName": p.get("name", "?"),
+                          "quantity": qty, "price": price, "subtotal": price * qty})
+        return {"items": items, "isEmpty": not items, "totalItems": sum(i["quantity"] for i in items),
+                "total": round(sum(i["subtotal"] for i in items), 2)}
+
+    @staticmethod
+    def _address(user: str) -> dict:
+        return {"id": hashlib.sha1(user.encode("utf-8")).hexdigest()[:24], "label": "Home",
+                "fullAddress": "12 MG Road, Bengaluru 560001", "city": "Bengaluru", "isDefault": True}
+
+    def app(self) -> FastAPI:
+        app = FastAPI(title="Fake ShopAI backend")
+
+        @app.middleware("http")
+        async def latency(request: Request, call_next):
+            if request.url.path.startswith("/api/ai/"):
+                extra = self.slow_ms if request.url.path.endswith("/orders/place") else 0
+                await _sleep_ms(self.latency_ms + extra, self.jitter_ms)
+                key = f"{request.method} {re.sub(r'[0-9a-f]{24}', '{id}', request.url.path)}"
+                self.stats[key] = self.stats.get(key, 0) + 1
+            return await call_next(request)
+
+        @app.get("/api/ai/context")
+        async def context(request: Request):
+            user = self._user(request)
+            return _ok({"userId": user[-12:], "userName": "Load Test", "cart": self._cart(user),
+                        "addresses": [self._address(user)], "defaultAddress": self._address(user),
+                        "recentOrders": self.orders.get(user, [])[:5]})
+
+        @app.get("/api/ai/products/search")
+        async def search(q: str = "", topK: int = 5):
+            words = set(re.findall(r"[a-z0-9]+", q.lower()))
+            hits = [p for p in self.products.values()
+                    if words & set(re.findall(r"[a-z0-9]+", p["name"].lower()))]
+            return _ok([{**p, "id": p["_id"]} for p in hits[:topK]])
+
+        @app.get("/api/ai/products/{pid}")
+        async def product(pid: str):
+            p = self.products.get(pid)
+            return _ok({**p, "id": pid}) if p else _fail(404, "Product not found")
+
+        @app.post("/api/ai/products/compare")
+        async def compare(body: dict):
+            products = [{**self.products[i], "id": i} for i in body.get("productIds", []) if i in self.products]
+            return _ok({"products": products, "highlights": []})
+
+        @app.get("/api/ai/cart")
+        async def cart(request: Request):
+            return _ok(self._cart(self._user(request)))
+
+        @app.post("/api/ai/cart/add")
+        async def cart_add(request: Request, body: dict):
+            pid = body.get("productId")
+            if pid not in self.products:
+                return _fail(404, "Product not found")
+            cart = self.carts.setdefault(self._user(request), {})
+            cart[pid] = cart.get(pid, 0) + int(body.get("quantity") or 1)
+            return _ok(self._cart(self._user(request)), "Added to cart")
+
+        @app.put("/api/ai/cart/update/{pid}")
+        async def cart_update(request: Request, pid: str, qty: int = 1):
+            self.carts.setdefault(self._user(request), {})[pid] = qty
+            return _ok(self._cart(self._user(request)))
+
+        @app.delete("/api/ai/cart/remove/{pid}")
+        async def cart_remove(request: Request, pid: str):
+            self.carts.get(self._user(request), {}).pop(pid, None)
+            return _ok(self._cart(self._user(request)))
+
+        @app.delete("/api/ai/cart/clear")
+        async def cart_clear(request: Request):
+            self.carts.pop(self._user(request), None)
+            return _ok(self._cart(self._user(request)))
+
+        @app.get("/api/ai/orders")
+        async def orders(request: Request):
+            return _ok(self.orders.get(self._user(request), []))
+
+        @app.get("/api/ai/orders/{oid}")
+        async def order(request: Request, oid: str):
+            for o in self.orders.get(self._user(request), []):
+                if o["orderId"] == oid:
+                    return _ok(o)
+            return _fail(404, "Order not found")
+
+        @app.post("/api/ai/orders/place")
+        async def place(request: Request):
+            user = self._user(request)
+            cart = self._cart(user)
+            if cart["isEmpty"]:
+                # Keep checkout scripts meaningful: seed one item, like a returning shopper
+                self.carts[user] = {next(iter(self.products)): 1}
+                cart = self._cart(user)
+            order = {"orderId": uuid.uuid4().hex[:24], "orderNumber": f"ORD-{random.randint(10000, 99999)}",
+                     "status": "Pending", "totalAmount": cart["total"], "items": cart["items"],
+                     "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+            self.orders.setdefault(user, []).insert(0, order)
+            self.carts.pop(user, None)
+            return _ok(order, "Order placed")
+
+        @app.post("/api/ai/orders/{oid}/cancel")
+        async def cancel(request: Request, oid: str):
+            for o in self.orders.get(self._user(request), []):
+                if o["orderId"] == oid:
+                    o["status"] = "Cancelled"
+                    return _ok(o, "Order cancelled")
+            return _fail(404, "Order not found")
+
+        @app.get("/api/ai/addresses")
+        async def addresses(request: Request):
+            return _ok([self._address(self._user(request))])
+
+        @app.get("/api/ai/addresses/default")
+        async def default_address(request: Request):
+            return _ok(self._address(self._user(request)))
+
+        app.add_api_route("/stats", lambda: self.stats, methods=["GET"])
+        app.add_api_route("/stats/reset", lambda: self.reset() or {"ok": True}, methods=["POST"])
+        return app
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Fake Redis (RESP stand-in for RATE_LIMIT_BACKEND=redis)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class FakeRedis:
+    """
+    The handful of Redis commands rate_limit.RedisBackend sends (PING, AUTH,
+    SELECT, GET, INCRBY, PEXPIRE, DEL, FLUSHDB), over real RESP on a TCP
+    port, with key expiry. One dict for all databases; enough to run several
+    agent replicas against one quota store.
+    """
+
+    def __init__(self):
+        self.data: Dict[bytes, int] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.commands = 0
+
+    def _live(self, key: bytes) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _run(self, cmd: List[bytes]) -> bytes:
+        self.commands += 1
+        name, args = cmd[0].upper(), cmd[1:]
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name in (b"AUTH", b"SELECT"):
+            return b"+OK\r\n"
+        if name == b"GET":
+            if not self._live(args[0]):
+                return b"$-1\r\n"
+            value = str(self.data[args[0]]).encode()
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == b"INCRBY":
+            value = (self.data[args[0]] if self._live(args[0]) else 0) + int(args[1])
+            self.data[args[0]] = value
+            return b":%d\r\n" % value
+        if name == b"PEXPIRE":
+            if not self._live(args[0]):
+                return b":0\r\n"
+            self.expires[args[0]] = time.monotonic() + int(args[1]) / 1000.0
+            return b":1\r\n"
+        if name == b"DEL":
+            removed = sum(1 for k in args if self._live(k) and self.data.pop(k, None) is not None)
+            return b":%d\r\n" % removed
+        if name == b"FLUSHDB":
+            self.data.clear()
+            self.expires.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                n = int(line[1:-2])
+                cmd = []
+                for _ in range(n):
+                    size = int((await reader.readline())[1:-2])
+                    cmd.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(self._run(cmd))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 6379) -> None:
+        server = await asyncio.start_server(self._client, host, port)
+        async with server:
+            await server.serve_forever()
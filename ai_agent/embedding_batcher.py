@@ -0,0 +1,137 @@
+"""
+embedding_batcher.py
+In-process micro-batching in front of the embedding model.
+
+Concurrent /search calls each used to run model.encode() on a single string,
+so the CPU executed one tiny forward pass after another. The batcher gathers
+queries that arrive within a short window (EMBED_BATCH_MAX_WAIT_MS) up to
+EMBED_BATCH_MAX_SIZE, encodes them in ONE batched call, and hands each vector
+back to the thread that asked for it.
+
+Callers are plain threads (search runs via asyncio.to_thread), so the
+hand-off uses concurrent.futures.Future — no event loop required.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BATCHING_ENABLED     = os.getenv("EMBED_BATCHING", "true").lower() in ("1", "true", "yes")
+BATCH_MAX_SIZE       = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS    = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "4"))
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """
+    Single worker thread that drains a queue of (text, Future) pairs into
+    batched model.encode() calls. Identical texts within one batch are
+    encoded once.
+    """
+
+    def __init__(self, model,
+                 max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.model          = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait       = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock  = threading.Lock()
+        self.batches        = 0
+        self.items          = 0
+        self.largest_batch  = 0
+
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+        logger.info("EmbeddingBatcher ready: max_batch=%d max_wait=%.1fms",
+                    self.max_batch_size, self.max_wait * 1000)
+
+    # ── Public API ───────────────────────────────────────────────────────────
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def encode(self, text: str) -> np.ndarray:
+        """Blocking: returns the vector for one text once its batch has run."""
+        return self.submit(text).result()
+
+    def encode_many(self, texts: Sequence[str]) -> List[np.ndarray]:
+        """Blocking: queue several texts at once (they usually share a batch)."""
+        futures = [self.submit(t) for t in texts]
+        return [f.result() for f in futures]
+
+    def close(self) -> None:
+        self._queue.put(_STOP)
+        self._worker.join(timeout=5)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches":        self.batches,
+                "items":          self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "largest_batch":  self.largest_batch,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms":    self.max_wait * 1000,
+            }
+
+    # ── Worker ───────────────────────────────────────────────────────────────
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+
+            # Encode each distinct text once
+            unique: List[str] = []
+            slot = {}
+            for text, _ in batch:
+                if text not in slot:
+                    slot[text] = len(unique)
+                    unique.append(text)
+
+            try:
+                vectors = self.model.encode(unique, batch_size=len(unique))
+            except Exception as e:
+                logger.error("Batched encode failed (%d texts): %s", len(unique), e)
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            for text, fut in batch:
+                fut.set_result(vectors[slot[text]])
+
+            with self._lock:
+                self.batches += 1
+                self.items   += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
@@ -0,0 +1,128 @@
+"""
+embedding_cache.py
+Bounded, thread-safe cache for query embeddings.
+
+Repeated queries ("wireless earphones", "iphone under 80000") are common from
+both the chat agent and the .NET SearchController. Caching the vector means a
+popular query skips the transformer forward pass completely.
+
+  - Keyed on (model name, normalised query) — lower-cased, whitespace collapsed
+  - LRU eviction, plus a per-entry TTL
+  - Hard caps on entry count AND total bytes held
+  - Hit / miss / eviction counters for /health
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CACHE_ENABLED     = os.getenv("EMBED_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES   = int(float(os.getenv("EMBED_CACHE_MAX_MB", "32")) * 1024 * 1024)
+CACHE_TTL_SECONDS = float(os.getenv("EMBED_CACHE_TTL", "3600"))
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form used for cache keys: lower-case, single spaces."""
+    return " ".join((query or "").lower().split())
+
+
+class EmbeddingCache:
+    """
+    LRU + TTL cache of query vectors.
+    Values are stored as read-only float32 arrays so callers can never
+    mutate a shared entry.
+    """
+
+    def __init__(self,
+                 max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES,
+                 ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        # key -> (vector, expires_at, size_bytes)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock  = threading.Lock()
+
+        self.hits        = 0
+        self.misses      = 0
+        self.evictions   = 0
+        self.expirations = 0
+
+    # ── Public API ───────────────────────────────────────────────────────────
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        key = (model_name, normalize_query(query))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            vector, expires_at, size = entry
+            if expires_at <= now:
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name: str, query: str, vector) -> None:
+        key = (model_name, normalize_query(query))
+        arr = np.asarray(vector, dtype=np.float32).copy()
+        arr.setflags(write=False)
+        size = arr.nbytes + sys.getsizeof(key[1])
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (arr, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":     len(self._entries),
+                "bytes":       self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes":   self.max_bytes,
+                "hits":        self.hits,
+                "misses":      self.misses,
+                "hit_rate":    round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions":   self.evictions,
+                "expirations": self.expirations,
+            }
+
+    # ── Internal ─────────────────────────────────────────────────────────────
+
+    def _remove(self, key, size: int) -> None:
+        del self._entries[key]
+        self._bytes -= size
@@ -0,0 +1,411 @@
+"""
+embedding_pipeline.py
+Incremental, resumable, parallel embedding pipeline for the products collection.
+Replaces the one-shot generate_embeddings.py script.
+
+  - Streams products with a cursor sorted by _id (never loads the catalog)
+  - Skips products whose embedding text is unchanged: a hash of
+    (model + encoder backend, text) is stored next to the vector as `embeddingHash`
+  - Encodes in large batches; --workers N spreads batches over a process pool
+  - Writes back with bulk_write(UpdateOne...), unordered
+  - Checkpoints the last fully written _id, so a crash resumes where it stopped
+  - Maintains the $vectorSearch filter fields (`price_double`, `category_key`)
+    next to every vector; unchanged products missing them get a cheap
+    metadata-only write instead of a re-encode
+
+Usage (from ai_agent/):
+    python embedding_pipeline.py                 # embed new / changed products
+    python embedding_pipeline.py --force         # re-embed everything
+    python embedding_pipeline.py --workers 4 --batch-size 1024
+    python embedding_pipeline.py --dry-run       # preview texts, write nothing
+    python embedding_pipeline.py --reset         # ignore an old checkpoint
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from bson import json_util
+from bson.decimal128 import Decimal128
+
+from encoders import encoder_id, get_encoder
+from search_cache import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────
+# CONFIG
+# ─────────────────────────────────────────
+MONGO_URI        = os.getenv("MONGO_URI")
+DB_NAME          = os.getenv("DB_NAME", "ECommerceDB")
+COLLECTION_NAME  = "products"
+BATCH_SIZE       = int(os.getenv("EMBED_PIPELINE_BATCH_SIZE", "512"))
+CHECKPOINT_PATH  = os.getenv("EMBED_PIPELINE_CHECKPOINT", ".embedding_checkpoint.json")
+
+# Fields get_text_to_embed() reads — the projection AND the watch list for
+# anything that needs to know when an embedding has gone stale.
+EMBED_SOURCE_FIELDS = ("name", "brand", "description", "category", "price", "specifications")
+
+# Denormalised copies of price / category that the Atlas vector index declares
+# as `filter` fields (see atlas_vector_index.json). Decimal128 and the
+# string-or-object category can't be pre-filtered on directly.
+FILTER_FIELDS = ("price_double", "category_key")
+
+# What the pipeline and the watcher read per product
+SOURCE_PROJECTION = {"_id": 1, "embeddingHash": 1,
+                     **{f: 1 for f in EMBED_SOURCE_FIELDS + FILTER_FIELDS}}
+
+
+# ─────────────────────────────────────────
+# TEXT BUILDING
+# ─────────────────────────────────────────
+
+def extract_decimal(value) -> str:
+    """Convert MongoDB Decimal128 or plain number to a clean string."""
+    if value is None:
+        return ""
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, dict) and "$numberDecimal" in value:
+        return str(value["$numberDecimal"])
+    return str(value)
+
+
+def extract_category(category) -> str:
+    """Handle category as string or { _id: 0, name: 'Mobiles' } object."""
+    if not category:
+        return ""
+    if isinstance(category, str):
+        return category
+    if isinstance(category, dict):
+        return category.get("name", "")
+    return str(category)
+
+
+def extract_specifications(specs) -> str:
+    """
+    Convert specifications dict to a readable sentence.
+    e.g. { storage: "128GB", color: "Black" } → "128GB Black"
+    """
+    if not specs or not isinstance(specs, dict):
+        return ""
+    parts = []
+    for key, val in specs.items():
+        if val:
+            parts.append(str(val))
+    return " ".join(parts)
+
+
+def get_text_to_embed(product: dict) -> str:
+    """
+    Build a rich, context-dense text string for embedding.
+
+    Template:
+        {name} by {brand}. Category: {category}. Price: ₹{price}.
+        {description}. Specs: {specifications}.
+
+    Why each field matters:
+    - name        → core identity, most searches match this
+    - brand       → "Apple phone", "Samsung TV", etc.
+    - category    → "mobile phone", "laptop", etc.
+    - price       → "phone under 80000" type queries
+    - description → detailed features, use cases
+    - specs       → storage, color, display, battery (very search-relevant)
+    - brand again → reinforcing brand boosts cosine similarity for brand queries
+    """
+    name        = (product.get("name") or "").strip()
+    brand       = (product.get("brand") or "").strip()
+    category    = extract_category(product.get("category", ""))
+    price       = extract_decimal(product.get("price"))
+    description = (product.get("description") or "").strip()
+    specs       = extract_specifications(product.get("specifications"))
+
+    parts = []
+
+    if name:
+        parts.append(name)
+    if brand:
+        parts.append(f"by {brand}")
+    if category:
+        parts.append(f"Category: {category}")
+    if price:
+        parts.append(f"Price: Rs {price}")
+    if description:
+        parts.append(description)
+    if specs:
+        parts.append(f"Specifications: {specs}")
+    if brand:
+        # Repeat brand at end — reinforces brand similarity scoring
+        parts.append(f"Brand: {brand}")
+
+    text = ". ".join(parts)
+
+    # Truncate to 512 chars — all-MiniLM-L6-v2 has 256 token limit,
+    # beyond which it truncates anyway. 512 chars ≈ 120 tokens safely.
+    return text[:512]
+
+
+def embedding_hash(text: str, model_name: Optional[str] = None) -> str:
+    """Fingerprint of the exact input (and encoder) that produced a vector."""
+    model_name = model_name or encoder_id()
+    return hashlib.sha1(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def category_key(category) -> str:
+    """Case-folded category name — the exact-match key for the category filter."""
+    return extract_category(category).strip().lower()
+
+
+def filter_fields(product: dict) -> dict:
+    """Values for FILTER_FIELDS derived from the product's source fields."""
+    try:
+        price = float(extract_decimal(product.get("price")) or 0)
+    except ValueError:
+        price = 0.0
+    return {
+        "price_double": price,
+        "category_key": category_key(product.get("category")),
+    }
+
+
+def build_update(product: dict, vector, text_hash: str) -> dict:
+    """The $set written next to every freshly computed vector."""
+    return {
+        "embedding":     [float(x) for x in vector],
+        "embeddingHash": text_hash,
+        **filter_fields(product),
+    }
+
+
+# ─────────────────────────────────────────
+# ENCODERS (thread or process pool)
+# ─────────────────────────────────────────
+_worker_model = None
+
+
+def _load_model():
+    # Same EMBED_BACKEND as the search service, so index and query vectors match
+    return get_encoder()
+
+
+def _init_worker():
+    """ProcessPoolExecutor initializer — one model per worker process."""
+    global _worker_model
+    _worker_model = _load_model()
+
+
+def _worker_encode(texts: List[str]):
+    return _worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+
+# ─────────────────────────────────────────
+# CHECKPOINT
+# ─────────────────────────────────────────
+
+def load_checkpoint(path: str) -> Optional[dict]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json_util.loads(f.read())
+
+
+def save_checkpoint(path: str, state: dict) -> None:
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json_util.dumps(state))
+    os.replace(tmp, path)   # atomic — never leaves a torn checkpoint
+
+
+# ─────────────────────────────────────────
+# PIPELINE
+# ─────────────────────────────────────────
+
+def _chunks(cursor, size: int) -> Iterator[List[dict]]:
+    chunk: List[dict] = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def plan_batch(docs: List[dict], force: bool = False):
+    """
+    Split a batch into (doc, hash) pairs that need encoding + their texts,
+    and (doc, fields) pairs whose vector is current but whose filter fields
+    are missing or stale.
+    """
+    todo, texts, refresh = [], [], []
+    for doc in docs:
+        text = get_text_to_embed(doc)
+        h = embedding_hash(text)
+        if force or doc.get("embeddingHash") != h:
+            todo.append((doc, h))
+            texts.append(text)
+            continue
+        fields = filter_fields(doc)
+        if any(doc.get(k) != v for k, v in fields.items()):
+            refresh.append((doc, fields))
+    return todo, texts, refresh
+
+
+def write_batch(collection, todo: list, vectors, refresh: list = ()) -> None:
+    """One unordered bulk_write for a whole batch of fresh vectors + field refreshes."""
+    from pymongo import UpdateOne
+
+    ops = [UpdateOne({"_id": doc["_id"]}, {"$set": build_update(doc, vec, h)})
+           for (doc, h), vec in zip(todo, vectors)]
+    ops += [UpdateOne({"_id": doc["_id"]}, {"$set": fields}) for doc, fields in refresh]
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+
+
+def embed_documents(collection, docs: List[dict], encode: Callable[[List[str]], Any],
+                    force: bool = False) -> Dict[str, int]:
+    """
+    Hash-check, encode and bulk-write one batch of product documents
+    synchronously. Used by callers that already batch on their own.
+    """
+    todo, texts, refresh = plan_batch(docs, force)
+    write_batch(collection, todo, encode(texts) if texts else [], refresh)
+    return {"embedded": len(texts), "skipped": len(docs) - len(texts), "refreshed": len(refresh)}
+
+
+class EmbeddingPipeline:
+    """
+    Cursor → hash filter → batched encode (pool) → bulk_write, with a FIFO of
+    in-flight batches so encoding of batch N+1 overlaps the write of batch N.
+    Batches complete in cursor order, so the checkpoint only ever moves forward.
+    """
+
+    def __init__(self, collection, batch_size: int = BATCH_SIZE, workers: int = 1,
+                 force: bool = False, checkpoint_path: Optional[str] = CHECKPOINT_PATH):
+        self.collection      = collection
+        self.batch_size      = max(1, batch_size)
+        self.workers         = max(1, workers)
+        self.force           = force
+        self.checkpoint_path = checkpoint_path
+        self.stats = {"processed": 0, "embedded": 0, "skipped": 0, "refreshed": 0}
+
+    def _executor(self):
+        """Return (executor, encode function) for the configured worker count."""
+        if self.workers > 1:
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker), _worker_encode
+        # Single encoder thread: the model releases the GIL, so Mongo I/O overlaps it
+        model = _load_model()
+        encode = lambda texts: model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+        return ThreadPoolExecutor(max_workers=1), encode
+
+    def run(self) -> Dict[str, int]:
+        query: Dict[str, Any] = {}
+        state = load_checkpoint(self.checkpoint_path)
+        if state and state.get("last_id") is not None:
+            query["_id"] = {"$gt": state["last_id"]}
+            self.stats.update({k: state.get(k, 0) for k in self.stats})
+            logger.info("Resuming after _id=%s (%d already processed)",
+                        state["last_id"], self.stats["processed"])
+
+        cursor = (self.collection.find(query, SOURCE_PROJECTION)
+                  .sort("_id", 1)
+                  .batch_size(self.batch_size))
+
+        started   = time.perf_counter()
+        in_flight: deque = deque()
+        max_in_flight = self.workers * 2
+
+        pool, encode_fn = self._executor()
+        with pool:
+            for chunk in _chunks(cursor, self.batch_size):
+                todo, texts, refresh = plan_batch(chunk, self.force)
+                if texts:
+                    future = pool.submit(encode_fn, texts)
+                else:
+                    future = Future()
+                    future.set_result([])
+                in_flight.append((future, todo, refresh, chunk[-1]["_id"], len(chunk)))
+
+                while len(in_flight) >= max_in_flight:
+                    self._drain(in_flight.popleft(), started)
+
+            while in_flight:
+                self._drain(in_flight.popleft(), started)
+
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)   # finished cleanly — next run starts fresh
+        if self.stats["embedded"] or self.stats["refreshed"]:
+            # Invalidate every cached search result across all API replicas
+            bump_catalog_version(self.collection.database)
+        return self.stats
+
+    def _drain(self, item, started: float) -> None:
+        future, todo, refresh, last_id, size = item
+        write_batch(self.collection, todo, future.result(), refresh)
+
+        self.stats["processed"] += size
+        self.stats["embedded"]  += len(todo)
+        self.stats["skipped"]   += size - len(todo)
+        self.stats["refreshed"] += len(refresh)
+        save_checkpoint(self.checkpoint_path, {"last_id": last_id, **self.stats})
+
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        logger.info("processed=%d embedded=%d skipped=%d refreshed=%d (%.0f docs/s)",
+                    self.stats["processed"], self.stats["embedded"], self.stats["skipped"],
+                    self.stats["refreshed"], self.stats["processed"] / elapsed)
+
+
+# ─────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, int]:
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    parser = argparse.ArgumentParser(description="Embed products into MongoDB")
+    parser.add_argument("--force", action="store_true", help="re-embed even if the text hash is unchanged")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="encoder processes (1 = in-process thread)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--reset", action="store_true", help="discard an existing checkpoint first")
+    parser.add_argument("--dry-run", action="store_true", help="preview embedding text and exit")
+    args = parser.parse_args(argv)
+
+    client = MongoClient(os.getenv("MONGO_URI", MONGO_URI))
+    collection = client[os.getenv("DB_NAME", DB_NAME)][COLLECTION_NAME]
+    logger.info("Connected to MongoDB → %s.%s", collection.database.name, COLLECTION_NAME)
+
+    try:
+        if args.dry_run:
+            for p in collection.find({}, {f: 1 for f in EMBED_SOURCE_FIELDS}).limit(3):
+                print(f"  [{p.get('name', 'Unknown')}]\n  → {get_text_to_embed(p)}\n")
+            return {}
+
+        if args.reset and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+
+        pipeline = EmbeddingPipeline(collection, batch_size=args.batch_size, workers=args.workers,
+                                     force=args.force, checkpoint_path=args.checkpoint)
+        stats = pipeline.run()
+        logger.info("✅ Done: %s", json.dumps(stats))
+        return stats
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+embedding_watcher.py
+Long-running worker that keeps product embeddings fresh from a change stream.
+
+New or edited products used to stay missing / stale in $vectorSearch until
+someone re-ran the embedding script by hand. This worker tails `products`:
+
+  - Reacts to inserts, replaces, and updates that touch a field
+    get_text_to_embed() depends on (EMBED_SOURCE_FIELDS). Its own
+    `embedding` writes are ignored, so it never feeds on itself.
+  - Debounces: changed _ids are collected for EMBED_WATCH_DEBOUNCE_MS (or until
+    EMBED_WATCH_MAX_BATCH), then re-read in ONE find() so a burst of edits to
+    the same product is embedded once, from its latest state.
+  - Re-embeds through embedding_pipeline.embed_documents (hash-skip +
+    bulk_write), then persists the resume token — at-least-once delivery.
+  - Any product change (stock, deletes, ...) bumps the catalog version so
+    cached search results are invalidated (search_cache.py).
+  - Tracks throughput and lag (cluster time of the oldest change in a batch
+    → vector written) via stats().
+
+Change streams need a replica set (Atlas, or `mongod --replSet rs0` locally).
+The collection and the encoder are injected, so tests can drive
+process_changes() with hand-built change events instead of a live server.
+
+Usage (from ai_agent/):
+    python embedding_watcher.py --metrics-port 9108
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from bson import json_util
+
+from embedding_pipeline import EMBED_SOURCE_FIELDS, FILTER_FIELDS, SOURCE_PROJECTION, embed_documents
+from search_cache import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DEBOUNCE_MS  = int(os.getenv("EMBED_WATCH_DEBOUNCE_MS", "500"))
+MAX_BATCH    = int(os.getenv("EMBED_WATCH_MAX_BATCH", "256"))
+RESUME_PATH  = os.getenv("EMBED_WATCH_RESUME_PATH", ".embedding_watcher_resume.json")
+
+
+_OWN_FIELDS = {"embedding", "embeddingHash", *FILTER_FIELDS}
+
+
+def _changed_roots(change: dict) -> set:
+    desc    = change.get("updateDescription") or {}
+    changed = list((desc.get("updatedFields") or {}).keys()) + list(desc.get("removedFields") or [])
+    # "specifications.color" counts as "specifications"
+    return {path.split(".", 1)[0] for path in changed}
+
+
+def _is_own_write(change: dict) -> bool:
+    """An update that only wrote vectors — i.e. this worker or the pipeline."""
+    return change.get("operationType") == "update" and _changed_roots(change) <= _OWN_FIELDS
+
+
+def _touches_embedding_fields(change: dict) -> bool:
+    """True when a change event can alter get_text_to_embed() output."""
+    op = change.get("operationType")
+    if op in ("insert", "replace"):
+        return True
+    if op != "update":
+        return False
+    return bool(_changed_roots(change) & set(EMBED_SOURCE_FIELDS))
+
+
+class EmbeddingWatcher:
+    """Change-stream → debounce → batch re-embed → bulk write."""
+
+    def __init__(self, collection, encode: Callable[[List[str]], Any],
+                 debounce_ms: int = DEBOUNCE_MS, max_batch: int = MAX_BATCH,
+                 resume_path: Optional[str] = RESUME_PATH):
+        self.collection  = collection
+        self.encode      = encode
+        self.debounce    = max(0, debounce_ms) / 1000.0
+        self.max_batch   = max(1, max_batch)
+        self.resume_path = resume_path
+
+        self._pending: Dict[Any, float] = {}    # _id -> cluster time (epoch s)
+        self._pending_since: Optional[float] = None
+        self._catalog_dirty = False
+        self._stop  = threading.Event()
+        self._lock  = threading.Lock()
+        self._saved_token = None
+        self._started = time.time()
+
+        self.events_seen     = 0
+        self.events_relevant = 0
+        self.docs_embedded   = 0
+        self.docs_skipped    = 0
+        self.batches         = 0
+        self.errors          = 0
+        self.last_lag_s: Optional[float] = None
+        self.max_lag_s       = 0.0
+        self.last_flush_at: Optional[float] = None
+
+    # ── Control ──────────────────────────────────────────────────────────────
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        """Tail the collection until stop() is called. Reconnects on errors."""
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+            # Our own vector writes still emit update events — don't ship the floats
+            {"$project": {"updateDescription.updatedFields.embedding": 0,
+                          "fullDocument": 0}},
+        ]
+        while not self._stop.is_set():
+            token = self._load_resume_token()
+            try:
+                with self.collection.watch(pipeline, resume_after=token,
+                                           max_await_time_ms=max(50, int(self.debounce * 1000))) as stream:
+                    logger.info("Embedding watcher tailing %s (resume=%s)",
+                                self.collection.full_name, token is not None)
+                    while not self._stop.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            self._observe(change)
+                        if self._due():
+                            self.flush(stream.resume_token)
+                        elif change is None and not self._pending and not self._catalog_dirty:
+                            # Idle: checkpoint so a restart doesn't replay skipped events
+                            self._save_resume_token(stream.resume_token)
+            except Exception as e:
+                self.errors += 1
+                logger.error("Embedding watcher stream error: %s — reconnecting", e)
+                self._stop.wait(2.0)
+        logger.info("Embedding watcher stopped")
+
+    def start_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, name="embedding-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    # ── Event handling ───────────────────────────────────────────────────────
+
+    def process_changes(self, changes: Iterable[dict]) -> Dict[str, int]:
+        """Feed change events directly and flush once (test / replay entry point)."""
+        for change in changes:
+            self._observe(change)
+        return self.flush(None)
+
+    def _observe(self, change: dict) -> None:
+        self.events_seen += 1
+        if _is_own_write(change):
+            return
+        with self._lock:
+            self._catalog_dirty = True
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+        if not _touches_embedding_fields(change):
+            return
+        self.events_relevant += 1
+        doc_id = (change.get("documentKey") or {}).get("_id")
+        if doc_id is None:
+            return
+        ts = change.get("clusterTime")
+        cluster_s = float(ts.time) if hasattr(ts, "time") else time.time()
+        with self._lock:
+            self._pending.setdefault(doc_id, cluster_s)
+
+    def _due(self) -> bool:
+        with self._lock:
+            if not self._pending and not self._catalog_dirty:
+                return False
+            return (len(self._pending) >= self.max_batch
+                    or time.monotonic() - self._pending_since >= self.debounce)
+
+    def flush(self, resume_token) -> Dict[str, int]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            dirty, self._catalog_dirty = self._catalog_dirty, False
+            self._pending_since = None
+        if not pending:
+            if dirty:
+                bump_catalog_version(self.collection.database)
+                self._save_resume_token(resume_token)
+            return {"embedded": 0, "skipped": 0}
+
+        ids  = list(pending.keys())
+        docs = list(self.collection.find({"_id": {"$in": ids}}, SOURCE_PROJECTION))
+        result = embed_documents(self.collection, docs, self.encode)
+        bump_catalog_version(self.collection.database)
+
+        now = time.time()
+        lag = now - min(pending.values())
+        self.batches       += 1
+        self.docs_embedded += result["embedded"]
+        self.docs_skipped  += result["skipped"]
+        self.last_lag_s     = round(lag, 3)
+        self.max_lag_s      = max(self.max_lag_s, self.last_lag_s)
+        self.last_flush_at  = now
+        self._save_resume_token(resume_token)
+
+        logger.info("Watcher batch: %d changed ids → embedded=%d skipped=%d lag=%.2fs",
+                    len(ids), result["embedded"], result["skipped"], lag)
+        return result
+
+    # ── Resume token ─────────────────────────────────────────────────────────
+
+    def _load_resume_token(self):
+        if not self.resume_path or not os.path.exists(self.resume_path):
+            return None
+        with open(self.resume_path, encoding="utf-8") as f:
+            return json_util.loads(f.read())
+
+    def _save_resume_token(self, token) -> None:
+        if not self.resume_path or token is None or token == self._saved_token:
+            return
+        tmp = f"{self.resume_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json_util.dumps(token))
+        os.replace(tmp, self.resume_path)
+        self._saved_token = token
+
+    # ── Metrics ──────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = max(time.time() - self._started, 1e-6)
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "events_seen":        self.events_seen,
+            "events_relevant":    self.events_relevant,
+            "pending":            pending,
+            "batches":            self.batches,
+            "docs_embedded":      self.docs_embedded,
+            "docs_skipped":       self.docs_skipped,
+            "docs_per_sec":       round(self.docs_embedded / uptime, 3),
+            "last_lag_s":         self.last_lag_s,
+            "max_lag_s":          self.max_lag_s,
+            "last_flush_at":      self.last_flush_at,
+            "errors":             self.errors,
+        }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────────────────────────────────────
+def _serve_metrics(watcher: EmbeddingWatcher, port: int) -> None:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(watcher.stats()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="watcher-metrics", daemon=True).start()
+    logger.info("Watcher metrics on http://0.0.0.0:%d/", port)
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from embedding_pipeline import _load_model
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    parser = argparse.ArgumentParser(description="Live embedding updates from a change stream")
+    parser.add_argument("--debounce-ms", type=int, default=DEBOUNCE_MS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve stats() as JSON (0 = off)")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    coll   = client[os.getenv("DB_NAME", "ECommerceDB")]["products"]
+    model  = _load_model()
+    watcher = EmbeddingWatcher(
+        coll,
+        encode=lambda texts: model.encode(texts, batch_size=len(texts), show_progress_bar=False),
+        debounce_ms=args.debounce_ms,
+        max_batch=args.max_batch,
+    )
+    if args.metrics_port:
+        _serve_metrics(watcher, args.metrics_port)
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+    finally:
+        client.close()
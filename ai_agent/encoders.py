@@ -0,0 +1,212 @@
+"""
+encoders.py
+Pluggable sentence-embedding backends for all-MiniLM-L6-v2, chosen once at
+startup with EMBED_BACKEND:
+
+  - torch      SentenceTransformer in full-precision PyTorch (default)
+  - onnx       ONNX Runtime, fp32 graph — no torch import at all
+  - onnx-int8  ONNX Runtime, dynamically quantized int8 weights
+
+Every backend exposes the SentenceTransformer call shape the rest of the
+agent already uses:
+
+    encoder.encode("one query")            → float32 [D]
+    encoder.encode(["a", "b"], batch_size) → float32 [N, D]
+
+so EmbeddingBatcher, the embedding pipeline and the watcher work unchanged.
+The ONNX backends reproduce the model's pooling (attention-masked mean + L2
+normalise) and share one tokenizer instance per model directory.
+
+Vectors from different backends are close but not bit-identical, so the
+backend is part of the embedding fingerprint (encoder_id()): switching
+EMBED_BACKEND makes the pipeline re-embed the catalog, keeping index and
+query vectors from the same encoder. Check parity / speed with
+benchmarks/bench_encoders.py.
+
+ONNX model files come from the Hugging Face repo by default, or from
+EMBED_ONNX_DIR (model.onnx, model_int8.onnx, tokenizer.json), which can be
+prepared offline with:
+    python encoders.py export --out ./onnx_model
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MODEL_NAME         = "all-MiniLM-L6-v2"
+HF_REPO            = f"sentence-transformers/{MODEL_NAME}"
+EMBED_BACKEND      = os.getenv("EMBED_BACKEND", "torch").lower()    # torch | onnx | onnx-int8
+ONNX_DIR           = os.getenv("EMBED_ONNX_DIR", "")
+ONNX_THREADS       = int(os.getenv("EMBED_ONNX_THREADS", "0"))      # 0 = onnxruntime default
+MAX_SEQ_LENGTH     = 256                                            # all-MiniLM-L6-v2 limit
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Hub file names (sentence-transformers publishes these next to the weights)
+_HUB_FILES = {
+    "onnx":      "onnx/model.onnx",
+    "onnx-int8": "onnx/model_quint8_avx2.onnx",
+}
+# Names inside EMBED_ONNX_DIR (written by `python encoders.py export`)
+_LOCAL_FILES = {
+    "onnx":      "model.onnx",
+    "onnx-int8": "model_int8.onnx",
+}
+
+
+def encoder_id(backend: Optional[str] = None) -> str:
+    """
+    Identity of the vectors an encoder produces — used in embeddingHash and
+    the query embedding cache. torch keeps the bare model name so existing
+    hashes stay valid.
+    """
+    backend = (backend or EMBED_BACKEND).lower()
+    return MODEL_NAME if backend == "torch" else f"{MODEL_NAME}:{backend}"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Model files + shared tokenizer cache
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _resolve(local_name: str, hub_name: str) -> str:
+    if ONNX_DIR:
+        path = os.path.join(ONNX_DIR, local_name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} missing — run `python encoders.py export --out {ONNX_DIR}`")
+        return path
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(HF_REPO, hub_name)
+
+
+_tokenizers: Dict[str, object] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """One fast tokenizer per model location, shared by every ONNX encoder."""
+    path = _resolve("tokenizer.json", "tokenizer.json")
+    with _tokenizers_lock:
+        tok = _tokenizers.get(path)
+        if tok is None:
+            from tokenizers import Tokenizer
+            tok = Tokenizer.from_file(path)
+            tok.enable_truncation(max_length=MAX_SEQ_LENGTH)
+            tok.enable_padding(pad_id=0, pad_token="[PAD]")
+            _tokenizers[path] = tok
+        return tok
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ONNX Runtime encoder
+# ─────────────────────────────────────────────────────────────────────────────
+
+class OnnxEncoder:
+    """all-MiniLM-L6-v2 on ONNX Runtime: tokenize → transformer → mean pool → L2."""
+
+    def __init__(self, backend: str = "onnx"):
+        import onnxruntime as ort
+
+        self.backend = backend
+        self.model_path = _resolve(_LOCAL_FILES[backend], _HUB_FILES[backend])
+        self.tokenizer = get_tokenizer()
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            opts.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(self.model_path, sess_options=opts,
+                                            providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences: Union[str, Sequence[str]], batch_size: int = 32,
+               show_progress_bar: bool = False, **_) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts: List[str] = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        out = []
+        step = max(1, batch_size)
+        for start in range(0, len(texts), step):
+            out.append(self._encode_batch(texts[start:start + step]))
+        vectors = np.vstack(out)
+        return vectors[0] if single else vectors
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids  = np.asarray([e.ids for e in encodings], dtype=np.int64)
+        mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feed["token_type_ids"] = np.zeros_like(ids)
+
+        token_embeddings = self.session.run(None, feed)[0]           # [B, T, D]
+        weights = mask[..., None].astype(np.float32)
+        summed  = (token_embeddings * weights).sum(axis=1)
+        counts  = np.clip(weights.sum(axis=1), 1e-9, None)
+        pooled  = summed / counts
+        norms   = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Factory
+# ─────────────────────────────────────────────────────────────────────────────
+_encoders: Dict[str, object] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(backend: Optional[str] = None):
+    """Load (once per process) and return the encoder for a backend."""
+    backend = (backend or EMBED_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBED_BACKEND '{backend}' — expected one of {', '.join(BACKENDS)}")
+
+    with _encoders_lock:
+        encoder = _encoders.get(backend)
+        if encoder is not None:
+            return encoder
+        t0 = time.perf_counter()
+        if backend == "torch":
+            from sentence_transformers import SentenceTransformer
+            encoder = SentenceTransformer(MODEL_NAME)
+        else:
+            encoder = OnnxEncoder(backend)
+        _encoders[backend] = encoder
+        logger.info("✓ Encoder '%s' loaded (%.0f ms)", backend, (time.perf_counter() - t0) * 1000)
+        return encoder
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────────────────────────────────────
+def export(out_dir: str) -> None:
+    """Download the fp32 ONNX graph + tokenizer and write an int8 copy next to them."""
+    from huggingface_hub import hf_hub_download
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(out_dir, exist_ok=True)
+    shutil.copyfile(hf_hub_download(HF_REPO, "tokenizer.json"), os.path.join(out_dir, "tokenizer.json"))
+    fp32 = os.path.join(out_dir, _LOCAL_FILES["onnx"])
+    shutil.copyfile(hf_hub_download(HF_REPO, _HUB_FILES["onnx"]), fp32)
+    quantize_dynamic(fp32, os.path.join(out_dir, _LOCAL_FILES["onnx-int8"]), weight_type=QuantType.QInt8)
+    logger.info("✓ ONNX model exported to %s (set EMBED_ONNX_DIR=%s)", out_dir, out_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+    parser = argparse.ArgumentParser(description="Embedding encoder tools")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--out", default="./onnx_model", help="directory for model.onnx / model_int8.onnx")
+    args = parser.parse_args()
+    export(args.out)
@@ -0,0 +1,277 @@
+"""
+fast_path.py
+Deterministic router for trivial chat intents, in front of the Groq agent loop.
+
+"show my cart", "my orders" or "cancel order ORD-12345" used to cost a Groq
+tool-calling round trip plus a second completion just to phrase the answer.
+The router recognises such messages with anchored rules, runs the single
+tool directly (through the agent's normal tool path: validation, session
+cache, tracing, metrics) and renders a templated reply.
+
+  - Rules must match the WHOLE message (after stripping greetings and
+    politeness), so anything with extra intent ("show my cart and remove
+    the mouse") goes to the agent — low confidence always falls back
+  - Read intents also fall back when the tool fails; a mutating intent
+    (cancel_order) never does, so the agent can't repeat it
+  - FAST_PATH_INTENTS picks the intents. "cancel_order" (runs the
+    cancellation with no confirmation) and "search" (templated product list
+    instead of an LLM-written summary) are opt-in; cancel_order only takes a
+    plain imperative ("cancel order ORD-123"), never a question ("can I
+    cancel order ORD-123?"), which goes to the agent
+  - stats(): share of turns handled, per intent, and the estimated latency
+    saved — mean agent-loop vs fast-path time for the same action
+"""
+
+import os
+import re
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+FAST_PATH_INTENTS = {i.strip() for i in os.getenv("FAST_PATH_INTENTS", "view_cart,view_orders").split(",")
+                     if i.strip()}
+
+INTENT_ACTIONS = {          # intent → the agent `action` it replaces
+    "view_cart":    "get_cart",
+    "view_orders":  "get_orders",
+    "cancel_order": "cancel_order",
+    "search":       "search_products",
+}
+
+_FILLER_HEAD = re.compile(r"^(?:(?:hi|hey|hello|ok|okay|so|please|pls|plz|kindly|just|"
+                          r"can you|could you|would you|will you|can i|could i|i want to|i'd like to)\b[\s,!.]*)+")
+_FILLER_TAIL = re.compile(r"(?:[\s,]*\b(?:please|pls|plz|thanks|thank you|now|for me)\b)+$")
+
+_RULES: List[Tuple[str, "re.Pattern"]] = [
+    ("view_cart", re.compile(
+        r"(?:(?:show|view|see|check|open|display|get)\s+)?(?:me\s+)?(?:my\s+|the\s+)?(?:shopping\s+)?"
+        r"(?:cart|basket)(?:\s+(?:items|contents|details))?"
+        r"|what(?:'s| is| do i have)\s+in\s+(?:my|the)\s+(?:cart|basket)")),
+    ("view_orders", re.compile(
+        r"(?:(?:show|view|see|check|get|list|display)\s+)?(?:me\s+)?(?:all\s+)?(?:my\s+)?"
+        r"(?:past\s+|recent\s+|previous\s+)?(?:orders?(?:\s+(?:history|list|status))?|order\s+history)")),
+    ("cancel_order", re.compile(
+        r"cancel\s+(?:my\s+|the\s+)?order\s*(?:number\s+|no\.?\s*|#\s*)?(?P<ref>[a-z0-9][a-z0-9-]*)")),
+    ("search", re.compile(
+        r"(?:search(?:\s+for)?|find(?:\s+me)?|show\s+me|look(?:ing)?\s+for|i\s+need)\s+(?P<query>.+?)"
+        r"(?:\s+(?:under|below|less\s+than|within)\s+(?:rs\.?\s*|₹\s*|inr\s*)?(?P<max>\d[\d,]*k?))?")),
+]
+
+# Words that mean the search needs the agent (actions, comparisons, references to earlier turns)
+_SEARCH_STOPWORDS = {"cart", "order", "orders", "compare", "vs", "versus", "add", "buy", "remove", "checkout",
+                     "cancel", "address", "it", "this", "that", "them", "those", "these", "one", "ones", "same"}
+_SEARCH_MAX_WORDS = 6
+# Questions / requests ("can I…", "could you…", "…?") — never run a mutating intent on these
+_QUESTION_RE      = re.compile(r"\?|\b(?:can|could|would|will|should|shall|may|do|does)\s+(?:i|you|we)\b")
+_OBJECT_ID_RE     = re.compile(r"^[0-9a-f]{24}$")
+
+
+def normalise(text: str) -> str:
+    text = " ".join((text or "").lower().split())
+    text = text.rstrip("?!. ")
+    text = _FILLER_HEAD.sub("", text)
+    text = _FILLER_TAIL.sub("", text)
+    return text.strip(" ,")
+
+
+def format_inr(amount: Any) -> str:
+    """Rs. with Indian digit grouping: 149997 → Rs.1,49,997."""
+    try:
+        value = float(amount or 0)
+    except (TypeError, ValueError):
+        value = 0.0
+    whole, frac = divmod(round(abs(value), 2), 1)
+    digits = str(int(whole))
+    if len(digits) > 3:
+        head, tail = digits[:-3], digits[-3:]
+        head = ",".join(head[max(0, i - 2):i] for i in range(len(head), 0, -2)[::-1])
+        digits = f"{head},{tail}"
+    cents = f".{int(round(frac * 100)):02d}" if frac else ""
+    return f"{'-' if value < 0 else ''}Rs.{digits}{cents}"
+
+
+def _parse_price(raw: Optional[str]) -> Optional[float]:
+    if not raw:
+        return None
+    raw = raw.replace(",", "")
+    return float(raw[:-1]) * 1000 if raw.endswith("k") else float(raw)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Reply templates
+# ─────────────────────────────────────────────────────────────────────────────
+
+def render_cart(data: Dict[str, Any]) -> str:
+    items = (data or {}).get("items") or []
+    if not items:
+        return "Your cart is empty. Want me to find something for you? 🛒"
+    lines = [f"- **{i.get('productName', 'Item')}** × {i.get('quantity', 1)} — "
+             f"{format_inr(i.get('subtotal', float(i.get('price') or 0) * int(i.get('quantity') or 1)))}"
+             for i in items[:10]]
+    if len(items) > 10:
+        lines.append(f"- …and {len(items) - 10} more")
+    count = data.get("totalItems") or sum(int(i.get("quantity") or 1) for i in items)
+    total = data.get("total")
+    if total is None:
+        total = sum(float(i.get("subtotal") or 0) for i in items)
+    return ("Here's your cart 🛒\n" + "\n".join(lines) +
+            f"\n\n**Total: {format_inr(total)}** ({count} item{'s' if count != 1 else ''}). "
+            "Ready to checkout, or keep shopping?")
+
+
+def render_orders(orders: List[Dict[str, Any]]) -> str:
+    if not orders:
+        return "You haven't placed any orders yet. Want some recommendations to get started?"
+    lines = []
+    for o in orders[:5]:
+        date = str(o.get("createdAt") or "")[:10]
+        lines.append(f"- **{o.get('orderNumber', 'Order')}** — {o.get('status', 'Unknown')} — "
+                     f"{format_inr(o.get('totalAmount'))}" + (f" ({date})" if date else ""))
+    more = f"\n- …and {len(orders) - 5} older orders" if len(orders) > 5 else ""
+    return ("Your recent orders 📦\n" + "\n".join(lines) + more +
+            "\n\nWant details on one of them, or to cancel an order?")
+
+
+def render_search(query: str, products: List[Dict[str, Any]], max_price: Optional[float]) -> str:
+    within = f" under {format_inr(max_price)}" if max_price else ""
+    if not products:
+        return f"I couldn't find any {query}{within}. Try a different brand or a wider budget?"
+    lines = [f"- **{p.get('name')}** — {format_inr(p.get('price'))}"
+             + (f" ⭐ {p['rating']}" if p.get("rating") else "")
+             + ("" if p.get("isAvailable", True) else " (out of stock)")
+             for p in products[:5]]
+    return (f"Here are some {query}{within}:\n" + "\n".join(lines) +
+            "\n\nWant me to add one to your cart or compare a few?")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Router
+# ─────────────────────────────────────────────────────────────────────────────
+
+class FastPathRouter:
+    """Rule-based intent pre-classifier + direct tool execution."""
+
+    def __init__(self, intents=FAST_PATH_INTENTS):
+        self.intents = {i for i in intents if i in INTENT_ACTIONS}
+        self.turns     = 0
+        self.handled: Dict[str, int] = {}
+        self.fallbacks = 0
+        self._latency: Dict[Tuple[str, str], List[float]] = {}     # (path, action) → [sum_s, count]
+
+    def classify(self, text: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(intent, params) when a rule matches the whole message, else None."""
+        cleaned = normalise(text)
+        for intent, pattern in _RULES:
+            if intent not in self.intents:
+                continue
+            m = pattern.fullmatch(cleaned)
+            if not m:
+                continue
+            params = {k: v for k, v in m.groupdict().items() if v}
+            if intent == "cancel_order":
+                if not (_OBJECT_ID_RE.match(params["ref"]) or re.search(r"\d", params["ref"])):
+                    continue
+                if _QUESTION_RE.search(text.lower()):
+                    continue      # asking about cancelling is not an instruction to cancel
+            if intent == "search":
+                params["query"] = re.sub(r"^(?:the|some|a|an|any)\s+", "", params["query"])
+                words = params["query"].split()
+                if len(words) > _SEARCH_MAX_WORDS or _SEARCH_STOPWORDS.intersection(words):
+                    continue
+            return intent, params
+        return None
+
+    async def handle(self, intent: str, params: Dict[str, Any],
+                     execute: Callable[[str, dict], Awaitable[dict]]) -> Optional[Dict[str, Any]]:
+        """
+        Run the intent with `execute(tool_name, args)` (the agent's tool path).
+        Returns the agent-shaped result, or None to fall back to the agent loop.
+        """
+        result = await self._run(intent, params, execute)
+        if result is None:
+            self.fallbacks += 1
+            return None
+        self.handled[intent] = self.handled.get(intent, 0) + 1
+        result["fast_path"] = intent
+        return result
+
+    async def _run(self, intent, params, execute) -> Optional[Dict[str, Any]]:
+        action = INTENT_ACTIONS[intent]
+        if intent == "view_cart":
+            r = await execute("get_cart", {})
+            if not r.get("success") or not isinstance(r.get("data"), dict):
+                return None
+            return {"response": render_cart(r["data"]), "products": None, "action": action}
+
+        if intent == "view_orders":
+            r = await execute("get_orders", {})
+            if not r.get("success") or not isinstance(r.get("data"), list):
+                return None
+            return {"response": render_orders(r["data"]), "products": None, "action": action}
+
+        if intent == "cancel_order":
+            ref = params["ref"]
+            order_id, label = (ref, "your order") if _OBJECT_ID_RE.match(ref) else (None, f"order **{ref.upper()}**")
+            if order_id is None:
+                r = await execute("get_orders", {})
+                orders = r.get("data") if r.get("success") else None
+                match = next((o for o in orders or [] if str(o.get("orderNumber", "")).lower() == ref), None)
+                if not match or not match.get("orderId"):
+                    return None      # unknown number — let the agent ask / look it up
+                order_id = match["orderId"]
+            r = await execute("cancel_order", {"order_id": order_id})
+            if r.get("success"):
+                text = f"Done — {label} has been cancelled. Any refund goes back to the original payment method."
+            else:
+                text = f"I couldn't cancel {label}: {str(r.get('message') or 'please try again')[:200]}"
+            return {"response": text, "products": None, "action": action}
+
+        if intent == "search":
+            max_price = _parse_price(params.get("max"))
+            args = {"query": params["query"], **({"max_price": max_price} if max_price else {})}
+            r = await execute("search_products", args)
+            if not r.get("success") or not isinstance(r.get("data"), list):
+                return None
+            data = r["data"]
+            return {"response": render_search(params["query"], data, max_price),
+                    "products": data[:4] or None, "action": action}
+        return None
+
+    # ── Accounting ───────────────────────────────────────────────────────────
+
+    def record(self, path: str, action: Optional[str], seconds: float) -> None:
+        """One finished chat turn (path = fast_path | agent)."""
+        self.turns += 1
+        entry = self._latency.setdefault((path, action or "other"), [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        handled = sum(self.handled.values())
+        latency = {}
+        for action in INTENT_ACTIONS.values():
+            fast  = self._latency.get(("fast_path", action))
+            agent = self._latency.get(("agent", action))
+            if not fast and not agent:
+                continue
+            row = {}
+            if fast:
+                row["fast_path_ms"] = round(fast[0] / fast[1] * 1000, 1)
+            if agent:
+                row["agent_ms"] = round(agent[0] / agent[1] * 1000, 1)
+            if fast and agent:
+                row["saved_ms"] = round(row["agent_ms"] - row["fast_path_ms"], 1)
+            latency[action] = row
+        return {
+            "enabled":   True,
+            "intents":   sorted(self.intents),
+            "turns":     self.turns,
+            "handled":   handled,
+            "share":     round(handled / self.turns, 4) if self.turns else 0.0,
+            "by_intent": dict(self.handled),
+            "fallbacks": self.fallbacks,
+            "latency":   latency,
+        }
@@ -0,0 +1,327 @@
+"""
+groq_scheduler.py
+One queue in front of every Groq chat completion.
+
+A 429 used to end the turn with "please wait 5 seconds", and under a burst
+every concurrent user got it at once. Completions now go through a
+scheduler that:
+
+  - Tracks Groq's quota from the x-ratelimit-* headers of each response
+    (remaining requests / tokens and when they reset), counts what it has
+    dispatched since, and holds calls back before the quota runs out
+    rather than after
+  - Dispatches by priority: the next step of a turn already in progress
+    goes before the first call of a new turn, so started work finishes
+  - On a 429 (or a local rate_limit.py quota) pauses the whole queue for
+    retry-after or a jittered exponential backoff, then retries; 5xx and
+    connection errors are retried with backoff too. The SDK's own retries
+    are turned off so there is one policy
+  - Sheds smoothly: a new turn whose expected wait is over GROQ_SHED_AFTER
+    is turned away with a probability rising to 1 at GROQ_QUEUE_TIMEOUT.
+    Turns in progress are never shed, only timed out
+
+llm_router.py gives each provider its own scheduler (OpenAI-compatible
+APIs send the same x-ratelimit-* headers). Single event loop, no locks.
+stats(): queue depth, in flight, last known quota, waits, retries, shed /
+timed-out calls.
+"""
+
+import os
+import re
+import heapq
+import random
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import GROQ_QUEUE_SECONDS, GROQ_SCHEDULER_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+GROQ_SCHEDULER_ENABLED = os.getenv("GROQ_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+GROQ_MAX_CONCURRENCY   = int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))
+GROQ_QUEUE_TIMEOUT     = float(os.getenv("GROQ_QUEUE_TIMEOUT", "20"))    # max wait per call, retries included
+GROQ_SHED_AFTER        = float(os.getenv("GROQ_SHED_AFTER", "8"))        # expected wait where shedding starts
+GROQ_MAX_RETRIES       = int(os.getenv("GROQ_MAX_RETRIES", "4"))
+GROQ_BACKOFF_BASE      = float(os.getenv("GROQ_BACKOFF_BASE", "0.5"))
+GROQ_BACKOFF_MAX       = float(os.getenv("GROQ_BACKOFF_MAX", "8"))
+
+PRIORITY_CONTINUE = 0       # a later iteration of a turn in progress
+PRIORITY_NEW      = 1       # the first completion of a turn
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class SchedulerRejected(Exception):
+    """The call was shed or waited too long; the message reads like a rate limit on purpose."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"rate_limit: Groq scheduler {reason}")
+        self.reason = reason
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Groq reset headers: "7.66s", "2m59.56s", "120ms"; retry-after: plain seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    return sum(float(n) * _UNIT_SECONDS[unit] for n, unit in parts) if parts else None
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    try:
+        value = headers.get(name)
+        return int(float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "future", "queued_at")
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: asyncio.Future):
+        self.priority  = priority
+        self.seq       = seq
+        self.tokens    = tokens
+        self.future    = future
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class GroqScheduler:
+    def __init__(self, max_concurrency: int = GROQ_MAX_CONCURRENCY, queue_timeout: float = GROQ_QUEUE_TIMEOUT,
+                 shed_after: float = GROQ_SHED_AFTER, max_retries: int = GROQ_MAX_RETRIES):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout   = queue_timeout
+        self.shed_after      = min(shed_after, queue_timeout)
+        self.max_retries     = max_retries
+
+        self._heap: List[_Waiter] = []
+        self._seq      = itertools.count()
+        self._inflight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._latency  = 1.0                     # EWMA seconds per completion
+
+        # Quota as last reported by Groq, minus what was dispatched since
+        self._paused_until  = 0.0
+        self._req_remaining: Optional[float] = None
+        self._req_reset_at  = 0.0
+        self._tok_limit:     Optional[int]   = None
+        self._tok_remaining: Optional[float] = None
+        self._tok_seen_at   = 0.0
+        self._tok_reset_at  = 0.0
+
+        self.dispatched   = 0
+        self.retries      = 0
+        self.rate_limited = 0
+        self.shed         = 0
+        self.timeouts     = 0
+        self.max_wait     = 0.0
+        self._wait_total  = 0.0
+
+    # ── Public ───────────────────────────────────────────────────────────────
+
+    async def run(self, call: Callable[[], Awaitable[Tuple[Any, Any]]],
+                  priority: int = PRIORITY_NEW, tokens: int = 0, max_retries: Optional[int] = None) -> Any:
+        """
+        call() performs one request and returns (result, response headers).
+        Retried per the policy above (max_retries overrides GROQ_MAX_RETRIES,
+        e.g. 0 when another provider can take the call); raises
+        SchedulerRejected when shed or out of time, or the last error when
+        it isn't retryable.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        if priority != PRIORITY_CONTINUE:
+            self._maybe_shed(tokens)
+        deadline = time.monotonic() + self.queue_timeout
+        seq = next(self._seq)                   # keeps its place in line across retries
+        attempt = 0
+        while True:
+            await self._acquire(priority, seq, tokens, deadline)
+            t0 = time.monotonic()
+            try:
+                result, headers = await call()
+            except asyncio.CancelledError:
+                self._release()                 # e.g. the losing side of a hedged call
+                raise
+            except Exception as e:
+                self._release()
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt >= max_retries:
+                    raise
+                if time.monotonic() + delay >= deadline:
+                    self.timeouts += 1
+                    GROQ_SCHEDULER_EVENTS.inc(event="timeout")
+                    raise
+                attempt += 1
+                self.retries += 1
+                GROQ_SCHEDULER_EVENTS.inc(event="retry")
+                logger.info("Groq call retry %d in %.2fs: %s", attempt, delay, str(e)[:120])
+                if self._paused_until <= time.monotonic():
+                    await asyncio.sleep(delay)
+                continue
+            self._latency = 0.8 * self._latency + 0.2 * (time.monotonic() - t0)
+            self._observe(headers)
+            self._release()
+            return result
+
+    def expected_wait(self, tokens: int = 0) -> float:
+        """Rough seconds a call queued now would wait before dispatch."""
+        now = time.monotonic()
+        live = [w for w in self._heap if not w.future.done()]
+        wait = self._quota_wait(now, tokens)
+        wait += len(live) * self._latency / self.max_concurrency
+        if self._tok_limit:
+            queued = sum(w.tokens for w in live) + tokens
+            wait = max(wait, (queued - self._tokens_now(now)) / (self._tok_limit / 60.0))
+        return max(0.0, wait)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        granted = self.dispatched or 1
+        return {
+            "enabled":           True,
+            "queued":            sum(1 for w in self._heap if not w.future.done()),
+            "in_flight":         self._inflight,
+            "max_concurrency":   self.max_concurrency,
+            "paused_s":          round(max(0.0, self._paused_until - now), 2),
+            "remaining_requests": None if self._req_remaining is None else int(self._req_remaining),
+            "remaining_tokens":  None if self._tok_remaining is None else int(self._tokens_now(now)),
+            "dispatched":        self.dispatched,
+            "retries":           self.retries,
+            "rate_limited":      self.rate_limited,
+            "shed":              self.shed,
+            "timeouts":          self.timeouts,
+            "mean_wait_ms":      round(self._wait_total / granted * 1000, 1),
+            "max_wait_ms":       round(self.max_wait * 1000, 1),
+        }
+
+    # ── Queue ────────────────────────────────────────────────────────────────
+
+    async def _acquire(self, priority: int, seq: int, tokens: int, deadline: float) -> None:
+        waiter = _Waiter(priority, seq, tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, waiter)
+        self._pump()
+        try:
+            await asyncio.wait_for(waiter.future, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            GROQ_SCHEDULER_EVENTS.inc(event="timeout")
+            raise SchedulerRejected("queue timeout") from None
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release()                 # granted just before the caller went away
+            raise
+        waited = time.monotonic() - waiter.queued_at
+        self._wait_total += waited
+        self.max_wait = max(self.max_wait, waited)
+        GROQ_QUEUE_SECONDS.observe(waited, priority="continue" if priority == PRIORITY_CONTINUE else "new")
+
+    def _release(self) -> None:
+        self._inflight -= 1
+        self._pump()
+
+    def _pump(self) -> None:
+        """Grant waiters in priority order while concurrency and quota allow."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        while self._heap:
+            head = self._heap[0]
+            if head.future.done():              # timed out / cancelled
+                heapq.heappop(self._heap)
+                continue
+            if self._inflight >= self.max_concurrency:
+                return                          # _release() pumps again
+            wait = self._quota_wait(now, head.tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            heapq.heappop(self._heap)
+            self._inflight += 1
+            self.dispatched += 1
+            if self._req_remaining is not None:
+                self._req_remaining -= 1
+            if self._tok_remaining is not None:
+                self._tok_remaining -= head.tokens
+            head.future.set_result(None)
+
+    def _maybe_shed(self, tokens: int) -> None:
+        wait = self.expected_wait(tokens)
+        if wait <= self.shed_after:
+            return
+        span = max(self.queue_timeout - self.shed_after, 1e-6)
+        if random.random() < (wait - self.shed_after) / span:
+            self.shed += 1
+            GROQ_SCHEDULER_EVENTS.inc(event="shed")
+            raise SchedulerRejected(f"overloaded (expected wait {wait:.1f}s)")
+
+    # ── Quota ────────────────────────────────────────────────────────────────
+
+    def _tokens_now(self, now: float) -> float:
+        """Remaining tokens, refilled at the TPM rate since Groq last reported them."""
+        if self._tok_remaining is None:
+            return float("inf")
+        if now >= self._tok_reset_at and self._tok_limit:
+            return float(self._tok_limit)
+        refill = (now - self._tok_seen_at) * (self._tok_limit or 0) / 60.0
+        return min(self._tok_remaining + refill, float(self._tok_limit or self._tok_remaining + refill))
+
+    def _quota_wait(self, now: float, tokens: int) -> float:
+        wait = self._paused_until - now
+        if self._req_remaining is not None and self._req_remaining < 1:
+            if now < self._req_reset_at:
+                wait = max(wait, self._req_reset_at - now)
+            else:
+                self._req_remaining = None      # window reset: unknown until the next response
+        available = self._tokens_now(now)
+        if tokens and available < tokens and now < self._tok_reset_at:
+            if self._tok_limit:
+                wait = max(wait, min((tokens - available) / (self._tok_limit / 60.0), self._tok_reset_at - now))
+            else:
+                wait = max(wait, self._tok_reset_at - now)
+        return max(0.0, wait)
+
+    def _observe(self, headers) -> None:
+        if headers is None:
+            return
+        now = time.monotonic()
+        remaining = _header_int(headers, "x-ratelimit-remaining-requests")
+        if remaining is not None:
+            self._req_remaining = float(remaining) - max(0, self._inflight - 1)
+            self._req_reset_at  = now + (parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0)
+        remaining = _header_int(headers, "x-ratelimit-remaining-tokens")
+        if remaining is not None:
+            self._tok_limit     = _header_int(headers, "x-ratelimit-limit-tokens") or self._tok_limit
+            self._tok_remaining = float(remaining)
+            self._tok_seen_at   = now
+            self._tok_reset_at  = now + (parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0)
+
+    def _retry_delay(self, e: Exception, attempt: int) -> Optional[float]:
+        """Seconds before retrying `e`, or None if it isn't retryable. 429s pause everyone."""
+        backoff = min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.5)
+        status = getattr(e, "status_code", None)
+        if status == 429 or str(e).startswith("rate_limit"):
+            headers = getattr(getattr(e, "response", None), "headers", None)
+            self._observe(headers)
+            retry_after = parse_duration(headers.get("retry-after")) if headers is not None else None
+            delay = retry_after * random.uniform(1.0, 1.2) if retry_after else backoff
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.rate_limited += 1
+            GROQ_SCHEDULER_EVENTS.inc(event="rate_limited")
+            return delay
+        if ((isinstance(status, int) and status >= 500) or isinstance(e, (ConnectionError, TimeoutError))
+                or type(e).__name__ in ("APIConnectionError", "APITimeoutError")):
+            return backoff
+        return None
@@ -0,0 +1,193 @@
+"""
+lexical_index.py
+In-process BM25 inverted index over the product catalog, plus Reciprocal Rank
+Fusion (RRF) for hybrid lexical + vector search.
+
+Pure vector search is weak on exact SKU / brand / model-number queries
+("iPhone 15 Pro 256GB"): the embedding blurs "15" vs "14" and "256GB" vs
+"128GB". BM25 nails those tokens; RRF merges both rankings without having to
+calibrate their very different score scales.
+
+  - Built from the same fields get_text_to_embed() uses (name, brand,
+    category, specifications), with field weights: name x3, brand x2
+  - Postings stored as NumPy arrays → scoring is a few vectorised adds
+  - Price / stock / category filters via precomputed arrays, shared with the
+    local vector index (local_index.filter_mask)
+  - Tagged with the catalog version it was built from, so callers can
+    rebuild it when the catalog changes
+"""
+
+import os
+import re
+import math
+import time
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from embedding_pipeline import category_key, extract_category, extract_specifications
+from local_index import _to_float, filter_mask
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B  = float(os.getenv("BM25_B", "0.75"))
+RRF_K   = int(os.getenv("RRF_K", "60"))
+
+FIELD_WEIGHTS = {"name": 3, "brand": 2, "category": 1, "specifications": 1}
+META_FIELDS   = ("name", "description", "brand", "reviewCount", "imageUrl", "stockQuantity")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SPLIT_RE = re.compile(r"\d+|[a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-case alphanumeric tokens. Mixed tokens are also split so
+    "256gb" matches "256 GB" and "iphone15" matches "iphone 15".
+    """
+    out: List[str] = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        out.append(tok)
+        parts = _SPLIT_RE.findall(tok)
+        if len(parts) > 1:
+            out.extend(parts)
+    return out
+
+
+class LexicalIndex:
+    """BM25 over weighted product fields."""
+
+    def __init__(self, docs: Sequence[dict], version: int = 0):
+        t0 = time.perf_counter()
+        self.version = version
+        self.meta: List[Dict[str, Any]] = []
+        prices: List[float] = []
+        stock:  List[int] = []
+        cats:   List[str] = []
+        lengths: List[int] = []
+        postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+
+        for row, doc in enumerate(docs):
+            fields = {
+                "name":           doc.get("name") or "",
+                "brand":          doc.get("brand") or "",
+                "category":       extract_category(doc.get("category")),
+                "specifications": extract_specifications(doc.get("specifications")),
+            }
+            length = 0
+            for field, text in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                for tok in tokenize(text):
+                    postings[tok][row] = postings[tok].get(row, 0) + weight
+                    length += weight
+            lengths.append(length)
+            prices.append(_to_float(doc.get("price")))
+            stock.append(int(doc.get("stockQuantity") or 0))
+            cats.append(category_key(doc.get("category")))
+
+            entry = {"_id": str(doc.get("_id")), "category": doc.get("category"),
+                     "rating": _to_float(doc.get("rating"))}
+            for field in META_FIELDS:
+                if doc.get(field) is not None:
+                    entry[field] = doc[field]
+            self.meta.append(entry)
+
+        self.prices     = np.asarray(prices, dtype=np.float64)
+        self.stock      = np.asarray(stock, dtype=np.int64)
+        self.categories = np.asarray(cats, dtype=object)
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.avg_len = float(self.lengths.mean()) if len(lengths) else 0.0
+        n = len(self.meta)
+
+        # term -> (rows, tfs, idf)
+        self._postings: Dict[str, tuple] = {}
+        for term, rows_tf in postings.items():
+            rows = np.fromiter(rows_tf.keys(), dtype=np.int64, count=len(rows_tf))
+            tfs  = np.fromiter(rows_tf.values(), dtype=np.float32, count=len(rows_tf))
+            df   = len(rows_tf)
+            idf  = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            self._postings[term] = (rows, tfs, idf)
+
+        logger.info("✓ Lexical index built: %d products, %d terms (%.0f ms)",
+                    n, len(self._postings), (time.perf_counter() - t0) * 1000)
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    @classmethod
+    def from_collection(cls, collection, version: int = 0) -> "LexicalIndex":
+        projection = {"_id": 1, "name": 1, "brand": 1, "category": 1, "specifications": 1,
+                      "price": 1, "rating": 1, "description": 1, "reviewCount": 1,
+                      "imageUrl": 1, "stockQuantity": 1}
+        return cls(list(collection.find({}, projection, batch_size=5000)), version=version)
+
+    def search(self, query: str, top_k: int = 5,
+               min_price: Optional[float] = None,
+               max_price: Optional[float] = None,
+               in_stock: Optional[bool] = None,
+               category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-k product dicts by BM25 (Atlas $project shape, score = BM25)."""
+        n = len(self)
+        if n == 0:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / max(self.avg_len, 1e-6))
+        matched = False
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            rows, tfs, idf = posting
+            scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[rows])
+            matched = True
+        if not matched:
+            return []
+
+        mask = filter_mask(self.prices, self.stock, self.categories,
+                           min_price, max_price, in_stock, category)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        hits = np.flatnonzero(scores > 0)
+        if hits.size == 0:
+            return []
+        k = min(top_k, hits.size)
+        top = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+
+        docs = []
+        for row in top.tolist():
+            doc = dict(self.meta[row])
+            doc["price"] = float(self.prices[row])
+            doc["score"] = float(scores[row])
+            docs.append(doc)
+        return docs
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Dict[str, Any]]], top_k: int,
+                           k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Merge several best-first doc lists by RRF: score(d) = Σ 1 / (k + rank).
+    The first list's doc wins when the same product appears in several.
+    Fused scores are rescaled to 0..1 (1 = ranked first everywhere).
+    """
+    fused: Dict[str, float] = defaultdict(float)
+    docs:  Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = str(doc.get("_id"))
+            fused[key] += 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+
+    best = len(rankings) / (k + 1)
+    ordered = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    out = []
+    for key, score in ordered:
+        doc = dict(docs[key])
+        doc["score"] = score / best
+        out.append(doc)
+    return out
@@ -1,35 +1,70 @@
 """
-llm_agent.py  (v5 -- True Agentic Edition)
-==========================================
+llm_agent.py  (v6 -- Async Agentic Edition)
+===========================================
 Groq tool-calling agent loop. The LLM decides WHICH tools to call
 and in WHAT ORDER. Python only executes -- no hardcoded if/elif routing.
+The whole loop is asyncio end-to-end: AsyncGroq completions, async APIClient
+calls and local search pushed to a worker thread, so one slow turn never
+stalls the event loop for other users.
+Account reads (cart, default address) come from a per-user session
+snapshot of /ai/context when fresh (session_cache.py); trivial intents
+("show my cart") skip the LLM entirely via fast_path.py.
+Each completion's prompt is fitted to a token budget (prompt_budget.py):
+history is cut by tokens and older tool results of the turn are summarised.
+Only the tool schemas relevant to the message are sent (tool_selector.py),
+widened to all of them if the model asks for one that was left out.
+Completions are queued through groq_scheduler.py: the next step of a turn
+in progress goes first, and Groq's 429s / quota headers pause and retry
+the queue instead of failing the turn. Each iteration goes to the fastest
+healthy provider in LLM_PROVIDERS (llm_router.py: Groq, OpenAI, Ollama),
+with failover and hedging of slow calls.
+With an `on_event` callback (/chat/stream) completions are streamed and
+progress is reported as it happens: tool_start / tool_end / products /
+token / reset events.
 Security layers:
   1. Input sanitisation  -- length limits + prompt injection detection
   2. Tool allow-listing  -- only defined tools can be called
   3. Parameter validation -- MongoDB ID format, numeric ranges, query sanity
-  4. Rate limiting        -- per-user token bucket (default 20 req/min)
-  5. Result trimming      -- sensitive data stripped before re-sending to Groq
+  4. Rate limiting        -- per-user requests/min, plus optional deployment-wide
+                             Groq RPM / TPM budgets (rate_limit.py backends)
+  5. Result trimming      -- sensitive data stripped before re-sending to Groq,
+                             each result capped in tokens
   6. Safe logging         -- IDs/addresses partially redacted in logs
 """
 
 import re
 import os
 import json
+import asyncio
 import time
 import logging
-import threading
-from typing import List, Dict, Any, Optional
+import contextvars
+from types import SimpleNamespace
+from typing import Callable, List, Dict, Any, Optional
+
+from tracing import span
+from session_cache import (SESSION_CACHE_ENABLED, SESSION_CONTEXT_HEADER, SESSION_CONTEXT_IN_PROMPT,
+                           READ_TOOLS, SessionContextCache)
+from fast_path import FAST_PATH_ENABLED, FastPathRouter
+from prompt_budget import PromptBudget, clip_tokens
+from tool_selector import TOOL_SELECT_ENABLED, ToolSelector
+from rate_limit import RateLimiter, RateLimitExceeded, get_backend
+from groq_scheduler import PRIORITY_CONTINUE, PRIORITY_NEW
+from llm_router import LLM_PROVIDERS, LLMRouter, build_providers
+from metrics import (CHAT_TURN_SECONDS, FAST_PATH_TURNS, GROQ_REQUEST_SECONDS, GROQ_TOKENS,
+                     GROQ_TOKENS_PER_TURN, RATE_LIMIT_REJECTIONS, TOOL_CALLS, TOOL_SECONDS)
 
 logger = logging.getLogger(__name__)
 
 # Config
 GROQ_API_KEY    = os.getenv("GROQ_API_KEY", "")
-LLM_MODEL       = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+GROQ_BASE_URL   = os.getenv("GROQ_BASE_URL") or None   # e.g. a local fake (benchmarks/bench_load.py)
+LLM_MODEL       = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")     # Groq model when LLM_PROVIDERS is unset
 MAX_ITERATIONS  = int(os.getenv("LLM_MAX_ITERATIONS", "6"))
 RATE_LIMIT_RPM  = int(os.getenv("LLM_RATE_LIMIT_RPM", "90"))
+GROQ_RPM_LIMIT  = int(os.getenv("GROQ_RPM_LIMIT", "0"))     # whole deployment; 0 = off
+GROQ_TPM_LIMIT  = int(os.getenv("GROQ_TPM_LIMIT", "0"))     # prompt + max_tokens reserved per call
 MAX_INPUT_CHARS = 2000
-MAX_HISTORY     = 8       # turns kept (each turn = user + assistant)
-MAX_TOOL_RESULT = 4000    # chars of any single tool result fed back to Groq
 
 # ===========================================================================
 # TOOL DEFINITIONS -- Groq reads these and decides when to call each one
@@ -183,6 +218,12 @@ TOOLS = [
 
 ALLOWED_TOOLS = {t["function"]["name"] for t in TOOLS}
 
+# Tools without side effects -- safe to run concurrently within one LLM turn.
+# Everything else (add_to_cart, place_order, cancel_order, ...) is a barrier
+# that runs alone and in the order Groq emitted it.
+READ_ONLY_TOOLS = {"search_products", "get_cart", "get_orders",
+                   "get_default_address", "compare_products"}
+
 # ===========================================================================
 # AGENT SYSTEM PROMPT
 # ===========================================================================
@@ -290,36 +331,52 @@ def validate_tool_call(name: str, args: dict):
     return True, ""
 
 # ===========================================================================
-# SECURITY: Rate Limiter (token bucket, per user)
+# SECURITY: Rate limiting (per user, and Groq quotas for the whole deployment)
 # ===========================================================================
-class _RateLimiter:
-    def __init__(self, rpm: int = RATE_LIMIT_RPM):
-        self._rpm     = rpm
-        self._buckets: Dict[str, dict] = {}
-        self._lock    = threading.Lock()
-
-    def is_allowed(self, uid: str) -> bool:
-        now = time.time()
-        with self._lock:
-            if uid not in self._buckets:
-                self._buckets[uid] = {"tokens": float(self._rpm), "ts": now}
-            b = self._buckets[uid]
-            elapsed    = now - b["ts"]
-            b["tokens"] = min(self._rpm, b["tokens"] + elapsed * (self._rpm / 60.0))
-            b["ts"]     = now
-            if b["tokens"] >= 1:
-                b["tokens"] -= 1
-                return True
-            return False
-
-    def cleanup(self):
-        cutoff = time.time() - 600
-        with self._lock:
-            stale = [u for u, b in self._buckets.items() if b["ts"] < cutoff]
-            for u in stale:
-                del self._buckets[u]
-
-_rate_limiter = _RateLimiter()
+_rate_limiter = RateLimiter("user", RATE_LIMIT_RPM)
+_groq_rpm     = RateLimiter("groq_rpm", GROQ_RPM_LIMIT)
+_groq_tpm     = RateLimiter("groq_tpm", GROQ_TPM_LIMIT)
+
+
+# Token totals of the /chat turn being processed (set by ShoppingAgent.process)
+_turn_usage: contextvars.ContextVar = contextvars.ContextVar("groq_turn_usage", default=None)
+# SessionView of the user whose turn is being processed (None = no session cache)
+_turn_session: contextvars.ContextVar = contextvars.ContextVar("agent_turn_session", default=None)
+# Progress callback of a streamed turn: on_event(event_name, data_dict)
+_turn_events: contextvars.ContextVar = contextvars.ContextVar("agent_turn_events", default=None)
+
+
+def _emit(event: str, **data) -> None:
+    on_event = _turn_events.get()
+    if on_event is not None:
+        on_event(event, data)
+
+
+def _assemble_stream(content: List[str], calls: Dict[int, dict], finish_reason, usage):
+    """Rebuild a non-streaming completion (choices[0].message / usage) from stream deltas."""
+    tool_calls = [
+        SimpleNamespace(id=c["id"] or f"call_{i}", type="function",
+                        function=SimpleNamespace(name=c["name"], arguments=c["arguments"] or "{}"))
+        for i, c in sorted(calls.items())
+    ]
+    message = SimpleNamespace(role="assistant", content="".join(content) or None, tool_calls=tool_calls or None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=usage)
+
+
+def _record_usage(s, resp) -> None:
+    """Copy Groq token usage onto a tracing span, the metrics and the turn total."""
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return
+    tokens_in  = int(getattr(usage, "prompt_tokens", 0) or 0)
+    tokens_out = int(getattr(usage, "completion_tokens", 0) or 0)
+    s.set(prompt_tokens=tokens_in, completion_tokens=tokens_out)
+    GROQ_TOKENS.inc(tokens_in, direction="in")
+    GROQ_TOKENS.inc(tokens_out, direction="out")
+    turn = _turn_usage.get()
+    if turn is not None:
+        turn["in"]  += tokens_in
+        turn["out"] += tokens_out
 
 # ===========================================================================
 # Tool result trimmer -- keeps Groq under 6k TPM
@@ -374,10 +431,43 @@ def _trim_result(tool_name: str, result: dict) -> dict:
             ]
         }}
 
+    if tool_name in ("place_order", "cancel_order") and isinstance(data, dict):
+        # _format_order_response needs the dict (orderNumber / totalAmount / status / items)
+        items = data.get("items") or []
+        return {"success": True, "message": result.get("message"), "data": {
+            "orderId": data.get("orderId"), "orderNumber": data.get("orderNumber"),
+            "status": data.get("status"), "totalAmount": data.get("totalAmount"),
+            "createdAt": data.get("createdAt"), "shippingAddress": data.get("shippingAddress"),
+            "itemCount": len(items),
+            "items": [
+                {"productName": i.get("productName"), "quantity": i.get("quantity"), "price": i.get("price")}
+                for i in items[:5]
+            ]
+        }}
+
     raw = json.dumps(result, default=str)
-    if len(raw) > MAX_TOOL_RESULT:
-        return {"success": True, "data": raw[:MAX_TOOL_RESULT] + "...[truncated]"}
-    return result
+    if len(clip_tokens(raw)) == len(raw):
+        return result
+    # Over budget: shorten lists first so the result keeps its shape; stringify only as a last resort
+    if isinstance(data, list):
+        data = data[:5]
+    elif isinstance(data, dict):
+        data = {k: v[:5] if isinstance(v, list) else v for k, v in data.items()}
+    shortened = {"success": True, "data": data}
+    raw = json.dumps(shortened, default=str)
+    clipped = clip_tokens(raw)
+    if len(clipped) == len(raw):
+        return shortened
+    return {"success": True, "data": clipped}
+
+def _session_context_message(context: Dict[str, Any]) -> Dict[str, str]:
+    """System message carrying the cached session sections, trimmed like tool results."""
+    compact = {}
+    for tool, section in READ_TOOLS.items():
+        if section in context:
+            compact[section] = _trim_result(tool, {"success": True, "data": context[section]})["data"]
+    return {"role": "system",
+            "content": SESSION_CONTEXT_HEADER + json.dumps(compact, default=str, ensure_ascii=False)}
 
 # ===========================================================================
 # Extract product list from message history (for frontend product cards)
@@ -450,6 +540,30 @@ def _extract_products(messages: list) -> Optional[list]:
             continue
     return None
 
+# ===========================================================================
+# Tool call planning -- dependency-aware grouping
+# ===========================================================================
+def _plan_tool_groups(tool_calls: list) -> List[List[tuple]]:
+    """
+    Split one turn's tool_calls into execution groups of (index, tool_call).
+    Consecutive read-only calls share a group (run concurrently); a mutating
+    call always gets its own group, so it sees every earlier result and
+    every later call sees its effect.
+    """
+    groups: List[List[tuple]] = []
+    current: List[tuple] = []
+    for idx, tc in enumerate(tool_calls):
+        if tc.function.name in READ_ONLY_TOOLS:
+            current.append((idx, tc))
+            continue
+        if current:
+            groups.append(current)
+            current = []
+        groups.append([(idx, tc)])
+    if current:
+        groups.append(current)
+    return groups
+
 # ===========================================================================
 # Safe argument logging
 # ===========================================================================
@@ -474,34 +588,193 @@ class ShoppingAgent:
     """
 
     def __init__(self):
-        self._client         = None
         self._search_service = None
-        self._init_groq()
-
-    def _init_groq(self):
-        if not GROQ_API_KEY:
-            logger.warning("GROQ_API_KEY not set")
-            return
-        try:
-            from groq import Groq
-            self._client = Groq(api_key=GROQ_API_KEY)
-            logger.info("ShoppingAgent ready: Groq / %s", LLM_MODEL)
-        except Exception as e:
-            logger.error("Groq init failed: %s", e)
+        self._sessions       = SessionContextCache() if SESSION_CACHE_ENABLED else None
+        self._fast_path      = FastPathRouter() if FAST_PATH_ENABLED else None
+        self._budget         = PromptBudget()
+        self._tool_selector  = ToolSelector(TOOLS) if TOOL_SELECT_ENABLED else None
+        self._router         = LLMRouter(build_providers(LLM_PROVIDERS, LLM_MODEL, GROQ_API_KEY, GROQ_BASE_URL))
+        if self._router.providers:
+            logger.info("ShoppingAgent ready: %s", ", ".join(p.name for p in self._router.providers))
 
     def set_search_service(self, svc):
         self._search_service = svc
+        if self._tool_selector:
+            self._tool_selector.set_encoder(svc.model, svc.embed_query)
         logger.info("SemanticSearchService wired into ShoppingAgent")
 
+    def session_stats(self) -> dict:
+        return self._sessions.stats() if self._sessions else {"enabled": False}
+
+    def fast_path_stats(self) -> dict:
+        return self._fast_path.stats() if self._fast_path else {"enabled": False}
+
+    def budget_stats(self) -> dict:
+        return self._budget.stats()
+
+    def rate_limit_stats(self) -> dict:
+        return {**get_backend().stats(),
+                "limiters": {lim.name: lim.stats() for lim in (_rate_limiter, _groq_rpm, _groq_tpm)
+                             if lim.enabled}}
+
+    def tool_select_stats(self) -> dict:
+        return self._tool_selector.stats() if self._tool_selector else {"enabled": False}
+
+    def router_stats(self) -> dict:
+        return self._router.stats()
+
+    def llm_available(self) -> bool:
+        """Whether any chat-completion provider is configured (fast-path turns work without one)."""
+        return bool(self._router.providers)
+
     # -------------------------------------------------------------------------
-    def process(self, user_message: str, history: List[Dict],
-                api_client, user_id: str = "anon") -> Dict[str, Any]:
+    async def process(self, user_message: str, history: List[Dict],
+                api_client, user_id: str = "anon",
+                on_event: Optional[Callable[[str, dict], None]] = None) -> Dict[str, Any]:
         """
         Main entry point.
         Returns { response: str, products: list|None, action: str }
+        on_event, if given, receives progress events while the turn runs.
+        """
+        usage = {"in": 0, "out": 0}
+        token = _turn_usage.set(usage)
+        events_token = _turn_events.set(on_event)
+        # "anon" is shared by every token-less request, so it never gets a session
+        session = self._sessions.view(user_id, api_client) if self._sessions and user_id != "anon" else None
+        session_token = _turn_session.set(session)
+        t0 = time.perf_counter()
+        result = None
+        try:
+            result = await self._process(user_message, history, api_client, user_id)
+            return result
+        finally:
+            _turn_events.reset(events_token)
+            _turn_session.reset(session_token)
+            _turn_usage.reset(token)
+            if result is not None:
+                elapsed = time.perf_counter() - t0
+                path    = "fast_path" if result.get("fast_path") else "agent"
+                CHAT_TURN_SECONDS.observe(elapsed, path=path, action=result.get("action") or "other")
+                if self._fast_path:
+                    self._fast_path.record(path, result.get("action"), elapsed)
+            if usage["in"] or usage["out"]:
+                GROQ_TOKENS_PER_TURN.observe(usage["in"], direction="in")
+                GROQ_TOKENS_PER_TURN.observe(usage["out"], direction="out")
+
+    async def _reserve_groq(self, tokens: int) -> int:
+        """Take one call from the deployment's Groq RPM and `tokens` from TPM, or raise."""
+        if not await _groq_rpm.allow():
+            RATE_LIMIT_REJECTIONS.inc(limit="groq_rpm")
+            raise RateLimitExceeded("groq_rpm")
+        if not _groq_tpm.enabled:
+            return 0
+        if not await _groq_tpm.allow(cost=tokens):
+            RATE_LIMIT_REJECTIONS.inc(limit="groq_tpm")
+            raise RateLimitExceeded("groq_tpm")
+        return tokens
+
+    async def _settle_groq(self, reserved: int, resp) -> None:
+        """Replace the TPM reservation with the tokens Groq reports (none if the call failed)."""
+        if not reserved:
+            return
+        usage = getattr(resp, "usage", None)
+        used = int(getattr(usage, "total_tokens", 0) or 0) if usage is not None else 0
+        await _groq_tpm.adjust(delta=used - reserved)
+
+    async def _dispatch(self, priority: int, kwargs: Dict[str, Any], hedge: bool = True):
+        """
+        Send one completion request through the router (provider choice,
+        failover, hedging), the provider's scheduler (queued, retried) and,
+        for Groq, the local Groq quotas. Returns (parsed response, tokens
+        reserved, provider); a stream is returned unread and the caller
+        settles the reservation.
+        """
+        tokens = self._budget.estimate(kwargs.get("messages") or [], kwargs.get("tools")) + kwargs.get("max_tokens", 0)
+
+        async def on(provider, fallback: bool):
+            async def attempt():
+                reserved = await self._reserve_groq(tokens) if provider.kind == "groq" else 0
+                try:
+                    parsed, headers = await self._router.create(provider, **kwargs)
+                except BaseException:       # incl. cancelled: the losing side of a hedge
+                    await self._settle_groq(reserved, None)
+                    raise
+                return (parsed, reserved, provider), headers
+
+            if provider.scheduler is None:
+                result, _ = await attempt()
+                return result
+            # With another healthy provider next in line, fail over instead of retrying here
+            return await provider.scheduler.run(attempt, priority=priority, tokens=tokens,
+                                                max_retries=0 if fallback else None)
+
+        return await self._router.run(on, hedge=hedge)
+
+    async def _complete(self, span_attrs: Dict[str, Any], priority: int = PRIORITY_NEW, **kwargs):
+        """One chat completion, traced and timed (queue wait, retries and hedging included)."""
+        t0 = time.perf_counter()
+        outcome = "error"
+        with span("groq.chat_completion", **span_attrs) as s:
+            try:
+                resp, reserved, provider = await self._dispatch(priority, kwargs)
+                s.set(provider=provider.kind, model=provider.model)
+                outcome = "ok"
+            finally:
+                GROQ_REQUEST_SECONDS.observe(time.perf_counter() - t0, outcome=outcome)
+            await self._settle_groq(reserved, resp)
+            _record_usage(s, resp)
+            return resp
+
+    async def _complete_streaming(self, span_attrs: Dict[str, Any], priority: int = PRIORITY_NEW, **kwargs):
+        """
+        Streaming variant of _complete for /chat/stream: content deltas go out
+        as `token` events while they arrive, and the chunks are reassembled
+        into the same response shape the agent loop reads.
         """
+        t0 = time.perf_counter()
+        outcome = "error"
+        reserved = 0
+        content: List[str] = []
+        calls: Dict[int, dict] = {}
+        finish_reason, usage = None, None
+        with span("groq.chat_completion", stream=True, **span_attrs) as s:
+            try:
+                # Not hedged: tokens go out as they arrive, so a stream can't be raced
+                stream, reserved, provider = await self._dispatch(priority, {**kwargs, "stream": True}, hedge=False)
+                s.set(provider=provider.kind, model=provider.model)
+                async for chunk in stream:
+                    # Groq reports usage on the last chunk under x_groq
+                    usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    delta  = choice.delta
+                    if getattr(delta, "content", None):
+                        content.append(delta.content)
+                        if not calls:
+                            _emit("token", text=delta.content)
+                    for tc in getattr(delta, "tool_calls", None) or []:
+                        entry = calls.setdefault(tc.index, {"id": None, "name": "", "arguments": ""})
+                        entry["id"] = tc.id or entry["id"]
+                        if tc.function is not None:
+                            entry["name"]      += tc.function.name or ""
+                            entry["arguments"] += tc.function.arguments or ""
+                    finish_reason = choice.finish_reason or finish_reason
+                outcome = "ok"
+            finally:
+                GROQ_REQUEST_SECONDS.observe(time.perf_counter() - t0, outcome=outcome)
+                await self._settle_groq(reserved, SimpleNamespace(usage=usage) if outcome == "ok" else None)
+            if calls and content:
+                _emit("reset")      # text streamed before the model switched to tool calls
+            resp = _assemble_stream(content, calls, finish_reason, usage)
+            _record_usage(s, resp)
+            return resp
+
+    async def _process(self, user_message: str, history: List[Dict],
+                       api_client, user_id: str) -> Dict[str, Any]:
         # Rate limit
-        if not _rate_limiter.is_allowed(user_id):
+        if not await _rate_limiter.allow(user_id):
+            RATE_LIMIT_REJECTIONS.inc(limit="user")
             logger.warning("Rate limit hit user=%s", user_id[-8:])
             return {"response": "You're sending messages too quickly. Please wait a moment.",
                     "products": None, "action": "rate_limited"}
@@ -514,28 +787,58 @@ class ShoppingAgent:
                         "products": None, "action": "security_block"}
             return {"response": "Please send a valid message.", "products": None, "action": "invalid"}
 
-        if not self._client:
+        # Trivial intents ("show my cart") are answered without the LLM
+        if self._fast_path:
+            routed = self._fast_path.classify(cleaned)
+            if routed:
+                intent, params = routed
+                with span("fast_path", intent=intent):
+                    result = await self._fast_path.handle(
+                        intent, params, lambda name, args: self._validated_tool(name, args, api_client))
+                FAST_PATH_TURNS.inc(intent=intent, outcome="handled" if result else "fallback")
+                if result:
+                    logger.info("Fast path: %s", intent)
+                    return result
+
+        if not self._router.providers:
             return {"response": "AI is temporarily unavailable. Please try again shortly.",
                     "products": None, "action": "unavailable"}
 
-        # Build messages (trim history to MAX_HISTORY turns)
-        trimmed_history = history[-(MAX_HISTORY * 2):]
+        # Session context: a fresh snapshot from earlier turns goes into the prompt;
+        # otherwise /ai/context is fetched alongside the first completion below
+        session = _turn_session.get()
+        context = session.context() if session and SESSION_CONTEXT_IN_PROMPT else None
+        if session:
+            session.prefetch()
+
+        # Build messages; each completion gets them fitted to the token budget
         messages = [
             {"role": "system", "content": AGENT_SYSTEM_PROMPT},
-            *trimmed_history,
+            *([_session_context_message(context)] if context else []),
+            *history,
             {"role": "user", "content": cleaned},
         ]
+        turn_start = len(messages)
+
+        selection = None
+        if self._tool_selector:
+            with span("tool_select") as s:
+                selection = await self._tool_selector.select(cleaned)
+                s.set(tools=len(selection.tools()))
 
         last_action = "other"
         recent_search_results: List[Dict[str, Any]] = []
 
         # Agent loop
         for iteration in range(MAX_ITERATIONS):
+            complete = self._complete_streaming if _turn_events.get() else self._complete
+            tools    = selection.tools() if selection else TOOLS
             try:
-                resp = self._client.chat.completions.create(
-                    model       = LLM_MODEL,
-                    messages    = messages,
-                    tools       = TOOLS,
+                resp = await complete(
+                    {"iteration": iteration},
+                    priority    = PRIORITY_NEW if iteration == 0 else PRIORITY_CONTINUE,
+                    messages    = self._budget.fit(messages, turn_start, tools),
+                    tools       = tools,
                     tool_choice = "auto",
                     max_tokens  = 300,    # keep output tokens low for free tier
                     temperature = 0.1,    # more deterministic = fewer retries
@@ -543,13 +846,17 @@ class ShoppingAgent:
             except Exception as e:
                 err_str = str(e)
                 logger.error("Groq error iter=%d: %s", iteration, e)
-                # 429 rate limit — Groq SDK already retries internally,
-                # but if it still fails, give user a clear message
+                # 429 rate limit — the scheduler already waited and retried,
+                # or shed the turn under overload: give user a clear message
                 if "429" in err_str or "rate_limit" in err_str.lower():
                     return {"response": (
                         "I'm processing a lot of requests right now. "
                         "Please wait 5 seconds and try again."
                     ), "products": None, "action": "rate_limited_groq"}
+                # The model wanted a tool outside this turn's subset — retry with all of them
+                if selection and "tool_use_failed" in err_str and selection.expand():
+                    logger.warning("Tool outside the selected subset on iter %d, retrying with all tools", iteration)
+                    continue
                 # tool_use_failed — Groq confused a response for a tool call
                 if "tool_use_failed" in err_str or "400" in err_str:
                     logger.warning("tool_use_failed on iter %d, returning last text", iteration)
@@ -577,8 +884,9 @@ class ShoppingAgent:
                 if fn_leak:
                     leaked_tool = fn_leak.group(1)
                     logger.warning("Leaked function call detected: %s -- executing directly", leaked_tool)
+                    _emit("reset")
                     if leaked_tool in ALLOWED_TOOLS:
-                        fix_result = self._execute_tool(leaked_tool, {}, api_client)
+                        fix_result = await self._execute_tool(leaked_tool, {}, api_client)
                         trimmed    = _trim_result(leaked_tool, fix_result)
                         # Feed the result back into a clean completion call
                         fix_msgs = messages + [
@@ -588,9 +896,10 @@ class ShoppingAgent:
                              "content": json.dumps(trimmed, default=str)}
                         ]
                         try:
-                            fix_resp = self._client.chat.completions.create(
-                                model       = LLM_MODEL,
-                                messages    = fix_msgs,
+                            fix_resp = await self._complete(
+                                {"purpose": "leaked_fix"},
+                                priority    = PRIORITY_CONTINUE,
+                                messages    = self._budget.fit(fix_msgs, turn_start),
                                 max_tokens  = 300,
                                 temperature = 0.1,
                             )
@@ -608,6 +917,8 @@ class ShoppingAgent:
 
             # Tool calls -- execute each
             tool_calls = message.tool_calls
+            if selection:
+                selection.use(tc.function.name for tc in tool_calls if tc.function.name in ALLOWED_TOOLS)
             messages.append({
                 "role":    "assistant",
                 "content": message.content,
@@ -618,32 +929,24 @@ class ShoppingAgent:
                 ]
             })
 
-            for tc in tool_calls:
+            # Read-only groups run concurrently; mutating calls run alone, in order
+            results: List[Optional[dict]] = [None] * len(tool_calls)
+            for group in _plan_tool_groups(tool_calls):
+                group_results = await asyncio.gather(*[
+                    self._run_tool_call(tc, recent_search_results, cleaned, api_client)
+                    for _, tc in group
+                ])
+                for (idx, tc), result in zip(group, group_results):
+                    results[idx] = result
+                    if tc.function.name == "search_products" and result.get("success"):
+                        data = result.get("data")
+                        if isinstance(data, list):
+                            recent_search_results = data
+
+            # Append in the original tool_call order Groq expects
+            for tc, result in zip(tool_calls, results):
                 name = tc.function.name
                 last_action = name
-                try:
-                    args = json.loads(tc.function.arguments or "{}") or {}
-                except (json.JSONDecodeError, TypeError):
-                    args = {}
-
-                # Recovery: if model passes a bad product_id, map from latest search results.
-                if name == "add_to_cart":
-                    args = self._repair_add_to_cart_args(args, recent_search_results, cleaned)
-
-                # Validate
-                valid, err = validate_tool_call(name, args)
-                if not valid:
-                    logger.warning("Tool blocked: %s -- %s", name, err)
-                    result = {"success": False, "message": f"Invalid request: {err}"}
-                else:
-                    logger.info("Tool: %s(%s)", name, _safe_args(args))
-                    result = self._execute_tool(name, args, api_client)
-
-                if name == "search_products" and result.get("success"):
-                    data = result.get("data")
-                    if isinstance(data, list):
-                        recent_search_results = data
-
                 messages.append({
                     "role":         "tool",
                     "tool_call_id": tc.id,
@@ -656,29 +959,78 @@ class ShoppingAgent:
                 "products": None, "action": "max_iterations"}
 
     # -------------------------------------------------------------------------
-    def _execute_tool(self, name: str, args: dict, api_client) -> dict:
+    async def _run_tool_call(self, tc, search_results: List[Dict[str, Any]],
+                             user_query: str, api_client) -> dict:
+        """Parse, repair, validate and execute a single tool_call."""
+        name = tc.function.name
+        try:
+            args = json.loads(tc.function.arguments or "{}") or {}
+        except (json.JSONDecodeError, TypeError):
+            args = {}
+
+        # Recovery: if model passes a bad product_id, map from latest search results.
+        if name == "add_to_cart":
+            args = self._repair_add_to_cart_args(args, search_results, user_query)
+
+        # Validate
+        valid, err = validate_tool_call(name, args)
+        if not valid:
+            logger.warning("Tool blocked: %s -- %s", name, err)
+            return {"success": False, "message": f"Invalid request: {err}"}
+
+        logger.info("Tool: %s(%s)", name, _safe_args(args))
+        return await self._execute_tool(name, args, api_client)
+
+    async def _validated_tool(self, name: str, args: dict, api_client) -> dict:
+        """Validate + execute a tool call that didn't come from Groq (fast path)."""
+        valid, err = validate_tool_call(name, args)
+        if not valid:
+            logger.warning("Tool blocked: %s -- %s", name, err)
+            return {"success": False, "message": f"Invalid request: {err}"}
+        return await self._execute_tool(name, args, api_client)
+
+    async def _execute_tool(self, name: str, args: dict, api_client) -> dict:
+        _emit("tool_start", tool=name)
+        t0 = time.perf_counter()
+        with span(f"tool.{name}") as s, TOOL_SECONDS.time(tool=name):
+            session = _turn_session.get()
+            result  = await session.read(name) if session else None
+            s.set(session_cache=result is not None if session else None)
+            if result is None:
+                result = await self._dispatch_tool(name, args, api_client)
+                if session:
+                    session.record(name, result)
+            success = bool(result.get("success")) if isinstance(result, dict) else False
+            s.set(success=success)
+            TOOL_CALLS.inc(tool=name, success=str(success).lower())
+        _emit("tool_end", tool=name, success=success, ms=round((time.perf_counter() - t0) * 1000, 1))
+        if name == "search_products" and success and isinstance(result.get("data"), list):
+            _emit("products", products=result["data"][:4])
+        return result
+
+    async def _dispatch_tool(self, name: str, args: dict, api_client) -> dict:
         try:
             if name == "search_products":
-                return self._search(
+                return await self._search(
                     args.get("query", ""),
                     max_price=args.get("max_price"),
                     top_k=int(args.get("top_k") or 5)
                 )
             if name == "get_cart":
-                return api_client.get_cart()
+                return await api_client.get_cart()
             if name == "add_to_cart":
-                return api_client.add_to_cart(args["product_id"], quantity=int(args.get("quantity") or 1))
+                return await api_client.add_to_cart(args["product_id"], quantity=int(args.get("quantity") or 1))
             if name == "remove_from_cart":
-                return api_client.remove_from_cart(args["product_id"])
+                return await api_client.remove_from_cart(args["product_id"])
             if name == "update_cart_item":
-                return api_client.update_cart_item(args["product_id"], quantity=int(args["quantity"]))
+                return await api_client.update_cart_item(args["product_id"], quantity=int(args["quantity"]))
             if name == "get_default_address":
-                return api_client.get_default_address()
+                return await api_client.get_default_address()
             if name == "place_order":
                 # Snapshot cart BEFORE placing (for ORDER_SUCCESS items on timeout)
-                cart       = api_client.get_cart()
+                cart       = await api_client.get_cart()
                 cart_items = (cart.get("data") or {}).get("items") or []
-                result     = api_client.place_order(args["shipping_address_id"])
+                result     = await api_client.place_order(args["shipping_address_id"])
                 if result.get("success") and result.get("data"):
                     data = result["data"]
                     if not data.get("items") and cart_items:
@@ -690,11 +1042,11 @@ class ShoppingAgent:
                         ]
                 return result
             if name == "get_orders":
-                return api_client.get_orders()
+                return await api_client.get_orders()
             if name == "cancel_order":
-                return api_client.cancel_order(args["order_id"])
+                return await api_client.cancel_order(args["order_id"])
             if name == "compare_products":
-                return api_client.compare_products(args["product_ids"])
+                return await api_client.compare_products(args["product_ids"])
             return {"success": False, "message": f"Unknown tool: {name}"}
         except Exception as e:
             logger.error("Tool %s error: %s", name, e)
@@ -744,11 +1096,12 @@ class ShoppingAgent:
             logger.info("Recovered add_to_cart product_id from search results: ...%s", best_id[-6:])
         return args
 
-    def _search(self, query: str, max_price=None, top_k: int = 5) -> dict:
+    async def _search(self, query: str, max_price=None, top_k: int = 5) -> dict:
         if self._search_service:
             try:
                 from models import SearchRequest
-                resp = self._search_service.search(SearchRequest(
+                # SemanticSearchService is sync (pymongo + torch) -- run it off the loop
+                resp = await asyncio.to_thread(self._search_service.search, SearchRequest(
                     query=query, top_k=top_k,
                     max_price=float(max_price) if max_price else None
                 ))
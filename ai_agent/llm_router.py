@@ -0,0 +1,424 @@
+"""
+llm_router.py
+Chat-completion providers, and the router that picks one for each call.
+
+The agent used to be wired to AsyncGroq and LLM_MODEL. Now each completion
+goes to a provider from LLM_PROVIDERS, chosen per agent iteration:
+
+  - A provider is one model behind an OpenAI-style chat-completions API
+    with tools: `groq` (the Groq SDK, as before) or `openai` / `anthropic`
+    / `ollama` (an OpenAI-compatible /v1/chat/completions over httpx, which
+    also covers vLLM and benchmarks/fakes.py). Every response is parsed
+    into the groq SDK's types, so the agent loop reads them the same way.
+    Without LLM_PROVIDERS it is the one LLM_PROVIDER with LLM_MODEL
+  - Each provider keeps a rolling window of its last LLM_ROUTER_WINDOW
+    requests: p95 latency (time to response; for a stream, time to its
+    first byte) and error rate
+  - A call goes to the healthy provider with the lowest p95. LLM_PROVIDERS
+    order breaks ties; providers without LLM_ROUTER_MIN_SAMPLES successful
+    requests yet (new, or only failing) rank after every measured one, in
+    that order. A small LLM_ROUTER_EXPLORE share of calls goes to another
+    healthy provider, so its numbers stay current
+  - A provider whose error rate passes LLM_ROUTER_MAX_ERROR_RATE sits out
+    for LLM_ROUTER_COOLDOWN seconds. Failures another provider could serve
+    (429, 5xx, connection errors, a shed or timed-out call) fail over to
+    the next one; request errors (400 tool_use_failed, ...) are raised
+  - A non-streaming call still running after LLM_HEDGE_AFTER_MS (0 = the
+    provider's own p95) is hedged: the same request goes to the next
+    provider and the first answer wins. At most LLM_HEDGE_MAX_RATIO of
+    calls are hedged, since each hedge costs tokens twice
+
+Every provider has its own groq_scheduler.py queue, fed by its
+x-ratelimit-* headers. stats(): per-provider requests, p50 / p95, error
+rate and health; hedges, hedge wins and failovers.
+"""
+
+import os
+import json
+import random
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from groq_scheduler import GROQ_SCHEDULER_ENABLED, GroqScheduler, SchedulerRejected
+from rate_limit import RateLimitExceeded
+from metrics import LLM_PROVIDER_SECONDS, LLM_ROUTER_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LLM_PROVIDERS             = os.getenv("LLM_PROVIDERS", "")     # "kind:model@base_url,..."; "" = LLM_PROVIDER
+LLM_PROVIDER              = os.getenv("LLM_PROVIDER", "groq").lower()   # single provider, with LLM_MODEL
+OPENAI_API_KEY            = os.getenv("OPENAI_API_KEY", "")
+OPENAI_BASE_URL           = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+ANTHROPIC_API_KEY         = os.getenv("ANTHROPIC_API_KEY", "")
+ANTHROPIC_BASE_URL        = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com/v1")   # OpenAI-compatible API
+OLLAMA_BASE_URL           = os.getenv("OLLAMA_BASE_URL") or os.getenv("LLM_BASE_URL", "http://localhost:11434")
+LLM_PROVIDER_TIMEOUT      = float(os.getenv("LLM_PROVIDER_TIMEOUT", "60"))
+LLM_ROUTER_WINDOW         = int(os.getenv("LLM_ROUTER_WINDOW", "100"))
+LLM_ROUTER_MIN_SAMPLES    = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+LLM_ROUTER_COOLDOWN       = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))
+LLM_ROUTER_EXPLORE        = float(os.getenv("LLM_ROUTER_EXPLORE", "0.05"))
+LLM_HEDGE_ENABLED         = os.getenv("LLM_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_AFTER_MS        = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+LLM_HEDGE_MAX_RATIO       = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+
+T = TypeVar("T")
+
+# kind → (default model, base URL, API key) for providers reached over the OpenAI format
+_OPENAI_COMPATIBLE = {
+    "openai":    ("gpt-4o-mini", OPENAI_BASE_URL, OPENAI_API_KEY),
+    "anthropic": ("claude-haiku-4-5", ANTHROPIC_BASE_URL, ANTHROPIC_API_KEY),
+    "ollama":    ("llama3.1", OLLAMA_BASE_URL.rstrip("/") + ("" if OLLAMA_BASE_URL.rstrip("/").endswith("/v1") else "/v1"), ""),
+}
+
+
+class ProviderError(Exception):
+    """Error status from an OpenAI-compatible provider; the message keeps the provider's error body."""
+
+    def __init__(self, provider: str, status_code: Optional[int], message: str, response=None):
+        super().__init__(f"Error code: {status_code} from {provider} - {message}" if status_code
+                         else f"{provider} unreachable: {message}")
+        self.status_code = status_code
+        self.response    = response
+
+
+class ProviderConnectionError(ProviderError, ConnectionError):
+    pass
+
+
+def is_failover_error(e: BaseException) -> bool:
+    """Would another provider likely have served this call?"""
+    status = getattr(e, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return (isinstance(e, (SchedulerRejected, RateLimitExceeded, ConnectionError, TimeoutError))
+            or type(e).__name__ in ("APIConnectionError", "APITimeoutError"))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Providers
+# ─────────────────────────────────────────────────────────────────────────────
+class ChatProvider:
+    """One model behind a chat-completions API; create() is a single request, no retries."""
+
+    kind = ""
+
+    def __init__(self, model: str, base_url: Optional[str] = None):
+        self.model     = model
+        self.base_url  = base_url
+        self.name      = f"{self.kind}:{model}"
+        self.scheduler = GroqScheduler() if GROQ_SCHEDULER_ENABLED else None
+
+    async def create(self, **kwargs) -> Tuple[Any, Any]:
+        """(ChatCompletion, or an async iterator of chunks when stream=True; response headers)."""
+        raise NotImplementedError
+
+
+class GroqProvider(ChatProvider):
+    kind = "groq"
+
+    def __init__(self, model: str, api_key: str, base_url: Optional[str] = None):
+        super().__init__(model, base_url)
+        from groq import AsyncGroq
+        # The scheduler owns retries (429s pause the whole queue); without it the SDK's apply
+        retries = {"max_retries": 0} if self.scheduler else {}
+        self._client = AsyncGroq(api_key=api_key, base_url=base_url, **retries)
+
+    async def create(self, **kwargs) -> Tuple[Any, Any]:
+        raw = await self._client.chat.completions.with_raw_response.create(model=self.model, **kwargs)
+        return await raw.parse(), raw.headers
+
+
+class OpenAICompatProvider(ChatProvider):
+    """OpenAI-compatible /chat/completions (OpenAI, Ollama, vLLM, fakes) over httpx."""
+
+    def __init__(self, kind: str, model: str, base_url: str, api_key: str = ""):
+        self.kind = kind
+        super().__init__(model, base_url.rstrip("/"))
+        import httpx
+        from groq.types.chat import ChatCompletion, ChatCompletionChunk
+        self._httpx = httpx
+        self._completion, self._chunk = ChatCompletion, ChatCompletionChunk
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._http = httpx.AsyncClient(base_url=self.base_url, headers=headers,
+                                       timeout=httpx.Timeout(LLM_PROVIDER_TIMEOUT, connect=5.0))
+
+    async def create(self, **kwargs) -> Tuple[Any, Any]:
+        stream = bool(kwargs.get("stream"))
+        body = {"model": self.model, **kwargs}
+        if stream:
+            body.setdefault("stream_options", {"include_usage": True})
+        try:
+            request = self._http.build_request("POST", "/chat/completions", json=body)
+            resp = await self._http.send(request, stream=stream)
+        except self._httpx.TransportError as e:
+            raise ProviderConnectionError(self.name, None, str(e) or type(e).__name__) from e
+        if resp.status_code >= 400:
+            await resp.aread()
+            await resp.aclose()
+            raise ProviderError(self.name, resp.status_code, resp.text[:500], response=resp)
+        if stream:
+            return self._chunks(resp), resp.headers
+        return self._completion.construct(**resp.json()), resp.headers
+
+    async def _chunks(self, resp):
+        try:
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                yield self._chunk.construct(**json.loads(data))
+        finally:
+            await resp.aclose()
+
+
+def parse_providers(spec: str) -> List[Tuple[str, str, Optional[str]]]:
+    """"groq:llama-3.1-8b-instant,ollama:llama3.1:8b@http://gpu:11434/v1" → [(kind, model, base_url)]."""
+    out = []
+    for item in (s.strip() for s in spec.split(",")):
+        if not item:
+            continue
+        kind, _, rest = item.partition(":")
+        model, _, base_url = rest.partition("@")
+        out.append((kind.strip().lower(), model.strip(), base_url.strip() or None))
+    return out
+
+
+def build_providers(spec: str, model: str, groq_api_key: str,
+                    groq_base_url: Optional[str] = None) -> List[ChatProvider]:
+    """
+    Providers from LLM_PROVIDERS; when unset, the single LLM_PROVIDER with
+    `model` (LLM_MODEL). Unusable entries are logged and skipped.
+    """
+    entries = parse_providers(spec)
+    if not entries and LLM_PROVIDER != "none":
+        entries = [(LLM_PROVIDER, model, None)]
+    providers: List[ChatProvider] = []
+    for kind, name, base_url in entries:
+        try:
+            if kind == "groq":
+                if not groq_api_key:
+                    logger.warning("GROQ_API_KEY not set, skipping groq:%s", name or model)
+                    continue
+                providers.append(GroqProvider(name or model, groq_api_key, base_url or groq_base_url))
+            elif kind in _OPENAI_COMPATIBLE:
+                default_model, default_url, api_key = _OPENAI_COMPATIBLE[kind]
+                providers.append(OpenAICompatProvider(kind, name or default_model, base_url or default_url, api_key))
+            else:
+                logger.warning("Unknown LLM provider kind %r", kind)
+        except Exception as e:
+            logger.error("LLM provider %s:%s init failed: %s", kind, name, e)
+    return providers
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Router
+# ─────────────────────────────────────────────────────────────────────────────
+class _Health:
+    """Rolling latency / error window of one provider."""
+
+    def __init__(self, window: int):
+        self.latencies: deque = deque(maxlen=window)     # seconds, successful requests
+        self.outcomes:  deque = deque(maxlen=window)     # 1 = failed
+        self.down_until = 0.0
+        self.requests   = 0
+        self.ejections  = 0
+
+    def record(self, seconds: float, failed: bool) -> None:
+        self.requests += 1
+        self.outcomes.append(1 if failed else 0)
+        if not failed:
+            self.latencies.append(seconds)
+        elif (len(self.outcomes) >= LLM_ROUTER_MIN_SAMPLES
+              and self.error_rate() > LLM_ROUTER_MAX_ERROR_RATE and not self.down(time.monotonic())):
+            self.down_until = time.monotonic() + LLM_ROUTER_COOLDOWN
+            self.outcomes.clear()            # judged afresh once back
+            self.ejections += 1
+
+    def down(self, now: float) -> bool:
+        return now < self.down_until
+
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < LLM_ROUTER_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMRouter:
+    def __init__(self, providers: List[ChatProvider], hedge: bool = LLM_HEDGE_ENABLED,
+                 hedge_after_ms: float = LLM_HEDGE_AFTER_MS, hedge_max_ratio: float = LLM_HEDGE_MAX_RATIO,
+                 explore: float = LLM_ROUTER_EXPLORE, window: int = LLM_ROUTER_WINDOW):
+        self.providers       = providers
+        self.hedge           = hedge and len(providers) > 1
+        self.hedge_after_ms  = hedge_after_ms
+        self.hedge_max_ratio = hedge_max_ratio
+        self.explore         = explore
+        self._health = {p.name: _Health(window) for p in providers}
+
+        self.calls      = 0
+        self.hedges     = 0
+        self.hedge_wins = 0
+        self.failovers  = 0
+
+    def ranked(self) -> List[ChatProvider]:
+        """Healthy providers fastest first (unmeasured last), then those cooling down (soonest back first)."""
+        now = time.monotonic()
+        order = {p.name: i for i, p in enumerate(self.providers)}
+        healthy = [p for p in self.providers if not self._health[p.name].down(now)]
+
+        def rank(p):
+            p95 = self._health[p.name].quantile(0.95)
+            return (p95 is None, p95 or 0.0, order[p.name])     # unmeasured after measured
+
+        healthy.sort(key=rank)
+        if len(healthy) > 1 and random.random() < self.explore:
+            pick = random.randrange(1, len(healthy))
+            healthy.insert(0, healthy.pop(pick))
+        down = sorted((p for p in self.providers if self._health[p.name].down(now)),
+                      key=lambda p: self._health[p.name].down_until)
+        return healthy + down
+
+    async def create(self, provider: ChatProvider, **kwargs) -> Tuple[Any, Any]:
+        """provider.create(), timed into its health window."""
+        t0 = time.monotonic()
+        try:
+            result = await provider.create(**kwargs)
+        except asyncio.CancelledError:
+            # Lost a hedge: it took at least this long, which its p95 should show
+            self._health[provider.name].record(time.monotonic() - t0, False)
+            raise
+        except Exception as e:
+            seconds = time.monotonic() - t0
+            failed = is_failover_error(e)
+            if failed:
+                self._health[provider.name].record(seconds, True)
+            LLM_PROVIDER_SECONDS.observe(seconds, provider=provider.name, outcome="error" if failed else "rejected")
+            raise
+        seconds = time.monotonic() - t0
+        self._health[provider.name].record(seconds, False)
+        LLM_PROVIDER_SECONDS.observe(seconds, provider=provider.name, outcome="ok")
+        return result
+
+    async def run(self, call: Callable[[ChatProvider, bool], Awaitable[T]], hedge: bool = True) -> T:
+        """
+        call(provider, fallback) makes one complete request on that provider
+        (its queue and retries included); fallback=True means another
+        healthy provider is next in line, so failing fast beats retrying.
+        Routed to the fastest healthy provider, hedged if slow, failed over
+        on provider errors.
+        """
+        if not self.providers:
+            raise ProviderConnectionError("llm_router", None, "no LLM provider configured")
+        self.calls += 1
+        order = self.ranked()
+        i = 0
+        while True:
+            primary = order[i]
+            backup  = order[i + 1] if i + 1 < len(order) else None
+            try:
+                if hedge and self.hedge and backup is not None:
+                    tried = 2
+                    return await self._hedged(call, primary, backup, self._fallback(order, i + 1))
+                tried = 1
+                return await call(primary, self._fallback(order, i))
+            except Exception as e:
+                i += tried if isinstance(e, _BothFailed) else 1
+                error = e.error if isinstance(e, _BothFailed) else e
+                if not is_failover_error(error) or i >= len(order):
+                    raise error
+                self.failovers += 1
+                LLM_ROUTER_EVENTS.inc(event="failover", provider=order[i].name)
+                logger.warning("LLM call failed on %s, failing over to %s: %s",
+                               order[i - 1].name, order[i].name, str(error)[:200])
+
+    def _fallback(self, order: List[ChatProvider], i: int) -> bool:
+        """Is there a healthy provider after order[i]?"""
+        now = time.monotonic()
+        return any(not self._health[p.name].down(now) for p in order[i + 1:])
+
+    def _hedge_delay(self, provider: ChatProvider) -> Optional[float]:
+        if self.hedges >= self.hedge_max_ratio * self.calls:
+            return None
+        if self.hedge_after_ms > 0:
+            return self.hedge_after_ms / 1000.0
+        return self._health[provider.name].quantile(0.95)
+
+    async def _hedged(self, call: Callable[[ChatProvider, bool], Awaitable[T]],
+                      primary: ChatProvider, backup: ChatProvider, backup_fallback: bool) -> T:
+        delay = self._hedge_delay(primary)
+        if delay is None or self._health[backup.name].down(time.monotonic()):
+            return await call(primary, not self._health[backup.name].down(time.monotonic()))
+        first = asyncio.ensure_future(call(primary, True))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        self.hedges += 1
+        LLM_ROUTER_EVENTS.inc(event="hedge", provider=backup.name)
+        second = asyncio.ensure_future(call(backup, backup_fallback))
+        pending = {first, second}
+        for task in pending:
+            task.add_done_callback(_consume)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                            LLM_ROUTER_EVENTS.inc(event="hedge_won", provider=backup.name)
+                        return task.result()
+                    error = task.exception()
+            raise _BothFailed(error)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        providers = {}
+        for p in self.providers:
+            h = self._health[p.name]
+            p50, p95 = h.quantile(0.5), h.quantile(0.95)
+            providers[p.name] = {
+                "healthy":    not h.down(now),
+                "requests":   h.requests,
+                "p50_ms":     round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms":     round(p95 * 1000, 1) if p95 is not None else None,
+                "error_rate": round(h.error_rate(), 4),
+                "ejections":  h.ejections,
+                "queue":      p.scheduler.stats() if p.scheduler else {"enabled": False},
+            }
+        return {
+            "enabled":    True,
+            "order":      [p.name for p in self.ranked()],
+            "calls":      self.calls,
+            "hedges":     self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers":  self.failovers,
+            "providers":  providers,
+        }
+
+
+class _BothFailed(Exception):
+    """Primary and hedge both failed; carries the last error."""
+
+    def __init__(self, error: BaseException):
+        super().__init__(str(error))
+        self.error = error
+
+
+def _consume(task: asyncio.Future) -> None:
+    """Retrieve a hedge task's outcome so a losing failure isn't logged as never retrieved."""
+    if not task.cancelled():
+        task.exception()
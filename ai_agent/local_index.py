@@ -0,0 +1,321 @@
+"""
+local_index.py
+In-memory vector index — a local alternative / fallback to Atlas $vectorSearch.
+
+Every product's `embedding` is copied into one contiguous float32 matrix that is
+saved as a snapshot and memory-mapped back at startup, so several workers share
+the same pages and a restart doesn't re-read Mongo.
+SemanticSearchService reloads the snapshot when its files are replaced, and
+with SEARCH_BACKEND=local rebuilds it (at most every LOCAL_INDEX_REBUILD_S)
+when the catalog version moves.
+
+  - Brute force: one vectorised dot product over L2-normalised rows (cosine)
+  - ANN: HNSW via the optional `hnswlib` package for large catalogs
+  - Price / stock / category filters use precomputed NumPy arrays (no per-doc
+    Python work) and are applied before ranking
+  - Scores are reported on the same 0..1 scale as Atlas' vectorSearchScore
+
+Snapshot layout (LOCAL_INDEX_PATH):
+    vectors.npy   float32 [N, D], L2-normalised
+    prices.npy    float64 [N]
+    stock.npy     int64   [N]
+    meta.json     list of product dicts (id, name, brand, ...) in row order
+    hnsw.bin      optional HNSW graph
+
+Build a snapshot:
+    python local_index.py build
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from embedding_pipeline import category_key
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LOCAL_INDEX_PATH    = os.getenv("LOCAL_INDEX_PATH", "./index_snapshot")
+LOCAL_INDEX_ANN     = os.getenv("LOCAL_INDEX_ANN", "auto").lower()    # auto | hnsw | off
+ANN_MIN_PRODUCTS    = int(os.getenv("LOCAL_INDEX_ANN_MIN", "50000"))
+HNSW_M              = int(os.getenv("LOCAL_INDEX_HNSW_M", "16"))
+HNSW_EF_CONSTRUCT   = int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH      = int(os.getenv("LOCAL_INDEX_HNSW_EF", "128"))
+LOCAL_INDEX_REBUILD_S = float(os.getenv("LOCAL_INDEX_REBUILD_S", "30"))  # 0 = never rebuild in-process
+ANN_OVERFETCH       = 10   # ANN candidates per result when filters are active
+
+# Fields copied from Mongo into meta.json — same shape the Atlas $project returns
+META_FIELDS = ("name", "description", "brand", "reviewCount", "imageUrl")
+
+
+def _to_float(value) -> float:
+    if value is None:
+        return 0.0
+    if hasattr(value, "to_decimal"):          # bson Decimal128
+        return float(value.to_decimal())
+    if isinstance(value, dict) and "$numberDecimal" in value:
+        return float(value["$numberDecimal"])
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def filter_mask(prices: np.ndarray, stock: np.ndarray, categories: np.ndarray,
+                min_price: Optional[float] = None, max_price: Optional[float] = None,
+                in_stock: Optional[bool] = None,
+                category: Optional[str] = None) -> Optional[np.ndarray]:
+    """Boolean row mask for the search filters, or None when nothing is filtered."""
+    mask = None
+
+    def _and(cond):
+        nonlocal mask
+        mask = cond if mask is None else (mask & cond)
+
+    if min_price is not None:
+        _and(prices >= float(min_price))
+    if max_price is not None:
+        _and(prices <= float(max_price))
+    if in_stock:
+        _and(stock > 0)
+    if category:
+        _and(categories == category_key(category))
+    return mask
+
+
+def _normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+class LocalVectorIndex:
+    """
+    Read-only snapshot of the product vectors plus the metadata needed to
+    build ProductResult objects, queryable without touching Mongo.
+    """
+
+    def __init__(self, path: str = LOCAL_INDEX_PATH, version: int = 0):
+        self.path    = path
+        self.version = version      # catalog version the snapshot was (re)loaded at
+        self.stamp   = self.snapshot_stamp(path)
+        t0 = time.perf_counter()
+        self.vectors: np.ndarray = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.prices:  np.ndarray = np.load(os.path.join(path, "prices.npy"))
+        self.stock:   np.ndarray = np.load(os.path.join(path, "stock.npy"))
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta: List[Dict[str, Any]] = json.load(f)
+        self.categories = np.asarray([category_key(m.get("category")) for m in self.meta], dtype=object)
+
+        self._ann = None
+        self._ann_lock = threading.Lock()
+        if self._want_ann():
+            self._ann = self._load_or_build_hnsw()
+
+        logger.info("✓ Local index loaded: %d products, dim=%d, ann=%s (%.0f ms)",
+                    len(self), self.dim, "hnsw" if self._ann is not None else "off",
+                    (time.perf_counter() - t0) * 1000)
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    @classmethod
+    def exists(cls, path: str = LOCAL_INDEX_PATH) -> bool:
+        return all(os.path.exists(os.path.join(path, f))
+                   for f in ("vectors.npy", "prices.npy", "stock.npy", "meta.json"))
+
+    @staticmethod
+    def snapshot_stamp(path: str = LOCAL_INDEX_PATH) -> Optional[tuple]:
+        """Identity of the snapshot on disk; changes whenever build_snapshot swaps in a new one."""
+        try:
+            st = os.stat(os.path.join(path, "meta.json"))
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    # ── Query ────────────────────────────────────────────────────────────────
+
+    def search(self, query_vector, top_k: int = 5,
+               min_price: Optional[float] = None,
+               max_price: Optional[float] = None,
+               in_stock: Optional[bool] = None,
+               category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return up to top_k product dicts (Atlas $project shape + score),
+        best first. Filters are applied before ranking, so a narrow budget
+        still yields a full page whenever enough products match.
+        """
+        if len(self) == 0:
+            return []
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm > 0:
+            q = q / norm
+
+        mask = filter_mask(self.prices, self.stock, self.categories,
+                           min_price, max_price, in_stock, category)
+
+        if self._ann is not None:
+            rows, sims = self._search_ann(q, top_k, mask)
+            if len(rows) >= top_k or (mask is not None and len(rows) >= int(mask.sum())):
+                return self._docs(rows, sims)
+            # ANN recall too low for a selective filter — fall through to exact
+
+        rows, sims = self._search_exact(q, top_k, mask)
+        return self._docs(rows, sims)
+
+    def _search_exact(self, q: np.ndarray, top_k: int, mask: Optional[np.ndarray]):
+        if mask is None:
+            candidates = None
+            sims = self.vectors @ q
+        else:
+            candidates = np.flatnonzero(mask)
+            if candidates.size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            sims = self.vectors[candidates] @ q
+
+        k = min(top_k, sims.shape[0])
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        rows = top if candidates is None else candidates[top]
+        return rows, sims[top]
+
+    def _search_ann(self, q: np.ndarray, top_k: int, mask: Optional[np.ndarray]):
+        k = top_k if mask is None else min(len(self), top_k * ANN_OVERFETCH)
+        with self._ann_lock:
+            self._ann.set_ef(max(HNSW_EF_SEARCH, k))
+            labels, distances = self._ann.knn_query(q, k=k)
+        rows = labels[0].astype(np.int64)
+        sims = (1.0 - distances[0]).astype(np.float32)   # hnswlib cosine distance = 1 - cos
+        if mask is not None:
+            keep = mask[rows]
+            rows, sims = rows[keep], sims[keep]
+        return rows[:top_k], sims[:top_k]
+
+    def _docs(self, rows: np.ndarray, sims: np.ndarray) -> List[Dict[str, Any]]:
+        docs = []
+        for row, sim in zip(rows.tolist(), sims.tolist()):
+            doc = dict(self.meta[row])
+            doc["price"]         = float(self.prices[row])
+            doc["stockQuantity"] = int(self.stock[row])
+            # Atlas reports cosine similarity as (1 + cos) / 2
+            doc["score"]         = (1.0 + sim) / 2.0
+            docs.append(doc)
+        return docs
+
+    # ── ANN ──────────────────────────────────────────────────────────────────
+
+    def _want_ann(self) -> bool:
+        if LOCAL_INDEX_ANN == "off":
+            return False
+        if LOCAL_INDEX_ANN == "auto" and len(self) < ANN_MIN_PRODUCTS:
+            return False
+        try:
+            import hnswlib  # noqa: F401  (optional dependency)
+            return True
+        except ImportError:
+            logger.warning("hnswlib not installed — local index uses brute force")
+            return False
+
+    def _load_or_build_hnsw(self):
+        import hnswlib
+        index = hnswlib.Index(space="cosine", dim=self.dim)
+        graph_path = os.path.join(self.path, "hnsw.bin")
+        if os.path.exists(graph_path):
+            index.load_index(graph_path, max_elements=len(self))
+        else:
+            logger.info("Building HNSW graph for %d vectors...", len(self))
+            index.init_index(max_elements=len(self), ef_construction=HNSW_EF_CONSTRUCT, M=HNSW_M)
+            index.add_items(np.asarray(self.vectors), np.arange(len(self)))
+            try:
+                index.save_index(graph_path)
+            except OSError as e:
+                logger.warning("Could not persist HNSW graph: %s", e)
+        index.set_ef(HNSW_EF_SEARCH)
+        return index
+
+    # ── Snapshot build ───────────────────────────────────────────────────────
+
+    @staticmethod
+    def build_snapshot(collection, path: str = LOCAL_INDEX_PATH, batch_size: int = 5000) -> int:
+        """
+        Stream every embedded product from Mongo into a snapshot directory.
+        Written to a temp dir first and swapped in, so a running reader never
+        sees a half-written snapshot. Returns the number of products written.
+        """
+        projection = {"_id": 1, "embedding": 1, "price": 1, "stockQuantity": 1,
+                      "category": 1, "rating": 1, **{f: 1 for f in META_FIELDS}}
+        cursor = collection.find({"embedding": {"$exists": True}}, projection,
+                                 batch_size=batch_size)
+
+        vectors: List[np.ndarray] = []
+        prices:  List[float] = []
+        stock:   List[int] = []
+        meta:    List[Dict[str, Any]] = []
+        for doc in cursor:
+            emb = doc.get("embedding")
+            if not emb:
+                continue
+            vectors.append(np.asarray(emb, dtype=np.float32))
+            prices.append(_to_float(doc.get("price")))
+            stock.append(int(doc.get("stockQuantity") or 0))
+            entry = {"_id": str(doc["_id"]), "category": doc.get("category"),
+                     "rating": _to_float(doc.get("rating"))}
+            for field in META_FIELDS:
+                if doc.get(field) is not None:
+                    entry[field] = doc[field]
+            meta.append(entry)
+
+        matrix = _normalise_rows(np.vstack(vectors)) if vectors else np.zeros((0, 0), np.float32)
+
+        tmp = f"{path.rstrip('/')}.tmp.{os.getpid()}"     # per process: workers may rebuild at once
+        os.makedirs(tmp, exist_ok=True)
+        np.save(os.path.join(tmp, "vectors.npy"), matrix)
+        np.save(os.path.join(tmp, "prices.npy"), np.asarray(prices, dtype=np.float64))
+        np.save(os.path.join(tmp, "stock.npy"), np.asarray(stock, dtype=np.int64))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, default=str, ensure_ascii=False)
+
+        if os.path.isdir(path):
+            old = f"{path.rstrip('/')}.old.{os.getpid()}"
+            shutil.rmtree(old, ignore_errors=True)
+            os.rename(path, old)
+            os.rename(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.rename(tmp, path)
+
+        logger.info("✓ Local index snapshot written: %d products → %s", len(meta), path)
+        return len(meta)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# CLI
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+
+    parser = argparse.ArgumentParser(description="Local vector index snapshot tool")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--out", default=LOCAL_INDEX_PATH, help="snapshot directory")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    coll   = client[os.getenv("DB_NAME", "ECommerceDB")]["products"]
+    LocalVectorIndex.build_snapshot(coll, args.out)
+    client.close()
@@ -1,26 +1,35 @@
 """
-main.py  (v2)
+main.py  (v3)
 FastAPI entry point for the ShopAI agent.
 Thin by design — only wires up services and routes.
+Startup is staged: the app answers immediately, while the embedding model,
+Mongo and the Groq client load concurrently in the background (GET /ready).
+Heavy modules (torch, pymongo, groq) are imported by those stages, not here.
 Run locally:
     uvicorn main:app --reload --port 7860
 On HF Spaces: started automatically via Dockerfile CMD.
 """
 
 import os
+import json
+import time
+import asyncio
 import logging
 import base64
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pydantic import BaseModel
 
 load_dotenv()
 
-from models       import ChatRequest, ChatResponse, SearchRequest, SearchResponse
-from orchestrator import ShoppingAgentOrchestrator
-from semantic_search import SemanticSearchService
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from models       import (ChatRequest, ChatResponse, SearchRequest, SearchResponse,
+                          BatchSearchRequest, BatchSearchResponse)
+from readiness    import Readiness
+import metrics
 
 
 class SpeechTranscribeRequest(BaseModel):
@@ -56,52 +65,163 @@ app.add_middleware(
 )
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Startup — load heavy resources ONCE
+# Startup — load heavy resources ONCE, in the background
 # ─────────────────────────────────────────────────────────────────────────────
-orchestrator:   ShoppingAgentOrchestrator = None
-search_service: SemanticSearchService     = None
+orchestrator      = None   # ShoppingAgentOrchestrator, set once the "llm" stage is ready
+search_service    = None   # SemanticSearchService, set once the "search" stage is ready
+embedding_watcher = None   # optional in-process change-stream worker (EMBED_WATCHER_ENABLED)
+startup_task      = None
+
+readiness = Readiness(
+    components=("embedding_model", "mongo", "search", "llm"),
+    required=("search", "llm"),
+)
+
+
+# Scrape-time collectors: cache counters live in the search service, stage state in readiness
+metrics.REGISTRY.register_collector(metrics.cache_collector(
+    "embedding_cache", "Query embedding cache",
+    lambda: search_service.cache_stats() if search_service else {"enabled": False}))
+metrics.REGISTRY.register_collector(metrics.cache_collector(
+    "search_result_cache", "Search result cache",
+    lambda: search_service.result_cache_stats() if search_service else {"enabled": False}))
+metrics.REGISTRY.register_collector(metrics.cache_collector(
+    "session_cache", "Per-user session context cache",
+    lambda: orchestrator.agent.session_stats() if orchestrator else {"enabled": False}))
+metrics.REGISTRY.register_collector(lambda: [(
+    "shopai_component_ready", "gauge", "1 when a startup component is ready",
+    [("", {"component": name}, 1.0 if readiness.is_ready(name) else 0.0)
+     for name in readiness.snapshot()["components"]],
+)])
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latency histogram per route template (not raw path), method and status."""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        if path != "/metrics":
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - t0, route=path,
+                                                 method=request.method, status=str(status))
+
+
+def _not_ready(component: str) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"{component} not ready ({readiness.status(component)})",
+        headers={"Retry-After": "2"},
+    )
+
+
+# Blocking loaders — run in worker threads, so even their imports stay off the loop
+def _load_orchestrator():
+    from orchestrator import ShoppingAgentOrchestrator
+    return ShoppingAgentOrchestrator()
+
+
+def _load_encoder():
+    from encoders import get_encoder
+    return get_encoder()
+
+
+def _connect_mongo():
+    from semantic_search import connect_mongo
+    return connect_mongo()
+
+
+def _load_search(model, client):
+    from semantic_search import SemanticSearchService
+    return SemanticSearchService(model, client)
+
+
+async def _start_llm():
+    global orchestrator
+    orch = await readiness.run("llm", _load_orchestrator)
+    if orch is None:
+        return
+    if not orch.agent.llm_available():
+        # Fast-path turns still work; everything else would answer "unavailable"
+        readiness.degrade("llm", "no LLM provider configured (set GROQ_API_KEY or LLM_PROVIDERS)")
+    # Whichever stage finishes second wires search into the agent
+    if search_service:
+        orch.set_search_service(search_service)
+    orchestrator = orch
+
+
+async def _start_search():
+    global search_service, embedding_watcher
+    model, client = await asyncio.gather(
+        readiness.run("embedding_model", _load_encoder),
+        readiness.run("mongo", _connect_mongo),
+    )
+    if model is None:
+        readiness.fail("search", "embedding model failed to load")
+        return
+    # client=None → the service retries Mongo itself (and may serve a local snapshot)
+    svc = await readiness.run("search", _load_search, model, client)
+    if svc is None:
+        return
+    search_service = svc
+    if orchestrator:
+        orchestrator.set_search_service(svc)
+
+    if os.getenv("EMBED_WATCHER_ENABLED", "false").lower() in ("1", "true", "yes"):
+        from embedding_watcher import EmbeddingWatcher
+        embedding_watcher = EmbeddingWatcher(svc.collection, encode=svc.model.encode)
+        embedding_watcher.start_background()
+        logger.info("✅ Embedding watcher tailing products")
+
+
+async def _load_components():
+    await asyncio.gather(_start_llm(), _start_search())
+    logger.info(f"✅ Startup finished — ready={readiness.ready}")
+
 
 @app.on_event("startup")
 async def startup():
-    global orchestrator, search_service
+    global startup_task
 
     logger.info("Starting ShopAI...")
     logger.info(f"API_BASE_URL = {os.getenv('API_BASE_URL', 'NOT SET')}")
     logger.info(f"MONGO_URI = {'SET' if os.getenv('MONGO_URI') else 'NOT SET'}")
     logger.info(f"DB_NAME = {os.getenv('DB_NAME', 'NOT SET')}")
 
-    logger.info("Initialising semantic search service...")
-    search_service = SemanticSearchService()
-
-    logger.info("Initialising orchestrator...")
-    try:
-        orchestrator = ShoppingAgentOrchestrator()
-        # Wire in the already-loaded search service so the orchestrator
-        # can do instant local semantic search (no Render round-trip needed)
-        if search_service:
-            orchestrator.set_search_service(search_service)
-        logger.info("✅ Orchestrator ready")
-    except Exception as e:
-        logger.error(f"❌ Orchestrator failed: {e}")
-
-    logger.info(f"✅ Service ready on port {os.getenv('PORT', '7860')}")
+    # Don't block: the server starts accepting requests right away
+    startup_task = asyncio.create_task(_load_components())
+    logger.info(f"✅ Listening on port {os.getenv('PORT', '7860')} — components loading in background")
 
     # Warm up Render.com free tier in the background so the first user request is fast.
     # We use a dummy JWT — the warmup just needs Render to boot, not authenticate.
-    import asyncio
     async def _warmup():
-        import time
         await asyncio.sleep(3)   # let HF Spaces finish startup first
         try:
             from api_client import APIClient
             dummy = APIClient(os.getenv("API_BASE_URL", ""), "warmup")
             logger.info("🔥 Sending warmup ping to Render.com...")
-            dummy.warmup()
+            await dummy.warmup()
         except Exception as e:
             logger.warning(f"🔥 Warmup error: {e}")
     asyncio.create_task(_warmup())
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    from api_client import close_http_client
+    if startup_task and not startup_task.done():
+        startup_task.cancel()
+    if embedding_watcher:
+        embedding_watcher.stop()
+    await close_http_client()
+    logger.info("HTTP pool closed")
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Routes
 # ─────────────────────────────────────────────────────────────────────────────
@@ -114,9 +234,13 @@ async def root():
         "status":  "running",
         "endpoints": {
             "chat":   "POST /chat",
+            "chat_stream": "POST /chat/stream",
             "search": "POST /search",
+            "search_batch": "POST /search/batch",
             "speech": "POST /speech/transcribe",
             "health": "GET  /health",
+            "ready":  "GET  /ready",
+            "metrics": "GET  /metrics",
             "docs":   "GET  /docs",
         }
     }
@@ -124,16 +248,40 @@ async def root():
 
 @app.get("/health")
 async def health():
+    """Liveness: answers as soon as the process is up, whatever is still loading."""
     return {
         "status":    "healthy",
+        "ready":     readiness.ready,
         "timestamp": datetime.now().isoformat(),
         "services": {
             "orchestrator":    orchestrator    is not None,
             "semantic_search": search_service  is not None,
-        }
+        },
+        "embedding_cache": search_service.cache_stats() if search_service else None,
+        "embedding_batcher": search_service.batcher_stats() if search_service else None,
+        "search_cache":      search_service.result_cache_stats() if search_service else None,
+        "embedding_watcher": embedding_watcher.stats() if embedding_watcher else None,
+        "session_cache":     orchestrator.agent.session_stats() if orchestrator else None,
+        "fast_path":         orchestrator.agent.fast_path_stats() if orchestrator else None,
+        "prompt_budget":     orchestrator.agent.budget_stats() if orchestrator else None,
+        "tool_select":       orchestrator.agent.tool_select_stats() if orchestrator else None,
+        "rate_limit":        orchestrator.agent.rate_limit_stats() if orchestrator else None,
+        "llm_router":        orchestrator.agent.router_stats() if orchestrator else None,
     }
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once search + LLM are loaded, else 503. Per-component status either way."""
+    return JSONResponse(status_code=200 if readiness.ready else 503, content=readiness.snapshot())
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text exposition — scrape directly, no exporter needed."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
@@ -141,7 +289,7 @@ async def chat(request: ChatRequest):
     jwt_token in the body is forwarded to .NET for authenticated API calls.
     """
     if orchestrator is None:
-        raise HTTPException(status_code=503, detail="Orchestrator not ready")
+        raise _not_ready("llm")
     try:
         return await orchestrator.process_message(request)
     except Exception as e:
@@ -149,6 +297,32 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    /chat as Server-Sent Events. Progress arrives while the agent works:
+      tool_start / tool_end  {tool, success, ms}
+      products               {products: [...]}   (search results, for cards)
+      token                  {text}              (answer text as Groq streams it)
+      reset                  {}                  (discard streamed text so far)
+    then exactly one terminal event: `done` (the ChatResponse) or `error`.
+    The `done` response is authoritative — it may differ from the streamed
+    tokens (order card formatting, leaked tool-call repair).
+    """
+    if orchestrator is None:
+        raise _not_ready("llm")
+
+    async def events():
+        async for event, data in orchestrator.stream_message(request):
+            if event == "ping":
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.post("/search", response_model=SearchResponse)
 async def semantic_search(request: SearchRequest):
     """
@@ -156,16 +330,43 @@ async def semantic_search(request: SearchRequest):
     Called by the .NET SearchController as well as the chat agent internally.
     """
     if search_service is None:
-        raise HTTPException(status_code=503, detail="Search service not ready")
+        raise _not_ready("search")
     if not request.query or not request.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     try:
-        return search_service.search(request)
+        # pymongo + the embedding model are blocking — keep them off the event loop
+        return await asyncio.to_thread(search_service.search, request)
     except Exception as e:
         logger.error(f"Search error for query='{request.query}': {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def semantic_search_batch(request: BatchSearchRequest):
+    """
+    Several searches in one round trip (e.g. the agent's comparison flows).
+    Queries are encoded together and retrieved concurrently; responses come
+    back in request order.
+    """
+    if search_service is None:
+        raise _not_ready("search")
+    from semantic_search import SEARCH_BATCH_MAX_QUERIES
+
+    if not request.searches:
+        raise HTTPException(status_code=400, detail="searches cannot be empty")
+    if len(request.searches) > SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {SEARCH_BATCH_MAX_QUERIES} searches per batch")
+    if any(not s.query or not s.query.strip() for s in request.searches):
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    try:
+        responses = await asyncio.to_thread(search_service.search_many, request.searches)
+        return BatchSearchResponse(responses=responses, total=len(responses))
+    except Exception as e:
+        logger.error(f"Batch search error ({len(request.searches)} queries): {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/speech/transcribe", response_model=SpeechTranscribeResponse)
 async def speech_transcribe(request: SpeechTranscribeRequest):
     """
@@ -207,10 +408,10 @@ async def speech_transcribe(request: SpeechTranscribeRequest):
     model = os.getenv("STT_MODEL", "whisper-large-v3")
 
     try:
-        from groq import Groq
+        from groq import AsyncGroq
 
-        client = Groq(api_key=groq_key)
-        transcription = client.audio.transcriptions.create(
+        client = AsyncGroq(api_key=groq_key)
+        transcription = await client.audio.transcriptions.create(
             file=(f"voice.{extension}", audio_bytes),
             model=model,
             language=(request.language or "en")[:8],
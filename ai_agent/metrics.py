@@ -0,0 +1,260 @@
+"""
+metrics.py
+In-process Prometheus metrics for the agent, served as text exposition
+format (0.0.4) on GET /metrics — no client library or push gateway needed;
+Prometheus / Grafana Agent / VictoriaMetrics can scrape it directly.
+
+  - Counter and Histogram with labels, safe to update from worker threads
+  - Collectors: callbacks evaluated at scrape time, for values that already
+    live elsewhere (embedding / result cache counters, readiness)
+  - Every metric the agent records is declared here, in one catalogue
+
+    from metrics import TOOL_SECONDS
+    with TOOL_SECONDS.time(tool="get_cart"):
+        ...
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Latency buckets (seconds): sub-ms cache hits up to 60s Render cold starts
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS   = (50, 100, 250, 500, 1000, 2000, 4000, 6000, 8000, 16000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample   = Tuple[str, Dict[str, str], float]          # (name suffix, labels, value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = "untyped"
+    family_suffix = ""      # appended to name in # HELP / # TYPE and on every sample
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name       = name
+        self.help       = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock      = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple((n, str(labels.get(n, ""))) for n in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+    family_suffix = "_total"     # 0.0.4 format: the family is named like its samples
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [("", dict(k), v) for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, list] = {}     # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def samples(self) -> List[Sample]:
+        out: List[Sample] = []
+        with self._lock:
+            for key, series in self._series.items():
+                labels = dict(key)
+                for bound, count in zip(self.buckets, series):
+                    out.append(("_bucket", {**labels, "le": _fmt_value(bound)}, count))
+                out.append(("_bucket", {**labels, "le": "+Inf"}, series[-1]))
+                out.append(("_sum", labels, series[-2]))
+                out.append(("_count", labels, series[-1]))
+        return out
+
+
+class _Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+        """fn() → iterable of (name, type, help, samples), evaluated on every scrape."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def _family(name, mtype, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {mtype}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_fmt_labels(labels)} {_fmt_value(value)}")
+
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        for m in metrics:
+            _family(m.name + m.family_suffix, m.type, m.help, m.samples())
+        for fn in collectors:
+            try:
+                for family in fn():
+                    _family(*family)
+            except Exception as e:   # a broken collector must not break the scrape
+                lines.append(f"# collector error: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = _Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Metric catalogue
+# ─────────────────────────────────────────────────────────────────────────────
+HTTP_REQUEST_SECONDS = Histogram(
+    "shopai_http_request_duration_seconds",
+    "Latency of HTTP requests by route, method and status",
+    ("route", "method", "status"))
+
+GROQ_REQUEST_SECONDS = Histogram(
+    "shopai_groq_request_duration_seconds",
+    "Latency of Groq chat completions", ("outcome",))
+GROQ_TOKENS = Counter(
+    "shopai_groq_tokens",
+    "Groq tokens consumed, by direction (in = prompt, out = completion)", ("direction",))
+GROQ_TOKENS_PER_TURN = Histogram(
+    "shopai_groq_tokens_per_turn",
+    "Groq tokens used by one /chat turn (all agent iterations)", ("direction",),
+    buckets=TOKEN_BUCKETS)
+
+TOOL_CALLS = Counter(
+    "shopai_tool_calls",
+    "Agent tool executions by tool name and outcome", ("tool", "success"))
+TOOL_SECONDS = Histogram(
+    "shopai_tool_duration_seconds",
+    "Agent tool execution time by tool name", ("tool",))
+
+CHAT_TURN_SECONDS = Histogram(
+    "shopai_chat_turn_duration_seconds",
+    "Agent turn time by path (fast_path | agent) and resulting action", ("path", "action"))
+FAST_PATH_TURNS = Counter(
+    "shopai_fast_path_turns",
+    "Messages matched by the fast-path router, by intent and outcome (handled | fallback)",
+    ("intent", "outcome"))
+
+PROMPT_TOKENS_ESTIMATE = Histogram(
+    "shopai_prompt_tokens_estimate",
+    "Prompt tokens of each Groq request after budgeting (local count)", buckets=TOKEN_BUCKETS)
+PROMPT_BUDGET_TRIMS = Counter(
+    "shopai_prompt_budget_trims",
+    "Prompt parts cut to fit the token budget, by section (history | tool_result | context)",
+    ("section",))
+
+RATE_LIMIT_REJECTIONS = Counter(
+    "shopai_rate_limit_rejections",
+    "Requests rejected by a rate limiter (user = per-user turns, groq_rpm / groq_tpm = Groq calls)",
+    ("limit",))
+GROQ_QUEUE_SECONDS = Histogram(
+    "shopai_groq_queue_wait_seconds",
+    "Time a Groq call waited in the scheduler before dispatch, by priority (continue | new)",
+    ("priority",))
+GROQ_SCHEDULER_EVENTS = Counter(
+    "shopai_groq_scheduler_events",
+    "Groq scheduler events (retry | rate_limited | shed | timeout)", ("event",))
+LLM_PROVIDER_SECONDS = Histogram(
+    "shopai_llm_provider_request_duration_seconds",
+    "Latency of single chat-completion requests by provider and outcome (ok | error | rejected)",
+    ("provider", "outcome"))
+LLM_ROUTER_EVENTS = Counter(
+    "shopai_llm_router_events",
+    "LLM router events (hedge | hedge_won | failover) by the provider they went to", ("event", "provider"))
+
+MONGO_AGGREGATION_SECONDS = Histogram(
+    "shopai_mongo_aggregation_duration_seconds",
+    "MongoDB aggregation time by kind", ("kind",))
+EMBED_ENCODE_SECONDS = Histogram(
+    "shopai_embedding_encode_duration_seconds",
+    "Query embedding time for cache misses (single = one query, batch = /search/batch)", ("mode",))
+
+
+def cache_collector(name: str, help_text: str, stats_fn: Callable[[], dict]):
+    """
+    Collector exposing a cache's stats() dict (hits / misses / entries / ...)
+    as shopai_<name>_* series. stats_fn may return {"enabled": False}.
+    """
+    def collect():
+        stats = stats_fn() or {}
+        if not stats.get("enabled", True):
+            return []
+        families = []
+        for field in ("hits", "misses", "coalesced", "evictions", "expirations"):
+            if field in stats:
+                families.append((f"shopai_{name}_{field}_total", "counter", f"{help_text}: {field}",
+                                 [("", {}, float(stats[field]))]))
+        for field in ("entries", "hit_rate", "bytes"):
+            if field in stats:
+                families.append((f"shopai_{name}_{field}", "gauge", f"{help_text}: {field}",
+                                 [("", {}, float(stats[field]))]))
+        return families
+    return collect
@@ -4,7 +4,7 @@ Pydantic request/response models for the AI Shopping Agent.
 ChatRequest now carries jwt_token so the orchestrator can forward it to .NET.
 """
 
-from typing import List, Optional, Any
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, field_validator
 
 
@@ -17,6 +17,8 @@ class SearchRequest(BaseModel):
     top_k:     int             = 5
     min_price: Optional[float] = None  # only show products >= this price
     max_price: Optional[float] = None  # only show products <= this price
+    in_stock:  Optional[bool]  = None  # only show products with stockQuantity > 0
+    category:  Optional[str]   = None  # exact category name (case-insensitive)
 
 
 class ProductResult(BaseModel):
@@ -61,6 +63,15 @@ class SearchResponse(BaseModel):
     total:   int
 
 
+class BatchSearchRequest(BaseModel):
+    searches: List[SearchRequest]      # answered in the same order
+
+
+class BatchSearchResponse(BaseModel):
+    responses: List[SearchResponse]
+    total:     int                     # number of searches answered
+
+
 # ─────────────────────────────────────────────────────────────────
 # Chat Models
 # ─────────────────────────────────────────────────────────────────
@@ -80,10 +91,14 @@ class ChatRequest(BaseModel):
     # Authorization: Bearer <token> to all /api/ai/* .NET endpoints.
     jwt_token: Optional[str] = None
 
+    # Return a per-stage timing breakdown (tracing spans) in ChatResponse.timings
+    debug:     bool          = False
+
 
 class ChatResponse(BaseModel):
     response:   str
     action:     Optional[str]       = None
     data:       Optional[Any]       = None
     products:   Optional[List[Any]] = None
-    confidence: Optional[float]     = None
\ No newline at end of file
+    confidence: Optional[float]     = None
+    timings:    Optional[Dict[str, Any]] = None   # only when ChatRequest.debug
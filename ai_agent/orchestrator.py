@@ -3,23 +3,31 @@ orchestrator.py  (v4 -- Agentic Edition)
 =========================================
 Thin coordinator. All reasoning now lives in ShoppingAgent (llm_agent.py).
 This file only:
-  1. Builds an authenticated APIClient from the JWT
-  2. Calls ShoppingAgent.process()
-  3. Wraps the result in ChatResponse
+  1. Builds an authenticated APIClient view from the JWT (pooled transport)
+  2. Awaits ShoppingAgent.process()
+  3. Wraps the result in ChatResponse (+ tracing timings when request.debug)
+  4. For /chat/stream: runs the same turn with a progress callback and
+     yields its events, ending with the ChatResponse as a `done` event
 """
 
 import os
+import asyncio
 import logging
 import json
 import base64
 import hashlib
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
 from models import ChatRequest, ChatResponse
 from llm_agent import ShoppingAgent
 from api_client import APIClient
+from tracing import start_trace
 
 logger     = logging.getLogger(__name__)
 API_BASE   = os.getenv("API_BASE_URL", "http://localhost:5033/api")
 
+# Streamed turns outlive a disconnected client; keep them referenced until done
+_stream_tasks: set = set()
+
 
 def _decode_jwt_payload(token: str):
     if not token or token.count(".") < 2:
@@ -67,11 +75,13 @@ class ShoppingAgentOrchestrator:
         self.agent.set_search_service(svc)
         logger.info("SemanticSearchService wired")
 
-    async def process_message(self, request: ChatRequest) -> ChatResponse:
+    async def process_message(self, request: ChatRequest,
+                              on_event: Optional[Callable[[str, dict], None]] = None) -> ChatResponse:
         token = request.jwt_token or ""
         if not token:
             logger.warning("No JWT token -- all /api/ai/* calls will return 401")
 
+        # Thin per-user view -- connections come from the shared keep-alive pool
         api_client = APIClient(API_BASE, token)
         user_id    = _derive_user_id(request)
 
@@ -79,12 +89,14 @@ class ShoppingAgentOrchestrator:
         history = [{"role": m.role, "content": m.content} for m in request.history]
 
         # The agent decides everything -- which tools, what order, final reply
-        result = self.agent.process(
-            user_message = request.message,
-            history      = history,
-            api_client   = api_client,
-            user_id      = user_id,
-        )
+        with start_trace("chat", collect=request.debug) as trace:
+            result = await self.agent.process(
+                user_message = request.message,
+                history      = history,
+                api_client   = api_client,
+                user_id      = user_id,
+                on_event     = on_event,
+            )
 
         logger.info("Agent result: action=%s | response_len=%d",
                     result.get("action"), len(result.get("response", "")))
@@ -94,4 +106,42 @@ class ShoppingAgentOrchestrator:
             action   = result.get("action"),
             data     = None,
             products = result.get("products"),
-        )
\ No newline at end of file
+            timings  = trace.breakdown() if (trace and request.debug) else None,
+        )
+
+    async def stream_message(self, request: ChatRequest,
+                             heartbeat: float = 15.0) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield (event, data) while the turn runs; the last one is ("done",
+        ChatResponse) or ("error", {...}). ("ping", {}) is yielded when nothing
+        happened for `heartbeat` seconds (keeps proxies from closing the stream
+        during Render cold starts).
+
+        The turn runs as its own task and is NOT cancelled if the client goes
+        away — a half-finished place_order must still complete.
+        """
+        queue: "asyncio.Queue[Optional[Tuple[str, Dict[str, Any]]]]" = asyncio.Queue()
+
+        async def _run():
+            try:
+                resp = await self.process_message(request, on_event=lambda e, d: queue.put_nowait((e, d)))
+                queue.put_nowait(("done", resp.model_dump()))
+            except Exception as e:
+                logger.error("Streamed turn failed: %s", e, exc_info=True)
+                queue.put_nowait(("error", {"message": "Something went wrong. Please try again."}))
+            finally:
+                queue.put_nowait(None)
+
+        task = asyncio.create_task(_run())
+        _stream_tasks.add(task)
+        task.add_done_callback(_stream_tasks.discard)
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield "ping", {}
+                continue
+            if item is None:
+                break
+            yield item
+        await task
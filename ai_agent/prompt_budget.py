@@ -0,0 +1,302 @@
+"""
+prompt_budget.py
+Token-aware prompt builder for the Groq agent loop.
+
+Every completion used to resend the system prompt, every tool schema, up to
+MAX_HISTORY*2 history messages and all tool results of the turn, with each
+result cut at a fixed 4000 chars. On a long conversation one request could
+use most of the free-tier TPM. Now each completion is fitted to a token
+budget, section by section:
+
+  - system prompt, tool schemas and the user message are always sent whole
+  - session context gets PROMPT_BUDGET_CONTEXT tokens, or is left out (the
+    read tools still answer from the session cache)
+  - this turn's tool results share PROMPT_BUDGET_TOOL_RESULTS: the newest
+    round stays verbatim, older rounds are replaced by summaries that keep
+    the ids add_to_cart / cancel_order need
+  - history gets whatever PROMPT_BUDGET_TOKENS has left, capped at
+    PROMPT_BUDGET_HISTORY, newest messages first
+  - a single tool result is clipped at PROMPT_BUDGET_TOOL_RESULT tokens
+
+By default tokens are estimated as chars/3, which errs high for English
+and JSON, so budgets stay conservative and nothing is downloaded. Setting
+PROMPT_TOKENIZER (a path to a tokenizer.json — ship it in the image — or a
+Hugging Face repo, fetched on first use) counts with the model's tokenizer,
+loaded with `tokenizers` on a background thread; the estimate is used until
+it loads or if it can't.
+
+fit() returns a new list: the agent's own messages keep their tool results
+as _trim_result left them (never summarised), for product cards and the
+order-confirmation formatter.
+"""
+
+import os
+import json
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+from metrics import PROMPT_BUDGET_TRIMS, PROMPT_TOKENS_ESTIMATE
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+PROMPT_TOKENIZER           = os.getenv("PROMPT_TOKENIZER", "")
+PROMPT_BUDGET_TOKENS       = int(os.getenv("PROMPT_BUDGET_TOKENS", "4500"))
+PROMPT_BUDGET_HISTORY      = int(os.getenv("PROMPT_BUDGET_HISTORY", "1200"))
+PROMPT_BUDGET_TOOL_RESULTS = int(os.getenv("PROMPT_BUDGET_TOOL_RESULTS", "1500"))
+PROMPT_BUDGET_TOOL_RESULT  = int(os.getenv("PROMPT_BUDGET_TOOL_RESULT", "800"))
+PROMPT_BUDGET_CONTEXT      = int(os.getenv("PROMPT_BUDGET_CONTEXT", "400"))
+
+CHARS_PER_TOKEN  = 3        # fallback estimate
+MESSAGE_OVERHEAD = 4        # role header / separators per chat message
+
+# Fields an older tool result keeps once summarised
+_SUMMARY_FIELDS = {
+    "search_products":  ("id", "name", "price"),
+    "compare_products": ("id", "name", "price"),
+    "get_cart":         ("productId", "productName", "quantity"),
+    "get_orders":       ("orderId", "orderNumber", "status"),
+}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Token counting
+# ─────────────────────────────────────────────────────────────────────────────
+class TokenCounter:
+    """Counts and clips text in model tokens; chars/3 until the tokenizer is loaded."""
+
+    def __init__(self, name: str = PROMPT_TOKENIZER):
+        self.name       = name
+        self._tokenizer = None
+        self._count     = lru_cache(maxsize=4096)(self._count_uncached)
+
+    @property
+    def source(self) -> str:
+        return self.name if self._tokenizer is not None else f"chars/{CHARS_PER_TOKEN}"
+
+    def load(self) -> None:
+        """Blocking; call from a worker thread."""
+        if not self.name:
+            return
+        try:
+            from tokenizers import Tokenizer
+            if os.path.isfile(self.name):
+                tokenizer = Tokenizer.from_file(self.name)
+            else:
+                tokenizer = Tokenizer.from_pretrained(self.name)
+        except Exception as e:
+            logger.warning("Prompt tokenizer %s unavailable, estimating tokens from chars: %s",
+                           self.name, str(e)[:200])
+            return
+        self._tokenizer = tokenizer
+        self._count.cache_clear()
+        logger.info("✅ Prompt tokenizer loaded: %s", self.name)
+
+    def load_background(self) -> None:
+        if self.name:
+            threading.Thread(target=self.load, name="prompt-tokenizer", daemon=True).start()
+
+    def count(self, text: str) -> int:
+        return self._count(text) if text else 0
+
+    def _count_uncached(self, text: str) -> int:
+        tokenizer = self._tokenizer
+        if tokenizer is None:
+            return len(text) // CHARS_PER_TOKEN + 1
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def clip(self, text: str, max_tokens: int, marker: str = "...[truncated]") -> str:
+        if self.count(text) <= max_tokens:
+            return text
+        tokenizer = self._tokenizer
+        if tokenizer is None:
+            return text[:max_tokens * CHARS_PER_TOKEN] + marker
+        offsets = tokenizer.encode(text, add_special_tokens=False).offsets
+        return text[:offsets[max_tokens][0]] + marker
+
+    def message(self, msg: Dict[str, Any]) -> int:
+        tokens = MESSAGE_OVERHEAD + self.count(msg.get("content") or "")
+        for tc in msg.get("tool_calls") or []:
+            fn = tc.get("function") or {}
+            tokens += MESSAGE_OVERHEAD + self.count(fn.get("name") or "") + self.count(fn.get("arguments") or "")
+        return tokens
+
+
+_counter: Optional[TokenCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_counter() -> TokenCounter:
+    """Process-wide counter; the first call starts loading the tokenizer."""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            _counter = TokenCounter()
+            _counter.load_background()
+        return _counter
+
+
+def clip_tokens(text: str, max_tokens: int = PROMPT_BUDGET_TOOL_RESULT) -> str:
+    return get_counter().clip(text, max_tokens)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Tool result summaries
+# ─────────────────────────────────────────────────────────────────────────────
+def _project(data: Any, fields: Sequence[str]) -> Any:
+    if isinstance(data, list):
+        return [{k: d.get(k) for k in fields} for d in data if isinstance(d, dict)]
+    if isinstance(data, dict):
+        out = {k: v for k, v in data.items() if not isinstance(v, (list, dict))}
+        for key in ("items", "products"):
+            if isinstance(data.get(key), list):
+                out[key] = _project(data[key], fields)
+        return out
+    return data
+
+
+def summarise_tool_result(tool_name: str, content: str, max_tokens: int = 200) -> str:
+    """Compact form of an earlier tool message's content (JSON from _trim_result)."""
+    try:
+        result = json.loads(content)
+    except (TypeError, ValueError):
+        return clip_tokens(content or "", max_tokens)
+    if not isinstance(result, dict) or not result.get("success"):
+        return content
+    fields = _SUMMARY_FIELDS.get(tool_name)
+    data = _project(result.get("data"), fields) if fields else result.get("data")
+    summary = json.dumps({"success": True, "summary": "earlier result, abridged", "data": data},
+                         default=str, ensure_ascii=False)
+    return clip_tokens(summary, max_tokens)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Budgeted prompt
+# ─────────────────────────────────────────────────────────────────────────────
+class PromptBudget:
+    """
+    Fits the agent's messages to the token budgets. Message layout (as the
+    agent builds it):
+
+        [system, (session context system)?, *history, user, *turn]
+
+    where turn is this turn's rounds of assistant tool_calls + tool results
+    and `turn_start` is the index of its first message.
+    """
+
+    def __init__(self, counter: Optional[TokenCounter] = None,
+                 total: int = PROMPT_BUDGET_TOKENS, history: int = PROMPT_BUDGET_HISTORY,
+                 tool_results: int = PROMPT_BUDGET_TOOL_RESULTS, context: int = PROMPT_BUDGET_CONTEXT):
+        self.counter      = counter or get_counter()
+        self.total        = total
+        self.history      = history
+        self.tool_results = tool_results
+        self.context      = context
+        self._tools_tokens: Dict[tuple, int] = {}     # (tool names, counter source) -> tokens
+
+        self.builds             = 0
+        self.over_budget        = 0
+        self.prompt_tokens      = 0
+        self.history_dropped    = 0
+        self.results_summarised = 0
+        self.context_dropped    = 0
+
+    def tools_tokens(self, tools: Optional[list]) -> int:
+        if not tools:
+            return 0
+        # Schemas are static per name; recount for another subset, or once the tokenizer loads
+        key = (tuple(t.get("function", {}).get("name", "") for t in tools), self.counter.source)
+        cached = self._tools_tokens.get(key)
+        if cached is None:
+            if len(self._tools_tokens) >= 256:
+                self._tools_tokens.clear()
+            cached = self._tools_tokens[key] = self.counter.count(json.dumps(tools, separators=(",", ":")))
+        return cached
+
+    def estimate(self, messages: List[Dict[str, Any]], tools: Optional[list] = None) -> int:
+        """Prompt tokens of a request as sent (messages + tool schemas)."""
+        return sum(self.counter.message(m) for m in messages) + self.tools_tokens(tools)
+
+    def fit(self, messages: List[Dict[str, Any]], turn_start: int,
+            tools: Optional[list] = None) -> List[Dict[str, Any]]:
+        count = self.counter.message
+        system, user = messages[0], messages[turn_start - 1]
+        context = [m for m in messages[1:turn_start - 1] if m.get("role") == "system"]
+        history = [m for m in messages[1:turn_start - 1] if m.get("role") != "system"]
+        turn    = self._fit_turn(messages[turn_start:])
+
+        used = self.tools_tokens(tools) + count(system) + count(user) + sum(count(m) for m in turn)
+        context_tokens = sum(count(m) for m in context)
+        if context and (context_tokens > self.context or used + context_tokens > self.total):
+            context, context_tokens = [], 0
+            self.context_dropped += 1
+            PROMPT_BUDGET_TRIMS.inc(section="context")
+        used += context_tokens
+
+        kept = self._fit_history(history, min(self.history, self.total - used))
+        used += sum(count(m) for m in kept)
+
+        self.builds += 1
+        self.prompt_tokens += used
+        if used > self.total:
+            self.over_budget += 1
+        PROMPT_TOKENS_ESTIMATE.observe(used)
+        return [system, *context, *kept, user, *turn]
+
+    # ── Sections ─────────────────────────────────────────────────────────────
+
+    def _fit_turn(self, turn: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Summarise tool results from the oldest round on until the turn fits; the newest round stays."""
+        count = self.counter.message
+        total = sum(count(m) for m in turn)
+        if total <= self.tool_results:
+            return turn
+        last_round = max((i for i, m in enumerate(turn) if m.get("tool_calls")), default=len(turn))
+        names = {}
+        fitted = list(turn)
+        for i, msg in enumerate(turn[:last_round]):
+            for tc in msg.get("tool_calls") or []:
+                names[tc.get("id")] = (tc.get("function") or {}).get("name", "")
+            if msg.get("role") != "tool":
+                continue
+            summary = {**msg, "content": summarise_tool_result(names.get(msg.get("tool_call_id"), ""),
+                                                               msg.get("content") or "")}
+            total += count(summary) - count(msg)
+            fitted[i] = summary
+            self.results_summarised += 1
+            PROMPT_BUDGET_TRIMS.inc(section="tool_result")
+            if total <= self.tool_results:
+                break
+        return fitted
+
+    def _fit_history(self, history: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+        """Newest messages that fit in `budget` tokens, starting at a user message."""
+        count = self.counter.message
+        start = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            cost = count(history[i])
+            if cost > budget:
+                break
+            budget -= cost
+            start = i
+        while start < len(history) and history[start].get("role") != "user":
+            start += 1
+        if start:
+            self.history_dropped += start
+            PROMPT_BUDGET_TRIMS.inc(start, section="history")
+        return history[start:]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled":            True,
+            "tokenizer":          self.counter.source,
+            "budget_tokens":      self.total,
+            "builds":             self.builds,
+            "mean_prompt_tokens": round(self.prompt_tokens / self.builds, 1) if self.builds else 0.0,
+            "over_budget":        self.over_budget,
+            "history_dropped":    self.history_dropped,
+            "results_summarised": self.results_summarised,
+            "context_dropped":    self.context_dropped,
+        }
@@ -0,0 +1,451 @@
+"""
+rate_limit.py
+Pluggable rate limiting for the agent: the per-user request quota and the
+global Groq quotas (requests and tokens per minute), shared across however
+many workers and replicas serve /chat.
+
+RATE_LIMIT_BACKEND picks where the counters live:
+
+  - memory   this process only (default). Keys hash onto RATE_LIMIT_SHARDS
+             shards with a lock each, so turns of different users rarely
+             contend; idle keys are evicted as shards are swept
+  - shm      one shared-memory table for every worker on the host (uvicorn
+             --workers N), locked per shard with fcntl byte-range locks
+  - redis    any Redis-protocol server (Redis, Valkey, KeyDB, Dragonfly)
+             for several replicas, spoken directly over RESP — no client
+             library. benchmarks/fakes.py has a local stand-in (FakeRedis)
+
+Every backend runs the same sliding-window counter: a key's usage is this
+window's count plus the previous window's, weighted by how much of it still
+overlaps the last `window` seconds. Redis adds the cost first and takes it
+back if that crossed the limit, so concurrent replicas never over-admit even
+without server-side scripting. adjust() settles a cost afterwards — the
+Groq TPM limiter reserves prompt + max_tokens, then corrects to the usage
+Groq reports.
+
+A shared backend that can't be reached fails open (logged, counted in
+stats): availability over strictness — Groq's own 429s still apply.
+"""
+
+import os
+import ssl
+import sys
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RATE_LIMIT_BACKEND       = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_SHARDS        = int(os.getenv("RATE_LIMIT_SHARDS", "16"))
+RATE_LIMIT_SHM_NAME      = os.getenv("RATE_LIMIT_SHM_NAME", "shopai_ratelimit")
+RATE_LIMIT_SHM_SLOTS     = int(os.getenv("RATE_LIMIT_SHM_SLOTS", "65536"))
+RATE_LIMIT_REDIS_URL     = os.getenv("RATE_LIMIT_REDIS_URL", "redis://127.0.0.1:6379/0")
+RATE_LIMIT_REDIS_PREFIX  = os.getenv("RATE_LIMIT_REDIS_PREFIX", "shopai:rl:")
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.25"))
+
+SWEEP_INTERVAL = 30.0       # seconds between evictions of idle keys, per shard
+
+
+class RateLimitExceeded(Exception):
+    """Raised for a global quota; the message contains "rate_limit" like Groq's own errors."""
+
+    def __init__(self, limiter: str):
+        super().__init__(f"rate_limit: local {limiter} quota exhausted")
+        self.limiter = limiter
+
+
+def _window(now: float, window: float) -> Tuple[int, float]:
+    """(current window index, weight of the previous window's count)."""
+    bucket = int(now // window)
+    return bucket, 1.0 - (now - bucket * window) / window
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# memory — sharded, lock-striped, per process
+# ─────────────────────────────────────────────────────────────────────────────
+class _Shard:
+    __slots__ = ("lock", "entries", "next_sweep")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[str, list] = {}      # key -> [bucket, current, previous, window]
+        self.next_sweep = time.time() + SWEEP_INTERVAL
+
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS):
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self.evictions = 0
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _entry(self, shard: _Shard, key: str, now: float, window: float) -> list:
+        if now >= shard.next_sweep:
+            stale = [k for k, e in shard.entries.items() if int(now // e[3]) - e[0] > 1]
+            for k in stale:
+                del shard.entries[k]
+            self.evictions += len(stale)
+            shard.next_sweep = now + SWEEP_INTERVAL
+        bucket, _ = _window(now, window)
+        entry = shard.entries.get(key)
+        if entry is None:
+            entry = shard.entries[key] = [bucket, 0, 0, window]
+        elif entry[0] != bucket:
+            entry[2] = entry[1] if entry[0] == bucket - 1 else 0
+            entry[0], entry[1] = bucket, 0
+        return entry
+
+    async def hit(self, key: str, cost: int, limit: int, window: float) -> Tuple[bool, float]:
+        now = time.time()
+        _, weight = _window(now, window)
+        shard = self._shard(key)
+        with shard.lock:
+            entry = self._entry(shard, key, now, window)
+            usage = entry[1] + entry[2] * weight
+            if usage + cost > limit:
+                return False, usage
+            entry[1] += cost
+            return True, usage + cost
+
+    async def adjust(self, key: str, delta: int, window: float) -> None:
+        shard = self._shard(key)
+        with shard.lock:
+            self._entry(shard, key, time.time(), window)[1] += delta
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "shards": len(self._shards),
+                "keys": sum(len(s.entries) for s in self._shards), "evictions": self.evictions}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# shm — one table for all workers on the host
+# ─────────────────────────────────────────────────────────────────────────────
+def _key_hash(key: str) -> int:
+    h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return h or 1       # 0 marks an empty slot
+
+
+def _open_shm(name: str, size: int):
+    """Create or attach; never let one worker's exit unlink the table under the others."""
+    from multiprocessing import shared_memory
+    kwargs = {"track": False} if sys.version_info >= (3, 13) else {}
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size, **kwargs)
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(name=name, **kwargs)
+    if not kwargs:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    if shm.size < size:
+        shm.close()
+        raise ValueError(f"shared memory {name} is {shm.size} bytes, need {size} "
+                         f"(RATE_LIMIT_SHM_SLOTS changed? remove /dev/shm/{name})")
+    return shm
+
+
+class SharedMemoryBackend:
+    """
+    Fixed table of RATE_LIMIT_SHM_SLOTS slots split into shards. A key lives
+    in its shard's region; a slot is reused once its window has gone idle,
+    and the oldest slot is evicted if the shard is full. Each shard is
+    guarded by a thread lock plus an fcntl lock on one byte of a lock file,
+    since fcntl locks don't exclude threads of the same process.
+    """
+    name = "shm"
+
+    _DTYPE = [("key", "<u8"), ("bucket", "<i8"), ("current", "<i8"), ("previous", "<i8"), ("window", "<f8")]
+
+    def __init__(self, name: str = RATE_LIMIT_SHM_NAME, slots: int = RATE_LIMIT_SHM_SLOTS,
+                 shards: int = RATE_LIMIT_SHARDS):
+        import fcntl
+        import numpy as np
+        self._fcntl = fcntl
+        self._np    = np
+        self.shards    = max(1, shards)
+        self.per_shard = max(1, slots // self.shards)
+        dtype = np.dtype(self._DTYPE)
+        self._shm   = _open_shm(name, dtype.itemsize * self.per_shard * self.shards)
+        self._table = np.ndarray((self.per_shard * self.shards,), dtype=dtype, buffer=self._shm.buf)
+        self._lock_fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        self._locks   = [threading.Lock() for _ in range(self.shards)]
+        self.evictions = 0
+
+    @contextmanager
+    def _locked(self, shard: int) -> Iterator[None]:
+        with self._locks[shard]:
+            self._fcntl.lockf(self._lock_fd, self._fcntl.LOCK_EX, 1, shard)
+            try:
+                yield
+            finally:
+                self._fcntl.lockf(self._lock_fd, self._fcntl.LOCK_UN, 1, shard)
+
+    def _slot(self, h: int, now: float, window: float) -> Tuple[int, int]:
+        """(shard, absolute slot index) for key hash h, rolled to the current window."""
+        np = self._np
+        shard = h % self.shards
+        lo = shard * self.per_shard
+        region = self._table[lo:lo + self.per_shard]
+        bucket, _ = _window(now, window)
+        found = np.flatnonzero(region["key"] == h)
+        if found.size:
+            i = int(found[0])
+        else:
+            idle = (region["key"] == 0) | (region["bucket"] < (now // np.maximum(region["window"], 1e-9)) - 1)
+            free = np.flatnonzero(idle)
+            if free.size:
+                i = int(free[0])
+            else:
+                i = int(np.argmin(region["bucket"]))
+                self.evictions += 1
+            region[i] = (h, bucket, 0, 0, window)
+        slot = region[i:i + 1]
+        if int(slot["bucket"][0]) != bucket:
+            slot["previous"] = slot["current"] if int(slot["bucket"][0]) == bucket - 1 else 0
+            slot["current"], slot["bucket"] = 0, bucket
+        return shard, lo + i
+
+    async def hit(self, key: str, cost: int, limit: int, window: float) -> Tuple[bool, float]:
+        now = time.time()
+        _, weight = _window(now, window)
+        h = _key_hash(key)
+        with self._locked(h % self.shards):
+            _, i = self._slot(h, now, window)
+            row = self._table[i]
+            usage = int(row["current"]) + int(row["previous"]) * weight
+            if usage + cost > limit:
+                return False, usage
+            self._table["current"][i] += cost
+            return True, usage + cost
+
+    async def adjust(self, key: str, delta: int, window: float) -> None:
+        h = _key_hash(key)
+        with self._locked(h % self.shards):
+            _, i = self._slot(h, time.time(), window)
+            self._table["current"][i] += delta
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "shards": self.shards, "slots": len(self._table),
+                "keys": int((self._table["key"] != 0).sum()), "evictions": self.evictions}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# redis — RESP over asyncio streams, for several nodes
+# ─────────────────────────────────────────────────────────────────────────────
+class RespError(Exception):
+    pass
+
+
+def _encode(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        n = int(body)
+        if n < 0:
+            return None
+        data = await reader.readexactly(n + 2)
+        return data[:-2]
+    if kind == b"*":
+        n = int(body)
+        return None if n < 0 else [await _read_reply(reader) for _ in range(n)]
+    raise RespError(f"unexpected reply {line[:20]!r}")
+
+
+class RedisBackend:
+    """
+    One pipelined connection per event loop, (re)opened lazily. Keys are
+    `<prefix><key>:<window>:<window index>` and expire after two windows.
+    """
+    name = "redis"
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = RATE_LIMIT_REDIS_PREFIX,
+                 timeout: float = RATE_LIMIT_REDIS_TIMEOUT):
+        parts = urlsplit(url)
+        self._host     = parts.hostname or "127.0.0.1"
+        self._port     = parts.port or 6379
+        self._password = parts.password
+        self._db       = int((parts.path or "/0").lstrip("/") or 0)
+        self._tls      = parts.scheme == "rediss"
+        self._prefix   = prefix
+        self._timeout  = timeout
+        self._conn: Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = None
+        self._conn_loop = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+        self.errors     = 0
+        self._last_warn = 0.0
+
+    async def _connection(self):
+        loop = asyncio.get_running_loop()
+        if self._conn is not None and self._conn_loop is loop:
+            return self._conn
+        reader, writer = await asyncio.open_connection(
+            self._host, self._port, ssl=ssl.create_default_context() if self._tls else None)
+        setup = ([("AUTH", self._password)] if self._password else []) + ([("SELECT", self._db)] if self._db else [])
+        for cmd in setup:
+            writer.write(_encode(*cmd))
+        await writer.drain()
+        for _ in setup:
+            reply = await _read_reply(reader)
+            if isinstance(reply, RespError):
+                writer.close()
+                raise reply
+        self._conn, self._conn_loop = (reader, writer), loop
+        return self._conn
+
+    async def execute(self, *commands: Tuple) -> List[Any]:
+        """Send commands as one pipeline; replies in order (RespError instances for -ERR)."""
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._pipeline(commands), self._timeout)
+            except BaseException:
+                self._close()
+                raise
+
+    async def _pipeline(self, commands) -> List[Any]:
+        reader, writer = await self._connection()
+        writer.write(b"".join(_encode(*cmd) for cmd in commands))
+        await writer.drain()
+        return [await _read_reply(reader) for _ in commands]
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn[1].close()
+        self._conn = None
+
+    def _failed(self, e: Exception) -> None:
+        self.errors += 1
+        now = time.monotonic()
+        if now - self._last_warn > 30:
+            self._last_warn = now
+            logger.warning("Rate limit backend %s:%d unreachable, allowing requests: %s",
+                           self._host, self._port, str(e) or type(e).__name__)
+
+    def _key(self, key: str, window: float, bucket: int) -> str:
+        return f"{self._prefix}{key}:{window:g}:{bucket}"
+
+    async def hit(self, key: str, cost: int, limit: int, window: float) -> Tuple[bool, float]:
+        bucket, weight = _window(time.time(), window)
+        current = self._key(key, window, bucket)
+        try:
+            count, _, previous = await self.execute(
+                ("INCRBY", current, cost), ("PEXPIRE", current, int(window * 2000)),
+                ("GET", self._key(key, window, bucket - 1)))
+            if isinstance(count, RespError):
+                raise count
+            usage = count + int(previous or 0) * weight
+            if usage > limit:
+                await self.execute(("INCRBY", current, -cost))
+                return False, usage - cost
+            return True, usage
+        except (OSError, asyncio.TimeoutError, RespError, ValueError) as e:
+            self._failed(e)
+            return True, 0.0
+
+    async def adjust(self, key: str, delta: int, window: float) -> None:
+        bucket, _ = _window(time.time(), window)
+        current = self._key(key, window, bucket)
+        try:
+            await self.execute(("INCRBY", current, delta), ("PEXPIRE", current, int(window * 2000)))
+        except (OSError, asyncio.TimeoutError, RespError, ValueError) as e:
+            self._failed(e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "server": f"{self._host}:{self._port}/{self._db}",
+                "connected": self._conn is not None, "errors": self.errors}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Limiters
+# ─────────────────────────────────────────────────────────────────────────────
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The process-wide backend from RATE_LIMIT_BACKEND (memory if it can't be set up)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            try:
+                if RATE_LIMIT_BACKEND == "shm":
+                    _backend = SharedMemoryBackend()
+                elif RATE_LIMIT_BACKEND == "redis":
+                    _backend = RedisBackend()
+                elif RATE_LIMIT_BACKEND != "memory":
+                    logger.warning("Unknown RATE_LIMIT_BACKEND=%s, using memory", RATE_LIMIT_BACKEND)
+            except Exception as e:
+                logger.error("Rate limit backend %s failed (%s), using memory", RATE_LIMIT_BACKEND, e)
+            if _backend is None:
+                _backend = MemoryBackend()
+            logger.info("Rate limit backend: %s", _backend.name)
+        return _backend
+
+
+class RateLimiter:
+    """A named quota: at most `limit` units per `window` seconds per key (limit <= 0 = off)."""
+
+    def __init__(self, name: str, limit: int, window: float = 60.0, backend=None):
+        self.name     = name
+        self.limit    = limit
+        self.window   = window
+        self._backend = backend
+        self.allowed  = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    async def allow(self, key: str = "*", cost: int = 1) -> bool:
+        if not self.enabled:
+            return True
+        ok, _ = await self.backend.hit(f"{self.name}:{key}", int(cost), self.limit, self.window)
+        if ok:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return ok
+
+    async def adjust(self, key: str = "*", delta: int = 0) -> None:
+        if self.enabled and delta:
+            await self.backend.adjust(f"{self.name}:{key}", int(delta), self.window)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "window_s": self.window,
+                "allowed": self.allowed, "rejected": self.rejected}
@@ -0,0 +1,78 @@
+"""
+readiness.py
+Tracks the staged startup of the agent's heavy components for GET /ready.
+
+The app starts accepting traffic immediately; the embedding model, the Mongo
+connection and the Groq client are loaded concurrently in the background,
+each as a named stage:
+
+    pending → loading → ready | degraded | failed
+
+Routes check the stage they depend on (search needs "search", chat needs
+"llm"), so e.g. /speech/transcribe is served while the model is still
+loading. A degraded stage loaded but can't do its whole job (e.g. "llm"
+with no provider configured): its routes keep serving what they can, but
+/ready is 200 only once every required stage is ready.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Status board for named startup stages."""
+
+    def __init__(self, components: Sequence[str], required: Sequence[str]):
+        self.required = tuple(required)
+        self._started = time.time()
+        self._status: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name in components}
+
+    async def run(self, name: str, fn: Callable, *args) -> Optional[Any]:
+        """
+        Run a blocking loader in a worker thread as stage `name`.
+        Returns its result, or None if it raised (the error is recorded).
+        """
+        entry = self._status.setdefault(name, {})
+        entry.update(status="loading", error=None)
+        t0 = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            entry.update(status="failed", error=str(e), took_ms=round((time.perf_counter() - t0) * 1000, 1))
+            logger.error("❌ Startup stage '%s' failed: %s", name, e)
+            return None
+        entry.update(status="ready", took_ms=round((time.perf_counter() - t0) * 1000, 1))
+        logger.info("✅ Startup stage '%s' ready (%.0f ms)", name, entry["took_ms"])
+        return result
+
+    def fail(self, name: str, reason: str) -> None:
+        """Mark a stage failed without running it (a dependency failed)."""
+        self._status.setdefault(name, {}).update(status="failed", error=reason)
+        logger.error("❌ Startup stage '%s' skipped: %s", name, reason)
+
+    def degrade(self, name: str, reason: str) -> None:
+        """Mark a loaded stage as only partly usable; it no longer counts as ready."""
+        self._status.setdefault(name, {}).update(status="degraded", error=reason)
+        logger.error("⚠️ Startup stage '%s' degraded: %s", name, reason)
+
+    def is_ready(self, name: str) -> bool:
+        return self._status.get(name, {}).get("status") == "ready"
+
+    def status(self, name: str) -> str:
+        return self._status.get(name, {}).get("status", "unknown")
+
+    @property
+    def ready(self) -> bool:
+        return all(self.is_ready(name) for name in self.required)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready":      self.ready,
+            "uptime_s":   round(time.time() - self._started, 3),
+            "components": {name: {k: v for k, v in entry.items() if v is not None}
+                           for name, entry in self._status.items()},
+        }
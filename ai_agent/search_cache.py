@@ -0,0 +1,182 @@
+"""
+search_cache.py
+Search result cache with catalog-version invalidation.
+
+Identical SearchRequests used to re-run the whole $vectorSearch aggregation and
+rebuild every ProductResult. Results are now cached under
+
+    (normalised query, top_k, min_price, max_price, catalog version)
+
+The catalog version is a counter in `catalog_meta` that the backend's
+product repository bumps on every add / update / delete, and the embedding
+pipeline and change-stream watcher bump after re-embedding, so a catalog
+edit makes every old key unreachable at once — no scan-and-delete. Writes
+that bypass all three (direct Mongo edits, bulk imports) are only picked up
+when SEARCH_CACHE_TTL expires.
+
+  - LRU + TTL, bounded entry count
+  - Single-flight: a cold popular key runs ONE aggregation; concurrent
+    callers wait for that result instead of stampeding Mongo
+  - The version is polled at most every SEARCH_CACHE_VERSION_POLL_S seconds
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RESULT_CACHE_ENABLED     = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+VERSION_POLL_SECONDS     = float(os.getenv("SEARCH_CACHE_VERSION_POLL_S", "2"))
+
+CATALOG_META_COLLECTION = "catalog_meta"
+CATALOG_META_ID         = "products"
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Catalog version token
+# ─────────────────────────────────────────────────────────────────────────────
+
+def bump_catalog_version(db) -> int:
+    """Increment the catalog version. Call after any product / embedding write."""
+    from pymongo import ReturnDocument
+
+    doc = db[CATALOG_META_COLLECTION].find_one_and_update(
+        {"_id": CATALOG_META_ID},
+        {"$inc": {"version": 1}, "$currentDate": {"updatedAt": True}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    version = int(doc.get("version", 0))
+    logger.info("Catalog version bumped → %d", version)
+    return version
+
+
+class CatalogVersion:
+    """
+    Cached reader for the catalog version. Reads Mongo at most once per
+    poll interval; if Mongo is unreachable the last known value is kept.
+    """
+
+    def __init__(self, db, poll_seconds: float = VERSION_POLL_SECONDS):
+        self._db        = db
+        self._poll      = poll_seconds
+        self._version   = 0
+        self._next_read = 0.0
+        self._lock      = threading.Lock()
+
+    def current(self) -> int:
+        now = time.monotonic()
+        if now < self._next_read:
+            return self._version
+        with self._lock:
+            if now < self._next_read:
+                return self._version
+            self._next_read = now + self._poll
+            try:
+                doc = self._db[CATALOG_META_COLLECTION].find_one({"_id": CATALOG_META_ID}, {"version": 1})
+                self._version = int((doc or {}).get("version", 0))
+            except Exception as e:
+                logger.warning("Catalog version read failed (keeping %d): %s", self._version, e)
+            return self._version
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Result cache
+# ─────────────────────────────────────────────────────────────────────────────
+
+def result_key(query: str, top_k: int, min_price: Optional[float],
+               max_price: Optional[float], version: int, *extra: Hashable) -> Tuple:
+    return (normalize_query(query), int(top_k),
+            None if min_price is None else float(min_price),
+            None if max_price is None else float(max_price),
+            version, *extra)
+
+
+class SearchResultCache:
+    """LRU + TTL cache with single-flight computation per key."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+
+        self.hits      = 0
+        self.misses    = 0
+        self.coalesced = 0   # callers that waited on another caller's computation
+        self.evictions = 0
+
+    def get_or_compute(self, key: Tuple, compute: Callable[[], Any],
+                       cacheable: Callable[[Any], bool] = lambda _: True) -> Any:
+        """
+        Return the cached value for key, or run compute() exactly once across
+        all concurrent callers. Exceptions reach every waiter and are not cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            waiting = self._inflight.get(key)
+            if waiting is None:
+                owner = Future()
+                self._inflight[key] = owner
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if waiting is not None:
+            return waiting.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            owner.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            if cacheable(value):
+                self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        owner.set_result(value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries":   len(self._entries),
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate":  round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
@@ -1,21 +1,51 @@
 """
-semantic_search.py (v2 - Optimized)
-Semantic vector search powered by MongoDB Atlas $vectorSearch.
+semantic_search.py (v3 - Optimized)
+Semantic vector search powered by MongoDB Atlas $vectorSearch,
+with an optional in-memory local index (SEARCH_BACKEND=local | auto).
 
 Key optimizations:
   - Embedding model loaded once at init (singleton pattern)
   - $toDouble in $project converts Decimal128 to float inside MongoDB
-  - Price filters applied at DB level for faster results
+  - Price / stock / category filters pushed into $vectorSearch.filter (index
+    filter fields, see atlas_vector_index.json), so a narrow budget still
+    returns a full page; candidate count grows with filter selectivity
   - Minimal logging to reduce latency
   - Connection pooling via MongoClient
+  - Encoder backend selectable with EMBED_BACKEND (torch | onnx | onnx-int8)
+  - Query embeddings cached (LRU + TTL) so repeated queries skip the model
+  - Cache misses from concurrent requests are micro-batched into one encode()
+  - SEARCH_BACKEND=local answers from a memory-mapped snapshot (no round trip);
+    SEARCH_BACKEND=auto keeps Atlas but falls back to the snapshot on errors.
+    The snapshot is reloaded when replaced on disk and, in local mode,
+    rebuilt in the background when the catalog version moves
+  - Tracing spans around encode / retrieval steps (tracing.py)
+  - Whole responses cached per catalog version, with single-flight misses
+  - search_many() answers a batch with ONE encode() call for all uncached
+    queries and runs the aggregations concurrently (POST /search/batch)
+  - SEARCH_MODE=hybrid fuses vector hits with an in-process BM25 index (RRF),
+    so exact SKU / brand / model-number queries rank where they should
 """
 
 import os
+import re
+import time
 import logging
-from typing import List
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 from pymongo import MongoClient
-from sentence_transformers import SentenceTransformer
+from pymongo.errors import OperationFailure
+from encoders import EMBED_BACKEND, MODEL_NAME, encoder_id, get_encoder
 from models import ProductResult, SearchRequest, SearchResponse
+from embedding_cache import EmbeddingCache, CACHE_ENABLED
+from embedding_batcher import EmbeddingBatcher, BATCHING_ENABLED
+from local_index import LocalVectorIndex, LOCAL_INDEX_PATH, LOCAL_INDEX_REBUILD_S
+from search_cache import CatalogVersion, SearchResultCache, RESULT_CACHE_ENABLED, result_key
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from embedding_pipeline import category_key
+from tracing import span
+from metrics import EMBED_ENCODE_SECONDS, MONGO_AGGREGATION_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +53,26 @@ logger = logging.getLogger(__name__)
 MONGO_URI                 = os.getenv("MONGO_URI")
 DB_NAME                   = os.getenv("DB_NAME", "ECommerceDB")
 COLLECTION_NAME           = "products"
-MODEL_NAME                = "all-MiniLM-L6-v2"
+ENCODER_ID                = encoder_id()   # embedding cache namespace (model + backend)
 VECTOR_INDEX_NAME         = "vector_index"
 NUM_CANDIDATES_MULTIPLIER = 10
+FILTERED_CANDIDATES_MULTIPLIER = int(os.getenv("SEARCH_FILTERED_CANDIDATES_MULTIPLIER", "20"))
+MAX_NUM_CANDIDATES        = 10000   # Atlas $vectorSearch hard limit
+CANDIDATE_RETRY_GROWTH    = 8       # numCandidates multiplier for the one short-page retry
+SEARCH_BATCH_MAX_QUERIES  = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "20"))
+SEARCH_BATCH_CONCURRENCY  = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "8"))
+SEARCH_PREFILTER          = os.getenv("SEARCH_PREFILTER", "true").lower() in ("1", "true", "yes")
+SEARCH_BACKEND            = os.getenv("SEARCH_BACKEND", "atlas").lower()   # atlas | local | auto
+SEARCH_MODE               = os.getenv("SEARCH_MODE", "vector").lower()     # vector | hybrid
+HYBRID_CANDIDATE_FACTOR   = int(os.getenv("HYBRID_CANDIDATE_FACTOR", "4"))  # per-ranker depth = top_k * this
+
+
+def connect_mongo() -> MongoClient:
+    """Open the pooled MongoClient and ping it. Raises if Mongo is unreachable."""
+    logger.info(f"Connecting to MongoDB: {(MONGO_URI or '')[:30]}...")
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    client.admin.command('ping')
+    return client
 
 
 class SemanticSearchService:
@@ -37,54 +84,247 @@ class SemanticSearchService:
     _model_cache = None
     _model_lock = __import__('threading').Lock()
 
-    def __init__(self):
-        logger.info(f"SemanticSearchService init: Loading embedding model '{MODEL_NAME}'")
+    def __init__(self, model=None, client=None):
+        """
+        model / client may be passed in when they were loaded concurrently at
+        startup (main.py); otherwise they are loaded / connected here.
+        """
+        logger.info(f"SemanticSearchService init: Loading embedding model '{MODEL_NAME}' ({EMBED_BACKEND})")
         
         # Load model once, cache it (thread-safe)
         with SemanticSearchService._model_lock:
             if SemanticSearchService._model_cache is None:
-                SemanticSearchService._model_cache = SentenceTransformer(MODEL_NAME)
+                SemanticSearchService._model_cache = model if model is not None else get_encoder()
                 logger.info(f"✓ Embedding model loaded and cached")
             self.model = SemanticSearchService._model_cache
 
-        logger.info(f"Connecting to MongoDB: {MONGO_URI[:30]}...")
-        self.client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+        self.embedding_cache = EmbeddingCache() if CACHE_ENABLED else None
+        self.batcher         = EmbeddingBatcher(self.model) if BATCHING_ENABLED else None
+
+        if client is not None:
+            self.client = client
+        else:
+            logger.info(f"Connecting to MongoDB: {MONGO_URI[:30]}...")
+            self.client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
         self.db = self.client[DB_NAME]
         self.collection = self.db[COLLECTION_NAME]
         
         # Test connection
         try:
-            self.client.admin.command('ping')
+            if client is None:
+                self.client.admin.command('ping')
             logger.info(f"✓ Connected to {DB_NAME}.{COLLECTION_NAME}")
         except Exception as e:
             logger.error(f"MongoDB connection failed: {e}")
-            raise
+            # The local backend can serve from an existing snapshot without Mongo
+            if SEARCH_BACKEND == "atlas" or not LocalVectorIndex.exists(LOCAL_INDEX_PATH):
+                raise
+
+        self.local_index = self._load_local_index() if SEARCH_BACKEND in ("local", "auto") else None
+
+        # Flipped off if vector_index has no filter fields yet (legacy post-$match path)
+        self._prefilter = SEARCH_PREFILTER
 
-    def search(self, request: SearchRequest) -> SearchResponse:
+        self.catalog_version = CatalogVersion(self.db)
+        self._local_lock       = threading.Lock()
+        self._local_rebuilt_at = 0.0
+        if self.local_index is not None:
+            self.local_index.version = self.catalog_version.current()
+        self.result_cache    = SearchResultCache() if RESULT_CACHE_ENABLED else None
+
+        self._batch_pool = ThreadPoolExecutor(max_workers=max(1, SEARCH_BATCH_CONCURRENCY),
+                                              thread_name_prefix="search-batch")
+
+        self.search_mode    = SEARCH_MODE
+        self.lexical_index  = None
+        self._lexical_lock  = threading.Lock()
+        if self.search_mode == "hybrid":
+            self._build_lexical(self.catalog_version.current())
+
+    def search(self, request: SearchRequest, query_vector: Optional[List[float]] = None) -> SearchResponse:
         """
         Perform semantic vector search with optional price filtering.
-        Returns top_k results from MongoDB vector index.
+        Returns top_k results from the configured backend (Atlas or local index).
+        Served from the result cache when the catalog hasn't changed.
         """
+        with span("search", mode=self.search_mode, top_k=request.top_k) as s:
+            if self.result_cache is None:
+                resp = self._search_uncached(request, query_vector)
+            else:
+                key = result_key(request.query, request.top_k or 5, request.min_price,
+                                 request.max_price, self.catalog_version.current(), self.search_mode,
+                                 bool(request.in_stock), category_key(request.category))
+                # Empty responses are cheap to recompute and may be an Atlas hiccup — don't pin them
+                resp = self.result_cache.get_or_compute(
+                    key, lambda: self._search_uncached(request, query_vector),
+                    cacheable=lambda resp: resp.total > 0,
+                )
+            s.set(results=resp.total)
+            return resp
+
+    def search_many(self, requests: List[SearchRequest]) -> List[SearchResponse]:
+        """
+        Answer several searches at once, in order: all queries are encoded in
+        a single model call, then the retrievals run concurrently.
+        """
+        if not requests:
+            return []
+        vectors = self._encode_queries([r.query.strip() for r in requests])
+        if len(requests) == 1:
+            return [self.search(requests[0], vectors[0])]
+        # copy_context() per task keeps each retrieval inside the caller's trace
+        futures = [self._batch_pool.submit(contextvars.copy_context().run, self.search, r, v)
+                   for r, v in zip(requests, vectors)]
+        return [f.result() for f in futures]
+
+    def _search_uncached(self, request: SearchRequest,
+                         query_vector: Optional[List[float]] = None) -> SearchResponse:
         query = request.query.strip()
         top_k = int(request.top_k or 5)
-        min_price = request.min_price
-        max_price = request.max_price
+        filters = {"min_price": request.min_price, "max_price": request.max_price,
+                   "in_stock": request.in_stock, "category": request.category}
+
+        # Encode query to vector (cached)
+        if query_vector is None:
+            query_vector = self._encode_query(query)
+
+        if self.search_mode == "hybrid" and self.lexical_index is not None:
+            raw_docs = self._hybrid_retrieve(query, query_vector, top_k, **filters)
+        else:
+            raw_docs = self._retrieve(query_vector, top_k, **filters)
+
+        # Map to ProductResult objects
+        results = []
+        for doc in raw_docs:
+            try:
+                results.append(ProductResult(
+                    id=str(doc.get("_id", "")),
+                    name=doc.get("name", ""),
+                    description=doc.get("description", ""),
+                    category=self._extract_category(doc.get("category")),
+                    price=float(doc.get("price", 0.0) or 0.0),
+                    brand=doc.get("brand", ""),
+                    rating=float(doc.get("rating", 0.0) or 0.0),
+                    reviewCount=int(doc.get("reviewCount", 0) or 0),
+                    imageUrl=doc.get("imageUrl", ""),
+                    stockQuantity=int(doc.get("stockQuantity", 0) or 0),
+                    score=round(float(doc.get("score", 0.0) or 0.0), 4)
+                ))
+            except Exception as e:
+                logger.warning(f"Failed to map product doc: {e}")
+                continue
 
-        # Encode query to vector
-        query_vector = self.model.encode(query).tolist()
+        logger.info(f"Search '{query}' → {len(results)} results")
+        return SearchResponse(results=results, query=query, total=len(results))
+
+    def _retrieve(self, query_vector: List[float], top_k: int, **filters) -> List[dict]:
+        """Route to the local index or Atlas; fall back to local if Atlas fails."""
+        self._maybe_refresh_local()
+        if SEARCH_BACKEND == "local" and self.local_index is not None:
+            return self._local_search(query_vector, top_k, **filters)
+        try:
+            return self._atlas_search(query_vector, top_k, **filters)
+        except Exception as e:
+            logger.error(f"MongoDB aggregation error: {e}")
+            if self.local_index is not None:
+                logger.warning("Atlas unavailable — serving from local index")
+                return self._local_search(query_vector, top_k, **filters)
+            return []
+
+    def _local_search(self, query_vector: List[float], top_k: int, **filters) -> List[dict]:
+        with span("search.local_index", top_k=top_k) as s:
+            docs = self.local_index.search(query_vector, top_k, **filters)
+            s.set(results=len(docs))
+            return docs
+
+    def _atlas_search(self, query_vector: List[float], top_k: int,
+                      min_price=None, max_price=None,
+                      in_stock: Optional[bool] = None,
+                      category: Optional[str] = None) -> List[dict]:
+        """
+        Run $vectorSearch on Atlas. Raises on aggregation errors.
+
+        Filters go into $vectorSearch.filter so the index only ranks matching
+        products. A filtered search starts with a wider candidate pool and, if
+        the page still comes back short, retries once with a much larger one.
+        """
+        vector_filter = self._vector_filter(min_price, max_price, in_stock, category)
+        if vector_filter and self._prefilter:
+            try:
+                num_candidates = top_k * FILTERED_CANDIDATES_MULTIPLIER
+                docs = self._run_vector_search(query_vector, top_k, num_candidates, vector_filter)
+                if len(docs) < top_k and num_candidates < MAX_NUM_CANDIDATES:
+                    docs = self._run_vector_search(query_vector, top_k,
+                                                   num_candidates * CANDIDATE_RETRY_GROWTH, vector_filter)
+                return docs
+            except OperationFailure as e:
+                # "Path 'price_double' needs to be indexed as filter" — old index definition
+                if "filter" not in str(e).lower():
+                    raise
+                logger.warning("vector_index has no filter fields — using post-filtering "
+                               "(apply atlas_vector_index.json): %s", e)
+                self._prefilter = False
+
+        post_match = self._post_match(min_price, max_price, in_stock, category)
+        docs = self._run_vector_search(query_vector, top_k, top_k * NUM_CANDIDATES_MULTIPLIER,
+                                       post_match=post_match)
+        if post_match and len(docs) < top_k:
+            docs = self._run_vector_search(query_vector, top_k,
+                                           top_k * NUM_CANDIDATES_MULTIPLIER * CANDIDATE_RETRY_GROWTH,
+                                           post_match=post_match)
+        return docs
+
+    @staticmethod
+    def _vector_filter(min_price=None, max_price=None, in_stock=None, category=None) -> dict:
+        """MQL filter over the index's filter fields (price_double, stockQuantity, category_key)."""
+        clauses = []
+        if min_price is not None:
+            clauses.append({"price_double": {"$gte": float(min_price)}})
+        if max_price is not None:
+            clauses.append({"price_double": {"$lte": float(max_price)}})
+        if in_stock:
+            clauses.append({"stockQuantity": {"$gt": 0}})
+        if category:
+            clauses.append({"category_key": {"$eq": category_key(category)}})
+        if not clauses:
+            return {}
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    @staticmethod
+    def _post_match(min_price=None, max_price=None, in_stock=None, category=None) -> dict:
+        """Legacy $match applied after $project, for indexes without filter fields."""
+        match = {}
+        if min_price is not None or max_price is not None:
+            price_match = {}
+            if min_price is not None:
+                price_match["$gte"] = float(min_price)
+            if max_price is not None:
+                price_match["$lte"] = float(max_price)
+            match["price"] = price_match
+        if in_stock:
+            match["stockQuantity"] = {"$gt": 0}
+        if category:
+            exact = {"$regex": f"^{re.escape(category.strip())}$", "$options": "i"}
+            match["$or"] = [{"category": exact}, {"category.name": exact}]
+        return match
+
+    def _run_vector_search(self, query_vector: List[float], top_k: int, num_candidates: int,
+                           vector_filter: Optional[dict] = None,
+                           post_match: Optional[dict] = None) -> List[dict]:
+        num_candidates = max(top_k, min(num_candidates, MAX_NUM_CANDIDATES))
+        vector_search = {
+            "index": VECTOR_INDEX_NAME,
+            "path": "embedding",
+            "queryVector": query_vector,
+            "numCandidates": num_candidates,
+            # Pre-filtered results are final; post-filtering needs the whole pool
+            "limit": num_candidates if post_match else top_k,
+        }
+        if vector_filter:
+            vector_search["filter"] = vector_filter
 
-        # Build MongoDB aggregation pipeline
-        num_candidates = top_k * NUM_CANDIDATES_MULTIPLIER
         pipeline = [
-            {
-                "$vectorSearch": {
-                    "index": VECTOR_INDEX_NAME,
-                    "path": "embedding",
-                    "queryVector": query_vector,
-                    "numCandidates": num_candidates,
-                    "limit": num_candidates
-                }
-            },
+            {"$vectorSearch": vector_search},
             {
                 "$project": {
                     "_id": 1,
@@ -102,48 +342,158 @@ class SemanticSearchService:
             }
         ]
 
-        # Add price filter if specified
-        if min_price is not None or max_price is not None:
-            price_match = {}
-            if min_price is not None:
-                price_match["$gte"] = float(min_price)
-            if max_price is not None:
-                price_match["$lte"] = float(max_price)
-            pipeline.append({"$match": {"price": price_match}})
+        if post_match:
+            pipeline.append({"$match": post_match})
 
         # Limit results
         pipeline.append({"$limit": top_k})
 
-        # Execute pipeline
+        with span("mongo.vector_search", num_candidates=num_candidates,
+                  prefiltered=bool(vector_filter), post_filtered=bool(post_match)) as s:
+            with MONGO_AGGREGATION_SECONDS.time(kind="vector_search"):
+                docs = list(self.collection.aggregate(pipeline))
+            s.set(results=len(docs))
+            return docs
+
+    def _hybrid_retrieve(self, query: str, query_vector: List[float], top_k: int,
+                         **filters) -> List[dict]:
+        """Vector + BM25 candidates, merged with Reciprocal Rank Fusion."""
+        self._maybe_refresh_lexical()
+        depth = top_k * HYBRID_CANDIDATE_FACTOR
+        vector_docs  = self._retrieve(query_vector, depth, **filters)
+        with span("search.lexical", depth=depth):
+            lexical_docs = self.lexical_index.search(query, depth, **filters)
+        return reciprocal_rank_fusion([vector_docs, lexical_docs], top_k)
+
+    def _build_lexical(self, version: int) -> None:
         try:
-            raw_docs = list(self.collection.aggregate(pipeline))
+            self.lexical_index = LexicalIndex.from_collection(self.collection, version=version)
         except Exception as e:
-            logger.error(f"MongoDB aggregation error: {e}")
-            return SearchResponse(results=[], query=query, total=0)
+            logger.error(f"Lexical index build failed: {e}")
 
-        # Map to ProductResult objects
-        results = []
-        for doc in raw_docs:
+    def _maybe_refresh_lexical(self) -> None:
+        """Rebuild the BM25 index in the background when the catalog version moves."""
+        version = self.catalog_version.current()
+        if self.lexical_index is None or self.lexical_index.version == version:
+            return
+        if not self._lexical_lock.acquire(blocking=False):
+            return   # rebuild already running — keep serving the old index
+
+        def _rebuild():
             try:
-                results.append(ProductResult(
-                    id=str(doc.get("_id", "")),
-                    name=doc.get("name", ""),
-                    description=doc.get("description", ""),
-                    category=self._extract_category(doc.get("category")),
-                    price=float(doc.get("price", 0.0) or 0.0),
-                    brand=doc.get("brand", ""),
-                    rating=float(doc.get("rating", 0.0) or 0.0),
-                    reviewCount=int(doc.get("reviewCount", 0) or 0),
-                    imageUrl=doc.get("imageUrl", ""),
-                    stockQuantity=int(doc.get("stockQuantity", 0) or 0),
-                    score=round(float(doc.get("score", 0.0) or 0.0), 4)
-                ))
+                self._build_lexical(version)
+            finally:
+                self._lexical_lock.release()
+
+        threading.Thread(target=_rebuild, name="lexical-rebuild", daemon=True).start()
+
+    def _maybe_refresh_local(self) -> None:
+        """
+        Swap in a new local snapshot in the background: reload when the files
+        on disk were replaced (`python local_index.py build`), and with
+        SEARCH_BACKEND=local rebuild from Mongo when the catalog version moves.
+        """
+        index = self.local_index
+        if index is None:
+            return
+        version = self.catalog_version.current()
+        stamp    = LocalVectorIndex.snapshot_stamp(LOCAL_INDEX_PATH)
+        replaced = stamp not in (None, index.stamp)
+        rebuild = (SEARCH_BACKEND == "local" and LOCAL_INDEX_REBUILD_S > 0 and index.version != version
+                   and time.monotonic() - self._local_rebuilt_at >= LOCAL_INDEX_REBUILD_S)
+        if not (replaced or rebuild):
+            return
+        if not self._local_lock.acquire(blocking=False):
+            return   # reload already running — keep serving the old snapshot
+        if rebuild:
+            self._local_rebuilt_at = time.monotonic()
+
+        def _reload():
+            try:
+                if rebuild:
+                    LocalVectorIndex.build_snapshot(self.collection, LOCAL_INDEX_PATH)
+                self.local_index = LocalVectorIndex(LOCAL_INDEX_PATH, version=version)
             except Exception as e:
-                logger.warning(f"Failed to map product doc: {e}")
-                continue
+                index.stamp = stamp      # don't retry a broken snapshot until it is replaced again
+                logger.error(f"Local index reload failed: {e}")
+            finally:
+                self._local_lock.release()
 
-        logger.info(f"Search '{query}' → {len(results)} results")
-        return SearchResponse(results=results, query=query, total=len(results))
+        threading.Thread(target=_reload, name="local-index-reload", daemon=True).start()
+
+    def _load_local_index(self):
+        """Load (building first if missing) the local vector index snapshot."""
+        try:
+            if not LocalVectorIndex.exists(LOCAL_INDEX_PATH):
+                logger.info("No local index snapshot — building one from MongoDB...")
+                LocalVectorIndex.build_snapshot(self.collection, LOCAL_INDEX_PATH)
+            return LocalVectorIndex(LOCAL_INDEX_PATH)
+        except Exception as e:
+            logger.error(f"Local index unavailable: {e}")
+            return None
+
+    def embed_query(self, query: str) -> List[float]:
+        """Cached query embedding, for callers outside search (the agent's tool selector)."""
+        return self._encode_query(query)
+
+    def _encode_query(self, query: str) -> List[float]:
+        """Return the query embedding, served from the cache when possible."""
+        with span("search.encode") as s:
+            cache = self.embedding_cache
+            if cache is not None:
+                cached = cache.get(ENCODER_ID, query)
+                if cached is not None:
+                    s.set(cached=True)
+                    return cached.tolist()
+
+            with EMBED_ENCODE_SECONDS.time(mode="single"):
+                if self.batcher is not None:
+                    vector = self.batcher.encode(query)
+                else:
+                    vector = self.model.encode(query)
+            if cache is not None:
+                cache.put(ENCODER_ID, query, vector)
+            s.set(cached=False)
+            return vector.tolist()
+
+    def _encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embeddings for many queries: cache hits first, one encode() for the rest."""
+        cache = self.embedding_cache
+        vectors: dict = {}
+        if cache is not None:
+            for q in queries:
+                cached = cache.get(ENCODER_ID, q)
+                if cached is not None:
+                    vectors[q] = cached
+        missing = list(dict.fromkeys(q for q in queries if q not in vectors))
+        if missing:
+            with span("search.encode_batch", queries=len(queries), encoded=len(missing)), \
+                    EMBED_ENCODE_SECONDS.time(mode="batch"):
+                encoded = self.model.encode(missing, batch_size=len(missing), show_progress_bar=False)
+            for q, vector in zip(missing, encoded):
+                vectors[q] = vector
+                if cache is not None:
+                    cache.put(ENCODER_ID, q, vector)
+        return [vectors[q].tolist() for q in queries]
+
+    def cache_stats(self) -> dict:
+        """Embedding cache counters for /health."""
+        if self.embedding_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.embedding_cache.stats()}
+
+    def result_cache_stats(self) -> dict:
+        """Result cache counters + current catalog version for /health."""
+        if self.result_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, "catalog_version": self.catalog_version.current(),
+                **self.result_cache.stats()}
+
+    def batcher_stats(self) -> dict:
+        """Micro-batching counters for /health."""
+        if self.batcher is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.batcher.stats()}
 
     def _extract_category(self, category) -> str:
         """Extract category name from various formats."""
@@ -0,0 +1,231 @@
+"""
+session_cache.py
+Per-user session context for the agent loop, from one GET /ai/context call.
+
+A typical turn used to open with a Groq iteration that only called get_cart
+or get_default_address, followed by that backend round trip. Now:
+
+  - At the start of a turn the agent prefetches /ai/context (cart, default
+    address, recent orders) alongside its first Groq completion
+  - get_cart / get_default_address are answered from that snapshot while
+    it is fresh (a read that races the prefetch awaits it instead of issuing
+    its own request). get_orders always runs: the snapshot only carries the
+    last 5 orders, and the context's defaultAddress is only used when the
+    user really has one set (it falls back to the first address otherwise,
+    which GET /ai/addresses/default does not)
+  - Mutating tools invalidate the sections they change; a prefetch that
+    started before the mutation never writes its stale copy back
+  - On the next turn a fresh snapshot is also given to the model as a
+    system message, so it can skip those read tools entirely
+
+Keyed on the user id from orchestrator._derive_user_id(), and pinned to a
+fingerprint of the JWT that fetched it — a request carrying another user's
+id but a different token never sees their data. In-process and per-worker;
+SESSION_CACHE_TTL bounds how long a cart changed elsewhere (the web UI) can
+look stale to the agent.
+"""
+
+import os
+import copy
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SESSION_CACHE_ENABLED     = os.getenv("SESSION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SESSION_CACHE_TTL         = float(os.getenv("SESSION_CACHE_TTL", "60"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+SESSION_CONTEXT_IN_PROMPT = os.getenv("SESSION_CONTEXT_IN_PROMPT", "true").lower() in ("1", "true", "yes")
+
+# Read tool → /ai/context section that answers it
+READ_TOOLS = {
+    "get_cart":            "cart",
+    "get_default_address": "defaultAddress",
+}
+# Mutating tool → sections it makes stale
+INVALIDATES = {
+    "add_to_cart":      ("cart",),
+    "remove_from_cart": ("cart",),
+    "update_cart_item": ("cart",),
+    "place_order":      ("cart",),
+}
+
+SESSION_CONTEXT_HEADER = (
+    "SESSION CONTEXT (live account data for this user, JSON below). Use it instead of "
+    "calling get_cart / get_default_address; call tools for anything else.\n"
+)
+
+
+def token_fingerprint(api_client) -> str:
+    auth = (getattr(api_client, "headers", None) or {}).get("Authorization", "")
+    return hashlib.sha256(auth.encode("utf-8")).hexdigest()[:32]
+
+
+def _usable(section: str, value: Any) -> bool:
+    """Whether a /ai/context section answers its read tool exactly."""
+    if value is None:
+        return False
+    if section == "defaultAddress":
+        # /ai/context falls back to the first address; the tool does not
+        return isinstance(value, dict) and bool(value.get("isDefault"))
+    return True
+
+
+class _Session:
+    __slots__ = ("fingerprint", "sections", "fetched_at", "epoch", "pending")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.sections:   Dict[str, Any]   = {}
+        self.fetched_at: Dict[str, float] = {}
+        self.epoch   = 0                        # bumped by every invalidation
+        self.pending: Optional[asyncio.Task] = None
+
+
+class SessionContextCache:
+    """
+    LRU of per-user context snapshots. Used only from the event loop
+    (prefetches are tasks, not threads), so no lock is needed.
+    """
+
+    def __init__(self, ttl_seconds: float = SESSION_CACHE_TTL,
+                 max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+
+        self.hits            = 0
+        self.misses          = 0
+        self.coalesced       = 0
+        self.prefetches      = 0
+        self.prefetch_errors = 0
+        self.invalidations   = 0
+        self.evictions       = 0
+        self.expirations     = 0
+
+    def view(self, user_id: str, api_client) -> "SessionView":
+        return SessionView(self, user_id, api_client)
+
+    # ── Internal ─────────────────────────────────────────────────────────────
+
+    def _session(self, user_id: str, fingerprint: str) -> _Session:
+        session = self._sessions.get(user_id)
+        if session is None or session.fingerprint != fingerprint:
+            session = self._sessions[user_id] = _Session(fingerprint)
+        self._sessions.move_to_end(user_id)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+        return session
+
+    def _fresh(self, session: _Session, section: str) -> bool:
+        fetched = session.fetched_at.get(section)
+        if fetched is None:
+            return False
+        if time.monotonic() - fetched < self.ttl_seconds:
+            return True
+        session.sections.pop(section, None)
+        session.fetched_at.pop(section, None)
+        self.expirations += 1
+        return False
+
+    def _store(self, session: _Session, section: str, data: Any) -> None:
+        session.sections[section]   = data
+        session.fetched_at[section] = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled":         True,
+            "entries":         len(self._sessions),
+            "ttl_s":           self.ttl_seconds,
+            "hits":            self.hits,
+            "misses":          self.misses,
+            "coalesced":       self.coalesced,
+            "hit_rate":        round(self.hits / lookups, 4) if lookups else 0.0,
+            "prefetches":      self.prefetches,
+            "prefetch_errors": self.prefetch_errors,
+            "invalidations":   self.invalidations,
+            "evictions":       self.evictions,
+            "expirations":     self.expirations,
+        }
+
+
+class SessionView:
+    """One turn's handle on a user's session (user id + the turn's APIClient)."""
+
+    def __init__(self, cache: SessionContextCache, user_id: str, api_client):
+        self._cache      = cache
+        self._user_id    = user_id
+        self._api_client = api_client
+        self._session    = cache._session(user_id, token_fingerprint(api_client))
+
+    def context(self) -> Optional[Dict[str, Any]]:
+        """Fresh sections from earlier turns (for the prompt), or None."""
+        fresh = {section: self._session.sections[section] for section in READ_TOOLS.values()
+                 if self._cache._fresh(self._session, section)}
+        return fresh or None
+
+    def prefetch(self) -> None:
+        """Start GET /ai/context in the background unless every section is fresh."""
+        session = self._session
+        if session.pending is not None and not session.pending.done():
+            return
+        if all(self._cache._fresh(session, section) for section in READ_TOOLS.values()):
+            return
+        self._cache.prefetches += 1
+        session.pending = asyncio.create_task(self._fetch(session.epoch))
+
+    async def _fetch(self, epoch: int) -> None:
+        with span("session.prefetch"):
+            try:
+                result = await self._api_client.get_context()
+            except Exception as e:
+                result = {"success": False, "message": str(e)}
+        data = result.get("data") if isinstance(result, dict) and result.get("success") else None
+        if not isinstance(data, dict):
+            self._cache.prefetch_errors += 1
+            logger.warning("Session prefetch failed user=%s: %s", self._user_id[-8:],
+                           str((result or {}).get("message", ""))[:120])
+            return
+        if epoch != self._session.epoch:
+            return      # a mutation happened meanwhile — this snapshot may predate it
+        for section in READ_TOOLS.values():
+            if _usable(section, data.get(section)):
+                self._cache._store(self._session, section, data[section])
+
+    async def read(self, tool: str) -> Optional[dict]:
+        """Tool result from the snapshot, or None when the tool must really run."""
+        section = READ_TOOLS.get(tool)
+        if section is None:
+            return None
+        session = self._session
+        if not self._cache._fresh(session, section) and session.pending is not None and not session.pending.done():
+            self._cache.coalesced += 1
+            await asyncio.shield(session.pending)
+        if not self._cache._fresh(session, section):
+            self._cache.misses += 1
+            return None
+        self._cache.hits += 1
+        return {"success": True, "message": "from session context",
+                "data": copy.deepcopy(session.sections[section])}
+
+    def record(self, tool: str, result: dict) -> None:
+        """After a real tool call: keep successful reads, invalidate on mutations."""
+        if tool in INVALIDATES:
+            self._session.epoch += 1
+            self._cache.invalidations += 1
+            for section in INVALIDATES[tool]:
+                self._session.sections.pop(section, None)
+                self._session.fetched_at.pop(section, None)
+            return
+        section = READ_TOOLS.get(tool)
+        if section and isinstance(result, dict) and result.get("success") and result.get("data") is not None:
+            self._cache._store(self._session, section, copy.deepcopy(result["data"]))
@@ -0,0 +1,10 @@
+"""
+conftest.py
+Make the agent's top-level modules importable from tests/ (they are not a package).
+Run from ai_agent/:  python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,111 @@
+"""
+test_embedding_watcher.py
+EmbeddingWatcher.process_changes() driven with hand-built change events
+against an in-process Mongo stand-in (mongomock) — no replica set needed.
+"""
+
+import numpy as np
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from embedding_watcher import EmbeddingWatcher  # noqa: E402
+from search_cache import CATALOG_META_COLLECTION, CATALOG_META_ID  # noqa: E402
+
+DIM = 8
+
+
+class RecordingEncoder:
+    """encode() stand-in that remembers every batch it was given."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return np.ones((len(texts), DIM), dtype=np.float32)
+
+
+def _product(i: int) -> dict:
+    return {"_id": i, "name": f"Phone {i}", "brand": "Acme", "description": "A phone",
+            "category": {"name": "Smartphones"}, "price": 10000 + i, "stockQuantity": 5}
+
+
+def _update(doc_id, **fields) -> dict:
+    return {"operationType": "update", "documentKey": {"_id": doc_id},
+            "updateDescription": {"updatedFields": fields, "removedFields": []}}
+
+
+def _event(op: str, doc_id) -> dict:
+    return {"operationType": op, "documentKey": {"_id": doc_id}}
+
+
+@pytest.fixture
+def collection():
+    coll = mongomock.MongoClient()["ECommerceDB"]["products"]
+    coll.insert_many([_product(i) for i in range(1, 6)])
+    return coll
+
+
+@pytest.fixture
+def encoder():
+    return RecordingEncoder()
+
+
+@pytest.fixture
+def watcher(collection, encoder):
+    return EmbeddingWatcher(collection, encoder, resume_path=None)
+
+
+def _catalog_version(collection) -> int:
+    doc = collection.database[CATALOG_META_COLLECTION].find_one({"_id": CATALOG_META_ID})
+    return int((doc or {}).get("version", 0))
+
+
+def test_affected_docs_reembedded_in_one_batch(watcher, collection, encoder):
+    result = watcher.process_changes([
+        _event("insert", 1),
+        _update(2, name="Phone 2 Pro"),
+        _event("replace", 3),
+        _update(2, description="Now with a better camera"),   # same doc again: embedded once
+        _event("delete", 4),
+    ])
+
+    assert len(encoder.batches) == 1
+    assert len(encoder.batches[0]) == 3
+    assert result["embedded"] == 3
+    for doc_id in (1, 2, 3):
+        assert collection.find_one({"_id": doc_id}).get("embedding")
+    assert "embedding" not in collection.find_one({"_id": 5})
+    assert _catalog_version(collection) == 1
+
+
+def test_own_embedding_writes_are_ignored(watcher, collection, encoder):
+    result = watcher.process_changes([
+        _update(1, embedding=[0.0] * DIM, embeddingHash="abc"),
+        _update(2, embedding=[0.0] * DIM, price_double=10002.0, category_key="smartphones"),
+    ])
+
+    assert encoder.batches == []
+    assert result["embedded"] == 0
+    assert watcher.events_relevant == 0
+    assert _catalog_version(collection) == 0      # nothing changed for search either
+
+
+def test_updates_outside_source_fields_are_skipped(watcher, collection, encoder):
+    result = watcher.process_changes([
+        _update(1, stockQuantity=0),
+        _update(2, **{"reviews.0.rating": 5}),
+    ])
+
+    assert encoder.batches == []
+    assert result["embedded"] == 0
+    assert watcher.events_seen == 2 and watcher.events_relevant == 0
+    assert _catalog_version(collection) == 1      # stock changes still invalidate cached results
+
+
+def test_nested_source_field_update_counts(watcher, encoder):
+    watcher.process_changes([_update(1, **{"specifications.color": "Blue"})])
+
+    assert len(encoder.batches) == 1
+    assert len(encoder.batches[0]) == 1
@@ -0,0 +1,73 @@
+"""
+test_encoder_parity.py
+ONNX encoders must stay interchangeable with the torch reference: every
+vector of a fixed sentence set has cosine >= 0.99 against torch.
+
+Skipped when onnxruntime / sentence-transformers are not installed or the
+model files aren't available locally (EMBED_ONNX_DIR, or the Hugging Face
+cache) — the test never downloads anything.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+import encoders  # noqa: E402
+
+MIN_COSINE = 0.99
+
+SENTENCES = [
+    "iphone 15 pro 256gb",
+    "cheap laptop under 40000",
+    "wireless earbuds with anc",
+    "samsung 55 inch 4k tv",
+    "noise cancelling headphones sony",
+    "Apple iPhone 15 Pro. Brand: Apple. Category: Smartphones. 6.1-inch Super Retina XDR "
+    "display, A17 Pro chip, titanium design, 48MP main camera. Price: 134900.",
+    "Prestige mixer grinder 750W with three stainless steel jars, overload protection "
+    "and a two-year warranty. Category: Kitchen Appliances.",
+    "Kids school bag, waterproof, 25 litres, padded straps",
+]
+
+
+def _available(local_name: str, hub_name: str) -> bool:
+    if encoders.ONNX_DIR:
+        return os.path.exists(os.path.join(encoders.ONNX_DIR, local_name))
+    try:
+        from huggingface_hub import hf_hub_download
+        hf_hub_download(encoders.HF_REPO, hub_name, local_files_only=True)
+    except Exception:
+        return False
+    return True
+
+
+def _encoder(backend: str):
+    if backend == "torch":
+        pytest.importorskip("sentence_transformers")
+        if not _available("config.json", "config.json"):
+            pytest.skip("torch model files not cached locally")
+    elif not (_available(encoders._LOCAL_FILES[backend], encoders._HUB_FILES[backend])
+              and _available("tokenizer.json", "tokenizer.json")):
+        pytest.skip(f"{backend} model files not available locally")
+    return encoders.get_encoder(backend)
+
+
+@pytest.fixture(scope="module")
+def reference() -> np.ndarray:
+    vectors = np.asarray(_encoder("torch").encode(SENTENCES, batch_size=8), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_matches_torch(backend, reference):
+    vectors = np.asarray(_encoder(backend).encode(SENTENCES, batch_size=8), dtype=np.float32)
+    assert vectors.shape == reference.shape
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    cosines = (vectors * reference).sum(axis=1)
+    worst = int(np.argmin(cosines))
+    assert cosines[worst] >= MIN_COSINE, (
+        f"{backend}: cosine {cosines[worst]:.4f} < {MIN_COSINE} for {SENTENCES[worst]!r}")
@@ -0,0 +1,180 @@
+"""
+tool_selector.py
+Per-turn subset of the agent's tool schemas.
+
+All ten TOOLS definitions used to go out with every Groq completion, even
+for "show me earbuds under 3000" — on llama-3.1-8b-instant the schemas are
+about a third of a typical prompt. Now each turn sends only the tools the
+message is about:
+
+  - The user message is embedded with the search service's MiniLM model
+    (through its embedding cache) and scored against every tool's
+    description plus a few example requests; the TOOL_SELECT_TOP_K best
+    over TOOL_SELECT_MIN_SCORE are kept
+  - Tools those depend on come along (add_to_cart needs search_products
+    for an id, place_order needs get_cart + get_default_address, ...), as
+    do TOOL_SELECT_ALWAYS and every tool already used this turn
+  - Low confidence (nothing over the threshold) or no encoder yet → all
+    tools, as before
+  - If the model still asks for a tool that wasn't sent, the agent widens
+    the turn to the full set and retries (expand())
+
+Tools keep their TOOLS order, so the schema prefix stays stable between
+turns. stats(): share of turns subsetted, mean tools selected, how often
+a turn was widened or expanded.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TOOL_SELECT_ENABLED   = os.getenv("TOOL_SELECT_ENABLED", "true").lower() in ("1", "true", "yes")
+TOOL_SELECT_TOP_K     = int(os.getenv("TOOL_SELECT_TOP_K", "3"))
+TOOL_SELECT_MIN_SCORE = float(os.getenv("TOOL_SELECT_MIN_SCORE", "0.3"))
+TOOL_SELECT_ALWAYS    = {t.strip() for t in os.getenv("TOOL_SELECT_ALWAYS", "search_products").split(",")
+                         if t.strip()}
+
+# Example requests per tool, embedded alongside its description
+TOOL_EXAMPLES: Dict[str, Sequence[str]] = {
+    "search_products":     ("show me wireless earbuds under 3000", "find a gaming laptop",
+                            "I need running shoes", "suggest a good phone"),
+    "get_cart":            ("what's in my cart", "show my cart", "how much is my cart total"),
+    "add_to_cart":         ("add this to my cart", "add two of those to the cart", "I'll take the first one"),
+    "remove_from_cart":    ("remove the mouse from my cart", "delete that item from the cart"),
+    "update_cart_item":    ("change the quantity to 3", "make it two instead of one"),
+    "get_default_address": ("where will it be delivered", "what is my shipping address"),
+    "place_order":         ("place my order", "checkout now", "buy everything in my cart"),
+    "get_orders":          ("show my orders", "where is my order", "my order history"),
+    "cancel_order":        ("cancel my last order", "I don't want that order anymore"),
+    "compare_products":    ("compare these two phones", "which one is better", "difference between them"),
+}
+
+# Tool → tools the model usually needs first
+REQUIRES: Dict[str, Sequence[str]] = {
+    "add_to_cart":      ("search_products",),
+    "compare_products": ("search_products",),
+    "remove_from_cart": ("get_cart",),
+    "update_cart_item": ("get_cart",),
+    "place_order":      ("get_cart", "get_default_address"),
+    "cancel_order":     ("get_orders",),
+}
+
+
+class ToolSelection:
+    """One turn's tool subset; grows with the tools the model uses or asks for."""
+
+    def __init__(self, tools: List[dict], names: Optional[Iterable[str]], selector: "ToolSelector"):
+        self._all      = tools
+        self._selector = selector
+        self.names     = None if names is None else set(names)     # None → every tool
+
+    def tools(self) -> List[dict]:
+        if self.names is None:
+            return self._all
+        return [t for t in self._all if t["function"]["name"] in self.names]
+
+    def use(self, names: Iterable[str]) -> None:
+        """Keep tools the model called (a lenient provider may call one we didn't send)."""
+        if self.names is None:
+            return
+        missing = set(names) - self.names
+        if missing:
+            self.names |= _with_requirements(missing)
+            self._selector.widened += 1
+
+    def expand(self) -> bool:
+        """Send every tool from now on; False if that was already the case."""
+        if self.names is None:
+            return False
+        self.names = None
+        self._selector.expansions += 1
+        return True
+
+
+def _with_requirements(names: Iterable[str]) -> set:
+    out = set(names)
+    for name in list(out):
+        out.update(REQUIRES.get(name, ()))
+    return out
+
+
+class ToolSelector:
+    def __init__(self, tools: List[dict], top_k: int = TOOL_SELECT_TOP_K,
+                 min_score: float = TOOL_SELECT_MIN_SCORE, always: Iterable[str] = TOOL_SELECT_ALWAYS):
+        self.tools     = tools
+        self.top_k     = top_k
+        self.min_score = min_score
+        self.always    = {a for a in always if a in {t["function"]["name"] for t in tools}}
+        self._model    = None
+        self._embed_query: Optional[Callable[[str], Any]] = None
+        self._matrix: Optional[np.ndarray] = None      # [texts, D], rows L2-normalised
+        self._owners: List[str] = []                   # tool name per matrix row
+
+        self.turns      = 0
+        self.subsetted  = 0
+        self.tools_selected = 0
+        self.widened    = 0
+        self.expansions = 0
+
+    def set_encoder(self, model, embed_query: Callable[[str], Any]) -> None:
+        """model.encode() for the tool texts; embed_query(text) for messages (cached)."""
+        self._model, self._embed_query = model, embed_query
+        self._matrix = None
+
+    def _index(self) -> None:
+        texts, owners = [], []
+        for tool in self.tools:
+            fn = tool["function"]
+            for text in (f"{fn['name'].replace('_', ' ')}: {fn.get('description', '')}",
+                         *TOOL_EXAMPLES.get(fn["name"], ())):
+                texts.append(text)
+                owners.append(fn["name"])
+        matrix = np.asarray(self._model.encode(texts, batch_size=len(texts), show_progress_bar=False),
+                            dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self._matrix, self._owners = matrix, owners
+
+    def _scores(self, text: str) -> Dict[str, float]:
+        if self._matrix is None:
+            self._index()
+        query = np.asarray(self._embed_query(text), dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores: Dict[str, float] = {}
+        for owner, score in zip(self._owners, self._matrix @ query):
+            scores[owner] = max(scores.get(owner, -1.0), float(score))
+        return scores
+
+    async def select(self, text: str) -> ToolSelection:
+        self.turns += 1
+        names = None
+        if self._model is not None:
+            try:
+                scores = await asyncio.to_thread(self._scores, text)
+                ranked = [n for n, s in sorted(scores.items(), key=lambda kv: -kv[1]) if s >= self.min_score]
+                if ranked:
+                    names = _with_requirements(ranked[:self.top_k]) | self.always
+            except Exception as e:
+                logger.warning("Tool selection failed, sending all tools: %s", e)
+        selection = ToolSelection(self.tools, names, self)
+        if names is not None and len(names) < len(self.tools):
+            self.subsetted += 1
+        self.tools_selected += len(selection.tools())
+        return selection
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled":         True,
+            "encoder":         self._model is not None,
+            "turns":           self.turns,
+            "subset_share":    round(self.subsetted / self.turns, 4) if self.turns else 0.0,
+            "mean_tools_selected": round(self.tools_selected / self.turns, 2) if self.turns else 0.0,
+            "of_tools":        len(self.tools),
+            "widened":         self.widened,
+            "expansions":      self.expansions,
+        }
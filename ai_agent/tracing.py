@@ -0,0 +1,278 @@
+"""
+tracing.py
+Lightweight span tracing for the agent loop, exported as OpenTelemetry
+(OTLP/JSON) without requiring the OpenTelemetry SDK.
+
+    with start_trace("chat", collect=request.debug) as trace:
+        with span("groq.chat_completion", model=LLM_MODEL) as s:
+            ...
+            s.set(prompt_tokens=123)
+        trace.breakdown()     # per-request timing table for ChatResponse
+
+  - The current trace / span live in contextvars, so nesting follows
+    `await`, asyncio.gather() tasks and asyncio.to_thread() automatically
+  - span() is a no-op when no trace is active (tracing off, no debug flag)
+  - Finished traces go to a background exporter thread:
+        TRACING_EXPORTER=file   → one OTLP ExportTraceServiceRequest JSON per line
+        TRACING_EXPORTER=otlp   → POST to a collector's /v1/traces (OTLP/HTTP JSON)
+    so a local otel-collector / Jaeger / Tempo can ingest them as-is
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRACING_EXPORTER      = os.getenv("TRACING_EXPORTER", "none").lower()   # none | file | otlp
+TRACING_FILE          = os.getenv("TRACING_FILE", "traces.otlp.jsonl")
+TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACING_SERVICE_NAME  = os.getenv("TRACING_SERVICE_NAME", "shopai-agent")
+TRACING_ALLOW_DEBUG   = os.getenv("TRACING_ALLOW_DEBUG", "false").lower() in ("1", "true", "yes")
+TRACING_FLUSH_SECONDS = float(os.getenv("TRACING_FLUSH_S", "2"))
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT   = 3
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("shopai_trace", default=None)
+_current_span:  contextvars.ContextVar = contextvars.ContextVar("shopai_span", default=None)
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Spans / traces
+# ─────────────────────────────────────────────────────────────────────────────
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "kind", "start_ns", "end_ns",
+                 "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], kind: int, attributes: dict):
+        self.name       = name
+        self.span_id    = _new_id(8)
+        self.parent_id  = parent_id
+        self.kind       = kind
+        self.start_ns   = time.time_ns()
+        self.end_ns     = 0
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.error: Optional[str] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Returned by span() when nothing is being traced."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    """All spans of one request. Thread-safe: spans may finish in worker threads."""
+
+    def __init__(self, name: str, export: bool):
+        self.trace_id = _new_id(16)
+        self.export   = export
+        self.root     = Span(name, None, SPAN_KIND_INTERNAL, {})
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, s: Span) -> None:
+        with self._lock:
+            self.spans.append(s)
+
+    def breakdown(self) -> Dict[str, Any]:
+        """Timing table for ChatResponse.timings (offsets relative to the root span)."""
+        end_ns = self.root.end_ns or time.time_ns()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        by_name: Dict[str, float] = {}
+        for s in spans:
+            by_name[s.name] = round(by_name.get(s.name, 0.0) + s.duration_ms, 3)
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round((end_ns - self.root.start_ns) / 1e6, 3),
+            "by_name":  by_name,
+            "spans": [
+                {
+                    "name":        s.name,
+                    "start_ms":    round((s.start_ns - self.root.start_ns) / 1e6, 3),
+                    "duration_ms": round(s.duration_ms, 3),
+                    "parent":      s.parent_id if s.parent_id != self.root.span_id else None,
+                    "span_id":     s.span_id,
+                    **({"attributes": s.attributes} if s.attributes else {}),
+                    **({"error": s.error} if s.error else {}),
+                }
+                for s in spans
+            ],
+        }
+
+
+@contextmanager
+def start_trace(name: str, collect: bool = False) -> Iterator[Optional[Trace]]:
+    """
+    Open a request-level trace. Active when an exporter is configured or the
+    caller asks to collect timings (`collect`, e.g. ChatRequest.debug);
+    otherwise yields None and every span() inside is free.
+    """
+    export = TRACING_EXPORTER in ("file", "otlp")
+    collect = collect and TRACING_ALLOW_DEBUG
+    if not (export or collect):
+        yield None
+        return
+
+    trace = Trace(name, export)
+    t_token = _current_trace.set(trace)
+    s_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = repr(e)
+        raise
+    finally:
+        trace.root.end_ns = time.time_ns()
+        _current_span.reset(s_token)
+        _current_trace.reset(t_token)
+        if export:
+            _exporter().submit(trace)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> Iterator[Any]:
+    """Time a block as a child of the current span. No-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP
+        return
+    parent = _current_span.get()
+    s = Span(name, parent.span_id if parent else trace.root.span_id, kind, attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = repr(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace.add(s)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# OTLP/JSON encoding + export
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _otlp_value(value) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(trace: Trace, s: Span) -> Dict[str, Any]:
+    out = {
+        "traceId":           trace.trace_id,
+        "spanId":            s.span_id,
+        "name":              s.name,
+        "kind":              s.kind,
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano":   str(s.end_ns),
+        "attributes":        [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status":            {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    """Encode finished traces as one OTLP ExportTraceServiceRequest (JSON mapping)."""
+    spans = [_otlp_span(t, s) for t in traces for s in [t.root, *t.spans]]
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": TRACING_SERVICE_NAME}},
+            ]},
+            "scopeSpans": [{"scope": {"name": "shopai.tracing"}, "spans": spans}],
+        }]
+    }
+
+
+class _Exporter:
+    """Background thread that batches finished traces to a file or a collector."""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.exported = 0
+        self.errors   = 0
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=10000)
+        threading.Thread(target=self._loop, name="trace-exporter", daemon=True).start()
+        logger.info("Tracing → %s", TRACING_FILE if mode == "file" else TRACING_OTLP_ENDPOINT)
+
+    def submit(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.errors += 1   # never block a request on telemetry
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TRACING_FLUSH_SECONDS
+            while len(batch) < 512 and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(to_otlp(batch))
+                self.exported += len(batch)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Trace export failed (%d traces dropped): %s", len(batch), e)
+
+    def _write(self, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, separators=(",", ":"))
+        if self.mode == "file":
+            with open(TRACING_FILE, "a", encoding="utf-8") as f:
+                f.write(body + "\n")
+            return
+        from urllib.request import Request, urlopen
+        req = Request(TRACING_OTLP_ENDPOINT, data=body.encode("utf-8"),
+                      headers={"Content-Type": "application/json"}, method="POST")
+        with urlopen(req, timeout=5) as resp:
+            resp.read()
+
+
+_exporter_instance: Optional[_Exporter] = None
+_exporter_lock = threading.Lock()
+
+
+def _exporter() -> _Exporter:
+    global _exporter_instance
+    if _exporter_instance is None:
+        with _exporter_lock:
+            if _exporter_instance is None:
+                _exporter_instance = _Exporter(TRACING_EXPORTER)
+    return _exporter_instance
@@ -15,6 +15,12 @@ namespace ECommerceAPI.Infrastructure.Repositories.Implementations
     {
         private readonly IMongoCollection<ProductMongo> _products;
 
+        // Catalog version read by the AI agent's search result cache (ai_agent/search_cache.py);
+        // bumped on every product write so cached search results never outlive an edit.
+        private const string CatalogMetaCollectionName = "catalog_meta";
+        private const string CatalogMetaId = "products";
+        private readonly IMongoCollection<BsonDocument> _catalogMeta;
+
         public ProductMongoRepository(
             IOptions<MongoDbSettings> settings,
             IMongoClient mongoClient)
@@ -22,6 +28,7 @@ namespace ECommerceAPI.Infrastructure.Repositories.Implementations
             var database = mongoClient.GetDatabase(settings.Value.DatabaseName);
             _products = database.GetCollection<ProductMongo>(
                 settings.Value.ProductsCollectionName);
+            _catalogMeta = database.GetCollection<BsonDocument>(CatalogMetaCollectionName);
             
             // Register class maps for proper BSON serialization
             RegisterClassMaps();
@@ -95,6 +102,24 @@ namespace ECommerceAPI.Infrastructure.Repositories.Implementations
             }
         }
 
+        private async Task BumpCatalogVersionAsync()
+        {
+            try
+            {
+                await _catalogMeta.UpdateOneAsync(
+                    Builders<BsonDocument>.Filter.Eq("_id", CatalogMetaId),
+                    Builders<BsonDocument>.Update
+                        .Inc("version", 1)
+                        .CurrentDate("updatedAt"),
+                    new UpdateOptions { IsUpsert = true });
+            }
+            catch (Exception ex)
+            {
+                // The product write already succeeded; stale AI search results expire via SEARCH_CACHE_TTL
+                Console.WriteLine($"⚠️ Warning: Could not bump catalog version: {ex.Message}");
+            }
+        }
+
         private static FilterDefinition<ProductMongo> ActiveProductsFilter()
         {
             var builder = Builders<ProductMongo>.Filter;
@@ -277,6 +302,7 @@ namespace ECommerceAPI.Infrastructure.Repositories.Implementations
                 product.IsActive = true;
                 
                 await _products.InsertOneAsync(product);
+                await BumpCatalogVersionAsync();
                 
                 Console.WriteLine($"✅ Product added successfully with ID: {product.Id}");
                 
@@ -305,6 +331,7 @@ namespace ECommerceAPI.Infrastructure.Repositories.Implementations
                 
                 if (success)
                 {
+                    await BumpCatalogVersionAsync();
                     Console.WriteLine($"✅ Product updated successfully");
                 }
                 else
@@ -340,6 +367,7 @@ namespace ECommerceAPI.Infrastructure.Repositories.Implementations
                 
                 if (success)
                 {
+                    await BumpCatalogVersionAsync();
                     Console.WriteLine($"✅ Product soft-deleted successfully");
                 }
                 else